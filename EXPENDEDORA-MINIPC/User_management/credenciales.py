@@ -0,0 +1,190 @@
+# credenciales.py - Verificación de contraseñas con caché local
+#
+# Las contraseñas se guardan como "pbkdf2_sha256$iteraciones$sal$hash"
+# (PBKDF2-HMAC-SHA256 con sal aleatoria por usuario), en MySQL y en la tabla
+# credenciales de expendedora.db. La caché local tiene solo esos hashes y se
+# sincroniza con MySQL en un hilo de fondo, así el login se verifica en la
+# mini PC en un tiempo acotado aunque MySQL esté lento o caído. MySQL se
+# consulta solo si el usuario no está en la caché o la contraseña no
+# coincide (puede haber cambiado desde la última sincronización).
+#
+# Las filas viejas de employees en texto plano se siguen aceptando, y en la
+# caché local quedan hasheadas, pero ni el login ni la sincronización
+# reescriben MySQL: la migración es un paso explícito del administrador
+# (python3 -m User_management.credenciales --migrar).
+#
+# Verificar cuesta ITERACIONES de PBKDF2 y puede esperar a MySQL hasta su
+# timeout: las ventanas de login y registro llaman a autenticar() y
+# registrar() desde LlamadasEnSegundoPlano, nunca desde el hilo de Tk.
+
+import hashlib
+import hmac
+import os
+import sqlite3
+import threading
+import time
+
+from . import database
+
+ALGORITMO = "pbkdf2_sha256"
+ITERACIONES = 150000
+CACHE_DB = "expendedora.db"
+INTERVALO_SINCRONIZACION = 300  # Segundos entre sincronizaciones con MySQL
+
+
+class SinConexion(Exception):
+    # MySQL no respondió y la caché no alcanza para decidir
+    pass
+
+
+# --- HASH ---
+def generar_hash(contrasena, iteraciones=ITERACIONES):
+    sal = os.urandom(16)
+    digest = hashlib.pbkdf2_hmac("sha256", contrasena.encode("utf-8"), sal, iteraciones)
+    return f"{ALGORITMO}${iteraciones}${sal.hex()}${digest.hex()}"
+
+def es_hash(guardado):
+    return guardado.startswith(ALGORITMO + "$")
+
+def verificar_hash(contrasena, guardado):
+    if not es_hash(guardado):
+        # Fila vieja en texto plano, hasta que se migre
+        return hmac.compare_digest(contrasena.encode("utf-8"), guardado.encode("utf-8"))
+    try:
+        _, iteraciones, sal, digest = guardado.split("$")
+        calculado = hashlib.pbkdf2_hmac("sha256", contrasena.encode("utf-8"),
+                                        bytes.fromhex(sal), int(iteraciones))
+    except ValueError:
+        return False
+    return hmac.compare_digest(calculado.hex(), digest)
+
+
+# --- CACHÉ LOCAL ---
+class CacheCredenciales:
+    def __init__(self, db_file=CACHE_DB):
+        self._lock = threading.Lock()
+        # La conexión se comparte entre hilos, siempre bajo self._lock
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS credenciales (
+            nombre TEXT PRIMARY KEY, hash TEXT NOT NULL, actualizado REAL NOT NULL)''')
+        self._conn.commit()
+
+    def obtener(self, nombre):
+        with self._lock:
+            fila = self._conn.execute("SELECT hash FROM credenciales WHERE nombre = ?", (nombre,)).fetchone()
+        return fila[0] if fila else None
+
+    def guardar(self, nombre, hash_contrasena):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO credenciales VALUES (?, ?, ?)",
+                               (nombre, hash_contrasena, time.time()))
+
+    def reemplazar(self, usuarios):
+        # Deja exactamente los usuarios de MySQL (los borrados pierden acceso)
+        ahora = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM credenciales")
+            self._conn.executemany("INSERT INTO credenciales VALUES (?, ?, ?)",
+                                   [(nombre, hash_contrasena, ahora) for nombre, hash_contrasena in usuarios])
+
+
+_cache = None
+_cache_lock = threading.Lock()
+_hilo_sincronizacion = None
+
+def obtener_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CacheCredenciales()
+        return _cache
+
+
+# --- LOGIN Y REGISTRO ---
+def autenticar(nombre, contrasena):
+    # True/False; SinConexion si hace falta MySQL y no responde
+    cache = obtener_cache()
+    en_cache = cache.obtener(nombre)
+    if en_cache and verificar_hash(contrasena, en_cache):
+        return True
+
+    try:
+        guardado = database.get_hash(nombre)
+    except Exception as e:
+        if en_cache is None:
+            raise SinConexion(f"No se pudo consultar el usuario: {e}")
+        return False  # Usuario conocido y contraseña incorrecta
+    if guardado is None or not verificar_hash(contrasena, guardado):
+        return False
+
+    if not es_hash(guardado):
+        guardado = generar_hash(contrasena)  # Solo para la caché local; MySQL no se toca
+    cache.guardar(nombre, guardado)
+    return True
+
+def registrar(nombre, contrasena):
+    # False si el usuario ya existe; el alta necesita MySQL
+    guardado = generar_hash(contrasena)
+    try:
+        creado = database.add_user(nombre, guardado)
+    except Exception as e:
+        raise SinConexion(f"No se pudo registrar el usuario: {e}")
+    if creado:
+        obtener_cache().guardar(nombre, guardado)
+    return creado
+
+
+# --- SINCRONIZACIÓN ---
+def sincronizar():
+    # Trae todos los empleados de MySQL a la caché (solo lee MySQL). Una fila
+    # en texto plano entra a la caché hasheada, nunca como está.
+    usuarios = [(nombre, guardado if es_hash(guardado) else generar_hash(guardado))
+                for nombre, guardado in database.get_users()]
+    obtener_cache().reemplazar(usuarios)
+    return len(usuarios)
+
+def migrar_texto_plano():
+    # Reemplaza en MySQL las contraseñas en texto plano por su hash. Se corre
+    # a mano: una vez migradas, las versiones viejas del kiosko que comparan
+    # texto plano dejan de aceptar a esos empleados.
+    migrados = []
+    for nombre, guardado in database.get_users():
+        if not es_hash(guardado):
+            database.update_hash(nombre, generar_hash(guardado))
+            migrados.append(nombre)
+    return migrados
+
+def _bucle_sincronizacion(intervalo):
+    try:
+        database.create_table()  # Crear la tabla de usuarios si no existe
+    except Exception as e:
+        print(f"No se pudo verificar la tabla de usuarios: {e}")
+    while True:
+        try:
+            sincronizar()
+        except Exception as e:
+            print(f"No se pudo sincronizar la caché de usuarios: {e}")
+        time.sleep(intervalo)
+
+def iniciar_sincronizacion(intervalo=INTERVALO_SINCRONIZACION):
+    # Una sola vez por proceso: los cierres de sesión no la relanzan
+    global _hilo_sincronizacion
+    with _cache_lock:
+        if _hilo_sincronizacion is None:
+            _hilo_sincronizacion = threading.Thread(target=_bucle_sincronizacion, args=(intervalo,), daemon=True)
+            _hilo_sincronizacion.start()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Credenciales de los empleados")
+    parser.add_argument("--migrar", action="store_true",
+                        help="Reemplazar en MySQL las contraseñas en texto plano por su hash")
+    args = parser.parse_args()
+    if args.migrar:
+        migrados = migrar_texto_plano()
+        print(f"Contraseñas migradas: {len(migrados)} {', '.join(migrados)}")
+    else:
+        parser.print_help()
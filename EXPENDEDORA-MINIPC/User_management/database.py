@@ -1,4 +1,18 @@
-import mysql.connector
+# database.py - Acceso a la tabla employees de MySQL
+#
+# Las conexiones se reutilizan: al terminar una consulta vuelven a una cola
+# de hasta POOL_SIZE conexiones libres, así un cierre y nuevo inicio de
+# sesión no paga una conexión nueva cada vez. Conectar (hasta
+# TIMEOUT_CONEXION) no toma ningún lock: la sincronización de fondo y un
+# login no se esperan entre sí detrás de un MySQL lento. mysql.connector se
+# importa en la primera consulta para no demorar la ventana de login.
+#
+# La columna contrasena guarda el hash (ver credenciales.py), nunca la
+# contraseña; las filas viejas en texto plano se migran solo a pedido
+# (python3 -m User_management.credenciales --migrar).
+
+import queue
+from contextlib import contextmanager
 
 DB_CONFIG = {
     'user': 'root',
@@ -6,35 +20,87 @@ DB_CONFIG = {
     'host': 'localhost',
     'database': 'esp32_report'
 }
+POOL_SIZE = 2  # Conexiones libres que se conservan abiertas
+TIMEOUT_CONEXION = 3  # Segundos; acota cuánto puede esperar un login que consulta MySQL
 
-def create_table():
-    conn = mysql.connector.connect(**DB_CONFIG)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS employees (
-            nombre VARCHAR(255) PRIMARY KEY,
-            contrasena VARCHAR(255) NOT NULL
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-def add_user(nombre, contraceña):
-    conn = mysql.connector.connect(**DB_CONFIG)
-    cursor = conn.cursor()
+_libres = queue.LifoQueue(POOL_SIZE)  # La más recién usada primero
+
+def _mysql():
+    # mysql.connector tarda en importarse: se carga en la primera consulta y
+    # no demora la ventana de login
+    import mysql.connector
+    return mysql.connector
+
+def _cerrar(conn):
     try:
-        cursor.execute('INSERT INTO employees (nombre, contrasena) VALUES (%s, %s)', (nombre, contraceña))
-        conn.commit()
-    except mysql.connector.IntegrityError:
-        return False  # El usuario ya existe
-    finally:
         conn.close()
+    except Exception:
+        pass  # Ya estaba caída
+
+@contextmanager
+def conexion():
+    # Una conexión libre o una nueva; al salir vuelve a las libres
+    try:
+        conn = _libres.get_nowait()
+    except queue.Empty:
+        conn = None
+    if conn is not None and not conn.is_connected():
+        _cerrar(conn)
+        conn = None
+    if conn is None:
+        conn = _mysql().connect(connection_timeout=TIMEOUT_CONEXION, **DB_CONFIG)
+    try:
+        yield conn
+    except Exception:
+        _cerrar(conn)
+        raise
+    try:
+        # Termina la transacción que abrió un SELECT: si no, la próxima
+        # consulta con esta conexión seguiría viendo la foto vieja de la tabla
+        conn.rollback()
+        _libres.put_nowait(conn)
+    except Exception:  # Conexión caída o ya hay POOL_SIZE libres
+        _cerrar(conn)
+
+def create_table():
+    with conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS employees (
+                nombre VARCHAR(255) PRIMARY KEY,
+                contrasena VARCHAR(255) NOT NULL
+            )
+        ''')
+        conn.commit()
+
+def add_user(nombre, hash_contrasena):
+    # False si el usuario ya existe
+    with conexion() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('INSERT INTO employees (nombre, contrasena) VALUES (%s, %s)', (nombre, hash_contrasena))
+            conn.commit()
+        except _mysql().IntegrityError:
+            return False  # El usuario ya existe
     return True
 
-def get_user(nombre, contraceña):
-    conn = mysql.connector.connect(**DB_CONFIG)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM employees WHERE nombre = %s AND contrasena = %s', (nombre, contraceña))
-    user = cursor.fetchone()
-    conn.close()
-    return user
\ No newline at end of file
+def get_hash(nombre):
+    # Lo guardado en contrasena para el usuario, o None si no existe
+    with conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT contrasena FROM employees WHERE nombre = %s', (nombre,))
+        fila = cursor.fetchone()
+    return fila[0] if fila else None
+
+def get_users():
+    # [(nombre, contrasena)] de todos los empleados
+    with conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT nombre, contrasena FROM employees')
+        return cursor.fetchall()
+
+def update_hash(nombre, hash_contrasena):
+    with conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE employees SET contrasena = %s WHERE nombre = %s', (hash_contrasena, nombre))
+        conn.commit()
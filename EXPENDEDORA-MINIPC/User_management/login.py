@@ -1,6 +1,7 @@
 import tkinter as tk
 from tkinter import messagebox
-from .database import get_user
+from segundo_plano import LlamadasEnSegundoPlano
+from .credenciales import SinConexion, autenticar
 
 class LoginWindow:
     def __init__(self, master, success_callback):
@@ -9,6 +10,11 @@ class LoginWindow:
         self.window.geometry("400x300")
         self.window.configure(bg="#e9ecef")
         self.success_callback = success_callback  # Guardar el callback
+        # PBKDF2 y la consulta a MySQL no corren en el hilo de Tk. Los
+        # resultados se entregan con el after() de master, que sigue vivo
+        # si esta ventana se cierra con una verificación en vuelo.
+        self.llamadas = LlamadasEnSegundoPlano(master)
+        self.window.protocol("WM_DELETE_WINDOW", self.cerrar)
 
         # Título
         self.title_label = tk.Label(self.window, text="Iniciar Sesión", bg="#e9ecef", fg="#343a40", font=("Arial", 16, "bold"))
@@ -42,12 +48,36 @@ class LoginWindow:
             self.warning_label.config(text="Por favor, complete todos los campos")
             return
 
-        user = get_user(nombre = usuario, contraceña = password)
+        # Se verifica contra la caché local; MySQL solo si hace falta
+        self.login_button.config(state="disabled")
+        self.warning_label.config(text="Verificando...")
+        self.llamadas.llamar(lambda: autenticar(usuario, password),
+                             lambda user: self.verificado(usuario, user), self.fallo)
 
+    def verificado(self, usuario, user):
+        if not self.window.winfo_exists():
+            return  # La ventana se cerró mientras se verificaba
+        self.login_button.config(state="normal")
+        self.warning_label.config(text="")
         if user:
             messagebox.showinfo("Login", "Login exitoso")
-            self.window.destroy()  # Cierra la ventana de login
+            self.cerrar()  # Cierra la ventana de login
             self.success_callback(usuario)  # Llama al callback de éxito con el nombre de usuario
         else:
             messagebox.showerror("Login", "Usuario o contraseña incorrectos")
-            self.warning_label.config(text="Usuario o contraseña incorrectos")
\ No newline at end of file
+            self.warning_label.config(text="Usuario o contraseña incorrectos")
+
+    def fallo(self, e):
+        print(e)
+        if not self.window.winfo_exists():
+            return
+        self.login_button.config(state="normal")
+        if isinstance(e, SinConexion):
+            messagebox.showerror("Login", "No hay conexión con el servidor de usuarios")
+            self.warning_label.config(text="Sin conexión, intente nuevamente")
+        else:
+            self.warning_label.config(text="No se pudo verificar el usuario")
+
+    def cerrar(self):
+        self.llamadas.detener()
+        self.window.destroy()
\ No newline at end of file
@@ -1,6 +1,7 @@
 import tkinter as tk
 from tkinter import messagebox
-from .database import add_user
+from segundo_plano import LlamadasEnSegundoPlano
+from .credenciales import SinConexion, registrar
 
 class RegisterWindow:
     def __init__(self, master):
@@ -8,6 +9,9 @@ class RegisterWindow:
         self.window.title("Registro")
         self.window.geometry("400x400")
         self.window.configure(bg="#e9ecef")
+        # El hash y el alta en MySQL no corren en el hilo de Tk (ver login.py)
+        self.llamadas = LlamadasEnSegundoPlano(master)
+        self.window.protocol("WM_DELETE_WINDOW", self.cerrar)
 
         # Título
         self.title_label = tk.Label(self.window, text="Crear Cuenta", bg="#e9ecef", fg="#343a40", font=("Arial", 16, "bold"))
@@ -41,12 +45,34 @@ class RegisterWindow:
             self.warning_label.config(text="Por favor, complete todos los campos")
             return
 
-        if add_user(username, password):
+        self.register_button.config(state="disabled")
+        self.warning_label.config(text="Registrando...")
+        self.llamadas.llamar(lambda: registrar(username, password), self.registrado, self.fallo)
+
+    def registrado(self, creado):
+        if not self.window.winfo_exists():
+            return  # La ventana se cerró mientras se registraba
+        self.register_button.config(state="normal")
+        if creado:
             messagebox.showinfo("Registro", "Registro exitoso")
-            self.window.destroy()
+            self.cerrar()
         else:
             self.warning_label.config(text="El usuario ya existe")
 
+    def fallo(self, e):
+        print(e)
+        if not self.window.winfo_exists():
+            return
+        self.register_button.config(state="normal")
+        if isinstance(e, SinConexion):
+            self.warning_label.config(text="No hay conexión con el servidor de usuarios")
+        else:
+            self.warning_label.config(text="No se pudo registrar el usuario")
+
+    def cerrar(self):
+        self.llamadas.detener()
+        self.window.destroy()
+
 if __name__ == "__main__":
     root = tk.Tk()
     root.withdraw()
@@ -1,12 +1,13 @@
 import tkinter as tk
 from .login import LoginWindow
 from .register import RegisterWindow
-from .database import create_table
+from .credenciales import iniciar_sincronizacion
 
 class UserManagement:
     def __init__(self, main_callback):
         self.main_callback = main_callback  # Guardar el callback
-        create_table()  # Crear la tabla de usuarios si no existe
+        # Tabla de usuarios y caché local de credenciales, sin demorar la ventana
+        iniciar_sincronizacion()
         self.root = tk.Tk()
         self.root.title("Sistema de Control de Usuarios")
         self.root.geometry("400x300")
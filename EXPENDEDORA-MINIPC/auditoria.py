@@ -0,0 +1,358 @@
+# auditoria.py - Auditoría offline del historial de eventos
+#
+# Carga los eventos de expendedora.db (tabla eventos de historial.py) en
+# arreglos NumPy por columna y en una pasada vectorizada:
+#   - recalcula cada período de apertura (entre aperturas/cierres) y cada
+#     período parcial (además entre cierres parciales),
+#   - compara lo recalculado con lo que la GUI envió al servidor en cada
+#     cierre y cierre parcial (eventos informe_cierre / informe_cierre_parcial
+#     que registra el servicio, columna reporte) y lista las diferencias,
+#   - resume por empleado (usuario de la sesión) ventas, dinero y fichas,
+#   - opcionalmente reproduce snapshot + diario de la bitácora y compara el
+#     período abierto con el libro actual.
+#
+# Es una herramienta de oficina: no se importa desde el servicio y NumPy
+# solo hace falta para correrla (pip install numpy).
+#
+# Uso: python3 auditoria.py [--db expendedora.db] [--desde 2026-01-01] [--hasta 2026-04-01]
+#                           [--bitacora] [--json auditoria.json]
+#      python3 auditoria.py --simular 2000000   (base sintética para medir tiempos)
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from bitacora import journal_file, snapshot_file
+from contadores import APERTURA, CLAVES, PARCIAL, LibroContadores
+from historial import DB_FILE
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Qué períodos vuelve a cero cada tipo de evento (igual que la GUI)
+REINICIOS = {
+    "apertura": (APERTURA, PARCIAL),
+    "cierre": (APERTURA, PARCIAL),
+    "cierre_parcial": (PARCIAL,),
+}
+TIPOS_VENTA = ("promo", "manual", "billete")
+PREFIJO_INFORME = "informe_"  # Igual que servicio.py
+# Claves del envío al servidor (informar_cierre / informar_cierre_parcial) -> claves del libro
+CLAVES_INFORME = {
+    "fichas": "fichas_expendidas", "dinero": "dinero_ingresado",
+    "p1": "promo1_contador", "p2": "promo2_contador", "p3": "promo3_contador",
+    "partial_fichas": "fichas_expendidas", "partial_dinero": "dinero_ingresado",
+    "partial_p1": "promo1_contador", "partial_p2": "promo2_contador", "partial_p3": "promo3_contador",
+}
+SIN_USUARIO = "(sin usuario)"
+TOLERANCIA = 1e-6
+BLOQUE = 200000  # Filas por fetchmany al cargar
+
+
+class Eventos:
+    # Eventos en columnas: ids, ts, tipo (código), usuario (código), valores (n x CLAVES)
+    def __init__(self, ids, ts, tipo, usuario, valores, tipos, usuarios, reportes):
+        self.ids = ids
+        self.ts = ts
+        self.tipo = tipo
+        self.usuario = usuario
+        self.valores = valores
+        self.tipos = tipos  # código -> nombre
+        self.usuarios = usuarios
+        self.reportes = reportes  # [(posición, dict reportado)]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def codigos(self, nombres):
+        return [i for i, nombre in enumerate(self.tipos) if nombre in nombres]
+
+
+def _requerir_numpy():
+    if np is None:
+        raise SystemExit("auditoria.py necesita NumPy: pip install numpy")
+
+
+def _codigo_sql(columna, valores):
+    # CASE que traduce el texto de la columna a su posición en `valores`
+    casos = " ".join(f"WHEN ? THEN {i}" for i in range(len(valores)))
+    return f"CASE {columna} {casos} ELSE -1 END", list(valores)
+
+
+def cargar(db_file=DB_FILE, desde=None, hasta=None):
+    # Lee los eventos en orden de registro (id). Tipo y usuario llegan ya
+    # como códigos enteros, así cada bloque de filas pasa directo a un
+    # arreglo float64 sin recorrerlo en Python.
+    _requerir_numpy()
+    conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+    filtro = "ts >= ? AND ts < ?"
+    parametros = [desde or 0, hasta or time.time() + 1]
+    tipos = [fila[0] for fila in conn.execute("SELECT DISTINCT tipo FROM eventos")]
+    usuarios = [fila[0] for fila in conn.execute("SELECT DISTINCT IFNULL(usuario, ?) FROM eventos", (SIN_USUARIO,))]
+    codigo_tipo, parametros_tipo = _codigo_sql("tipo", tipos)
+    codigo_usuario, parametros_usuario = _codigo_sql(f"IFNULL(usuario, '{SIN_USUARIO}')", usuarios)
+    cursor = conn.execute(f"SELECT id, ts, {codigo_tipo}, {codigo_usuario}, {', '.join(CLAVES)} "
+                          f"FROM eventos WHERE {filtro} ORDER BY id",
+                          parametros_tipo + parametros_usuario + parametros)
+
+    bloques = []
+    while True:
+        filas = cursor.fetchmany(BLOQUE)
+        if not filas:
+            break
+        bloques.append(np.array(filas, dtype=np.float64))
+    datos = np.concatenate(bloques) if bloques else np.zeros((0, 4 + len(CLAVES)))
+    ids = datos[:, 0].astype(np.int64)
+    ts = datos[:, 1].copy()
+    tipo = datos[:, 2].astype(np.int32)
+    usuario = datos[:, 3].astype(np.int32)
+    valores = np.ascontiguousarray(datos[:, 4:])
+
+    reportes = []
+    filas = conn.execute(f"SELECT id, reporte FROM eventos WHERE reporte IS NOT NULL AND {filtro} ORDER BY id",
+                         parametros).fetchall()
+    if filas:
+        posiciones = np.searchsorted(ids, [fila[0] for fila in filas])
+        reportes = [(int(p), json.loads(fila[1])) for p, fila in zip(posiciones, filas)]
+    conn.close()
+    return Eventos(ids, ts, tipo, usuario, valores, tipos, usuarios, reportes)
+
+
+def sumas_por_periodo(eventos, periodo):
+    # (número de período de cada evento, sumas de CLAVES por período). El
+    # evento que reinicia abre el período nuevo; el período 0 empezó antes
+    # de la ventana cargada, así que está incompleto.
+    reinicia = np.isin(eventos.tipo, eventos.codigos(tuple(t for t, p in REINICIOS.items() if periodo in p)))
+    numero = np.cumsum(reinicia)
+    cantidad = int(numero[-1]) + 1 if len(eventos) else 1
+    sumas = np.column_stack([np.bincount(numero, weights=eventos.valores[:, j], minlength=cantidad)
+                             for j in range(len(CLAVES))])
+    return numero, sumas
+
+
+def auditar(eventos):
+    resultado = {"eventos": len(eventos), "diferencias": [], "cierres_revisados": 0}
+    if not len(eventos):
+        resultado.update(totales={clave: 0 for clave in CLAVES}, periodo_abierto={}, empleados={})
+        return resultado
+
+    periodos = {periodo: sumas_por_periodo(eventos, periodo) for periodo in (APERTURA, PARCIAL)}
+
+    # Cierres: lo enviado contra el período que ese cierre cerró. El informe
+    # llega justo detrás de su cierre, así que su período es el que el cierre
+    # abrió. Las bases viejas guardaban el reporte en el mismo evento de
+    # cierre, ya con las claves del libro.
+    for posicion, reportado in eventos.reportes:
+        tipo = eventos.tipos[eventos.tipo[posicion]]
+        if tipo.startswith(PREFIJO_INFORME):
+            tipo = tipo[len(PREFIJO_INFORME):]
+            reportado = {CLAVES_INFORME[clave]: valor for clave, valor in reportado.items()
+                         if clave in CLAVES_INFORME}
+        if tipo not in REINICIOS:
+            continue
+        periodo = APERTURA if tipo == "cierre" else PARCIAL
+        numero, sumas = periodos[periodo]
+        cerrado = int(numero[posicion]) - 1
+        if cerrado < 0:
+            continue
+        resultado["cierres_revisados"] += 1
+        for j, clave in enumerate(CLAVES):
+            if clave not in reportado:
+                continue
+            diferencia = reportado[clave] - sumas[cerrado, j]
+            if abs(diferencia) > TOLERANCIA:
+                resultado["diferencias"].append({
+                    "ts": datetime.fromtimestamp(eventos.ts[posicion]).strftime("%Y-%m-%d %H:%M:%S"),
+                    "tipo": tipo,
+                    "usuario": eventos.usuarios[eventos.usuario[posicion]],
+                    "clave": clave,
+                    "reportado": reportado[clave],
+                    "recalculado": float(sumas[cerrado, j]),
+                    "diferencia": float(diferencia),
+                    "periodo_completo": cerrado > 0,
+                })
+
+    resultado["totales"] = dict(zip(CLAVES, eventos.valores.sum(axis=0).tolist()))
+    resultado["periodo_abierto"] = {periodo: dict(zip(CLAVES, sumas[-1].tolist()))
+                                    for periodo, (_, sumas) in periodos.items()}
+    resultado["empleados"] = resumen_empleados(eventos)
+    return resultado
+
+
+def resumen_empleados(eventos):
+    cantidad = len(eventos.usuarios)
+    ventas = np.isin(eventos.tipo, eventos.codigos(TIPOS_VENTA))
+    parciales = np.isin(eventos.tipo, eventos.codigos(("cierre_parcial",)))
+    columnas = {
+        "eventos": np.bincount(eventos.usuario, minlength=cantidad),
+        "ventas": np.bincount(eventos.usuario, weights=ventas, minlength=cantidad),
+        "cierres_parciales": np.bincount(eventos.usuario, weights=parciales, minlength=cantidad),
+    }
+    for j, clave in enumerate(CLAVES):
+        columnas[clave] = np.bincount(eventos.usuario, weights=eventos.valores[:, j], minlength=cantidad)
+    primero = np.full(cantidad, np.inf)
+    ultimo = np.full(cantidad, -np.inf)
+    np.minimum.at(primero, eventos.usuario, eventos.ts)
+    np.maximum.at(ultimo, eventos.usuario, eventos.ts)
+
+    empleados = {}
+    for i, nombre in enumerate(eventos.usuarios):
+        fila = {columna: float(valores[i]) for columna, valores in columnas.items()}
+        fila["desde"] = datetime.fromtimestamp(primero[i]).strftime("%Y-%m-%d %H:%M")
+        fila["hasta"] = datetime.fromtimestamp(ultimo[i]).strftime("%Y-%m-%d %H:%M")
+        empleados[nombre] = fila
+    return empleados
+
+
+def leer_libro(ruta_snapshot=snapshot_file, ruta_journal=journal_file):
+    # Snapshot + diario de la bitácora, solo lectura (no toca los archivos del servicio)
+    libro = LibroContadores()
+    desde_seq = 0
+    if os.path.exists(ruta_snapshot):
+        with open(ruta_snapshot, 'r') as f:
+            snapshot = json.load(f)
+        libro.cargar(snapshot)
+        desde_seq = snapshot.get("seq", 0)
+    if os.path.exists(ruta_journal):
+        with open(ruta_journal, 'r') as f:
+            for linea in f:
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    break
+                if registro["q"] <= desde_seq:
+                    continue
+                for periodo in registro.get("r", ()):
+                    libro.reiniciar(periodo)
+                if "d" in registro:
+                    libro.aplicar(registro["d"])
+    return libro
+
+
+def comparar_libro(resultado, libro):
+    # Período abierto recalculado contra el libro actual de la bitácora
+    comparacion = {}
+    for periodo, recalculado in resultado["periodo_abierto"].items():
+        actual = libro.vista(periodo)
+        comparacion[periodo] = {clave: {"libro": actual[clave], "recalculado": recalculado[clave]}
+                                for clave in CLAVES if abs(actual[clave] - recalculado[clave]) > TOLERANCIA}
+    return comparacion
+
+
+def imprimir(resultado):
+    print(f"Eventos: {resultado['eventos']}, cierres revisados: {resultado['cierres_revisados']}, "
+          f"diferencias: {len(resultado['diferencias'])}")
+    for d in resultado["diferencias"]:
+        aviso = "" if d["periodo_completo"] else " (período anterior a la ventana)"
+        print(f"  {d['ts']} {d['tipo']:<15} {d['usuario']:<15} {d['clave']:<20} "
+              f"informado {d['reportado']:>12g} recalculado {d['recalculado']:>12g}{aviso}")
+
+    print("\nPor empleado:")
+    print(f"  {'Usuario':<18}{'Ventas':>8}{'Dinero':>14}{'Fichas':>10}{'P1':>7}{'P2':>7}{'P3':>7}{'Parciales':>11}")
+    for nombre, fila in sorted(resultado["empleados"].items(), key=lambda e: -e[1]["dinero_ingresado"]):
+        print(f"  {nombre:<18}{fila['ventas']:>8.0f}{fila['dinero_ingresado']:>14.2f}"
+              f"{fila['fichas_expendidas']:>10.0f}{fila['promo1_contador']:>7.0f}{fila['promo2_contador']:>7.0f}"
+              f"{fila['promo3_contador']:>7.0f}{fila['cierres_parciales']:>11.0f}")
+
+    if "libro" in resultado:
+        print("\nPeríodo abierto contra la bitácora:")
+        for periodo, diferencias in resultado["libro"].items():
+            print(f"  {periodo}: {'coincide' if not diferencias else diferencias}")
+
+
+def simular(db_file, cantidad, semilla=22):
+    # Base sintética: ventas de varios empleados, cierres parciales por turno y
+    # un cierre por día, cada uno seguido del envío al servidor como lo
+    # registra el servicio; algunos envíos llevan un valor viejo a propósito
+    import random
+
+    from historial import Historial
+
+    _requerir_numpy()
+    azar = random.Random(semilla)
+    historial = Historial(db_file)
+    libro = LibroContadores()
+    usuarios = ["ana", "beto", "carla", "dario"]
+    promos = [("promo1_contador", 1000, 3), ("promo2_contador", 2000, 7), ("promo3_contador", 5000, 20)]
+    ts = time.time() - 120 * 86400
+    paso = 120 * 86400 / cantidad
+    usuario = usuarios[0]
+    alterados = 0
+    for i in range(cantidad):
+        ts += paso
+        if i % 5000 == 4999:
+            tipo, deltas = ("cierre" if i % 20000 == 19999 else "cierre_parcial"), None
+        elif azar.random() < 0.25:
+            clave, precio, fichas = azar.choice(promos)
+            tipo, deltas = "promo", {clave: 1, "dinero_ingresado": precio, "fichas_restantes": fichas}
+        else:
+            tipo, deltas = "ficha", {"fichas_expendidas": 1, "fichas_restantes": -1}
+
+        if tipo in REINICIOS:
+            cerrado = libro.vista(APERTURA if tipo == "cierre" else PARCIAL)
+            prefijo = "" if tipo == "cierre" else "partial_"
+            reporte = {f"{prefijo}{clave}": cerrado[clave_libro] for clave, clave_libro in
+                       (("fichas", "fichas_expendidas"), ("dinero", "dinero_ingresado"),
+                        ("p1", "promo1_contador"), ("p2", "promo2_contador"), ("p3", "promo3_contador"))}
+            if azar.random() < 0.05:
+                reporte[f"{prefijo}dinero"] -= 1000  # Envío armado con una copia atrasada
+                alterados += 1
+            for reiniciado in REINICIOS[tipo]:
+                libro.reiniciar(reiniciado)
+            historial.registrar(tipo, None, ts, usuario)
+            historial.registrar(PREFIJO_INFORME + tipo, None, ts, usuario, reporte)
+            usuario = azar.choice(usuarios)  # Cambio de turno
+            continue
+        libro.aplicar(deltas)
+        historial.registrar(tipo, deltas, ts, usuario)
+        if i % BLOQUE == BLOQUE - 1:
+            historial.volcar()
+    historial.cerrar()
+    return alterados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Auditoría del historial de eventos de la expendedora")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--desde", help="Fecha inicial (AAAA-MM-DD)")
+    parser.add_argument("--hasta", help="Fecha final, exclusiva (AAAA-MM-DD)")
+    parser.add_argument("--bitacora", action="store_true",
+                        help="Comparar el período abierto con snapshot + diario de la bitácora")
+    parser.add_argument("--json", help="Guardar el resultado completo en este archivo")
+    parser.add_argument("--simular", type=int, metavar="N",
+                        help="Crear una base sintética con N eventos en --db y auditarla")
+    args = parser.parse_args()
+
+    if args.simular:
+        if os.path.exists(args.db):
+            raise SystemExit(f"{args.db} ya existe; --simular necesita una base nueva")
+        inicio = time.perf_counter()
+        alterados = simular(args.db, args.simular)
+        print(f"{args.simular} eventos simulados en {time.perf_counter() - inicio:.1f} s "
+              f"({alterados} cierres con un valor alterado)")
+
+    def fecha(texto):
+        return datetime.strptime(texto, "%Y-%m-%d").timestamp() if texto else None
+
+    inicio = time.perf_counter()
+    eventos = cargar(args.db, fecha(args.desde), fecha(args.hasta))
+    cargado = time.perf_counter()
+    resultado = auditar(eventos)
+    if args.bitacora:
+        resultado["libro"] = comparar_libro(resultado, leer_libro())
+    fin = time.perf_counter()
+
+    imprimir(resultado)
+    print(f"\nCarga {cargado - inicio:.2f} s, cálculo {fin - cargado:.2f} s")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(resultado, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
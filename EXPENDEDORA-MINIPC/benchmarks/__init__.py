@@ -0,0 +1,14 @@
+# benchmarks - Medición de los caminos críticos de la expendedora
+#
+# Uso (desde EXPENDEDORA-MINIPC):
+#   python3 -m benchmarks                      # mide y compara contra baseline.json
+#   python3 -m benchmarks --guardar-baseline   # mide y reemplaza la baseline
+#
+# Todo corre sobre gpio_sim (reloj virtual) en un directorio temporal, así que
+# no toca config.json, la base de datos ni la bitácora del kiosko.
+#
+# La baseline guarda en "maquina" el nombre del equipo donde se midió. Las
+# métricas de tiempo real (µs de CPU) solo se comparan contra una baseline
+# del mismo equipo: la del repositorio es de la VM de desarrollo, así que en
+# el mini PC hay que guardar la suya con --guardar-baseline antes de usar
+# la comparación como control.
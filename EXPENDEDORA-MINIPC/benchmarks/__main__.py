@@ -0,0 +1,137 @@
+# Ejecuta los benchmarks, guarda los resultados en JSON y compara contra la baseline
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+from datetime import datetime
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(DIRECTORIO, "baseline.json")
+
+CONFIG_PRUEBA = {
+    "promociones": {
+        "Promo 1": {"precio": 2000.0, "fichas": 5},
+        "Promo 2": {"precio": 4000.0, "fichas": 15},
+        "Promo 3": {"precio": 10000.0, "fichas": 35}
+    },
+    "valor_ficha": 600.0,
+    "trazas": {"muestreo": 20},  # Igual que config.json
+    # Sin tocar el segmento ni el puerto de métricas del kiosko real
+    "segmento": {"ruta": "bench.shm"},
+    "metricas": {"puerto": 0}
+}
+
+
+def ejecutar(repeticiones=1):
+    # Directorio temporal: config.json, expendedora.db y bitácora de prueba.
+    # Cada métrica es la mediana de `repeticiones` pasadas por todos los casos:
+    # una pasada con la máquina ocupada no mueve el resultado.
+    sys.path.insert(0, os.path.dirname(DIRECTORIO))
+    trabajo = tempfile.mkdtemp(prefix="bench_expendedora_")
+    anterior = os.getcwd()
+    os.chdir(trabajo)
+    try:
+        with open("config.json", 'w') as f:
+            json.dump(CONFIG_PRUEBA, f)
+
+        from gpio_sim import GPIO
+        GPIO.verbose = False
+        import expendedora_core as core
+        from benchmarks.casos import CASOS
+
+        medidas = {}
+        for _ in range(repeticiones):
+            for caso in CASOS:
+                for nombre, (valor, unidad, mejor, *tolerancia) in caso(core).items():
+                    medida = medidas.setdefault(nombre, {"valores": [], "unidad": unidad, "mejor": mejor})
+                    medida["valores"].append(valor)
+                    if tolerancia:
+                        medida["tolerancia"] = tolerancia[0]
+
+        resultados = {}
+        for nombre, medida in medidas.items():
+            valor = statistics.median(medida.pop("valores"))
+            resultados[nombre] = dict(medida, valor=round(valor, 3))
+            print(f"{nombre:40s} {valor:12.3f} {medida['unidad']}")
+        return resultados
+    finally:
+        os.chdir(anterior)
+        shutil.rmtree(trabajo, ignore_errors=True)
+
+
+def comparar(resultados, baseline, tolerancia, misma_maquina=True):
+    # Devuelve la lista de métricas que empeoraron más que su tolerancia
+    # (la propia de la métrica si el caso la define, si no la general).
+    # Contra una baseline de otra máquina solo cuentan las métricas del
+    # reloj virtual (las que traen tolerancia propia); las de tiempo real se
+    # muestran pero comparar µs entre máquinas distintas no dice nada.
+    regresiones = []
+    for nombre, actual in resultados.items():
+        referencia = baseline.get(nombre)
+        if not referencia or not referencia["valor"]:
+            continue
+        permitido = actual.get("tolerancia", tolerancia)
+        cambio = (actual["valor"] - referencia["valor"]) / referencia["valor"]
+        if actual["mejor"] == "mayor":
+            cambio = -cambio
+        if not misma_maquina and "tolerancia" not in actual:
+            print(f"{nombre:40s} {referencia['valor']:12.3f} -> {actual['valor']:12.3f} "
+                  f"(otra máquina, no se compara)")
+            continue
+        estado = "REGRESIÓN" if cambio > permitido else "ok"
+        print(f"{nombre:40s} {referencia['valor']:12.3f} -> {actual['valor']:12.3f} ({cambio:+.0%} peor, "
+              f"tolerancia {permitido:.0%}) {estado}")
+        if cambio > permitido:
+            regresiones.append(nombre)
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de la expendedora")
+    parser.add_argument("--salida", default="resultados_benchmarks.json", help="Archivo JSON de resultados")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Archivo JSON de referencia")
+    parser.add_argument("--tolerancia", type=float, default=0.5, help="Empeoramiento relativo permitido (0.5 = 50%%)")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Pasadas por los casos (se usa la mediana)")
+    parser.add_argument("--guardar-baseline", action="store_true", help="Reemplazar la baseline con esta medición")
+    args = parser.parse_args()
+
+    resultados = ejecutar(args.repeticiones)
+    informe = {
+        "fecha": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "maquina": platform.node(),
+        "python": platform.python_version(),
+        "resultados": resultados
+    }
+    with open(args.salida, 'w') as f:
+        json.dump(informe, f, indent=4)
+    print(f"Resultados guardados en {args.salida}")
+
+    if args.guardar_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(informe, f, indent=4)
+        print(f"Baseline actualizada: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No hay baseline para comparar (usar --guardar-baseline)")
+        return 0
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    misma_maquina = baseline.get("maquina") == informe["maquina"]
+    if not misma_maquina:
+        print(f"La baseline se midió en {baseline.get('maquina')!r} y esta máquina es {informe['maquina']!r}: "
+              f"correr una vez --guardar-baseline aquí para vigilar las métricas de tiempo real")
+    regresiones = comparar(resultados, baseline["resultados"], args.tolerancia, misma_maquina)
+    if regresiones:
+        print(f"Regresiones: {', '.join(regresiones)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+# casos.py - Casos de benchmark
+#
+# Cada caso recibe el módulo expendedora_core ya importado (sobre gpio_sim) y
+# devuelve un diccionario {métrica: (valor, unidad, mejor[, tolerancia])} donde
+# `mejor` es "menor" o "mayor" según qué dirección cuenta como mejora. Las
+# métricas medidas con el reloj virtual no dependen de la máquina y llevan
+# su propia tolerancia (EXACTA); las de tiempo real usan la de la línea de
+# comandos.
+
+import contextlib
+import os
+import random
+import time
+
+import precios
+from bitacora import Bitacora
+from cliente_servicio import ClienteServicio
+from configuracion import ArchivoConfiguracion
+from servicio import ServicioExpendedora
+from telemetria import ColaTelemetria
+from trazas import obtener_trazador
+
+MENOR = "menor"
+MAYOR = "mayor"
+EXACTA = 0.01  # Métricas deterministas (reloj virtual): cualquier cambio es real
+
+
+def medir_us(funcion, repeticiones, rondas=5):
+    # Microsegundos por llamada: el mínimo de varias rondas para filtrar ruido
+    mejor = None
+    for _ in range(rondas):
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            funcion()
+        por_llamada = (time.perf_counter() - inicio) / repeticiones * 1e6
+        mejor = por_llamada if mejor is None else min(mejor, por_llamada)
+    return mejor
+
+
+@contextlib.contextmanager
+def silencio():
+    # Los prints por ficha no deben entrar en la medición
+    with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+        yield
+
+
+def caso_convertir_fichas(core):
+    # Cada conversión abre su compra, como un billete: con el muestreo de
+    # config.json solo una de cada N paga el tramo de la traza
+    trazador = obtener_trazador()
+    trazador.configurar(muestreo=core.cargar_configuracion()["trazas"]["muestreo"])
+
+    def convertir():
+        trazador.nueva_traza()
+        core.cuenta = 12000
+        core.fichas = 0
+        core.convertir_fichas()
+
+    # Montos al azar (hasta $100.000) contra la tabla compilada, con ambas políticas
+    azar = random.Random(13)
+    montos = [azar.randint(0, 200) * 500 for _ in range(200000)]
+    config = core.cargar_configuracion()
+    resultados = {"convertir_fichas_us": (medir_us(convertir, 20000), "µs", MENOR)}
+    trazador.usar(None)
+    for politica in precios.POLITICAS:
+        tabla = precios.compilar(core.init_db().obtener_tarifas(), config["promociones"],
+                                 config["valor_ficha"], politica)
+        resultados[f"precios_{politica}_us"] = (medir_us(lambda: [tabla.convertir(m) for m in montos], 1, 5)
+                                                / len(montos), "µs", MENOR)
+    return resultados
+
+
+def caso_entrega(core):
+    # Promo 3 (35 fichas) a través de expender_fichas y de entregar_fichas
+    resultados = {}
+    for nombre, entregar in [("expender_fichas", lambda: core.expender_fichas(35)),
+                             ("entregar_fichas", core.entregar_fichas)]:
+        segundos_virtuales = 0.0
+        entregadas = 0
+        cpu = None
+        with silencio():
+            for _ in range(5):
+                # CPU: el mínimo de 5 rondas de 20 entregas, igual que medir_us
+                inicio = time.perf_counter()
+                for _ in range(20):
+                    core.hopper_simulado.fichas = 1000  # Recargar: un hopper vacío no termina nunca
+                    core.fichas = 35
+                    entregar()
+                    segundos_virtuales += core.hopper.ultima_entrega["segundos"]
+                    entregadas += core.hopper.ultima_entrega["entregadas"]
+                ronda = (time.perf_counter() - inicio) / (20 * 35) * 1e6
+                cpu = ronda if cpu is None else min(cpu, ronda)
+        resultados[f"{nombre}_fichas_por_segundo"] = (entregadas / segundos_virtuales, "fichas/s", MAYOR, EXACTA)
+        resultados[f"{nombre}_cpu_por_ficha_us"] = (cpu, "µs", MENOR)
+    return resultados
+
+
+def caso_atasco(core):
+    # Segundos virtuales que pierde una promo 3 con un atasco que se destraba
+    # al rearrancar el motor, y desde la última ficha hasta que un atasco
+    # permanente se da por vacío/atascado
+    hopper, simulado = core.hopper, core.hopper_simulado
+    aviso, hopper.al_cambiar_estado = hopper.al_cambiar_estado, None  # Sin heartbeats de prueba
+    try:
+        with silencio():
+            simulado.fichas = 1000
+            normal = hopper.dispensar(35)["segundos"]
+            simulado.atasco_en, simulado.destraba_tras = simulado.entregadas + 10, 1
+            transitorio = hopper.dispensar(35)["segundos"] - normal
+            simulado.atasco_en, simulado.destraba_tras = simulado.entregadas + 10, None
+            hopper.dispensar(35)
+            permanente = core.reloj.monotonic() - hopper.sensor.ultimo_pulso
+            simulado.desatascar()
+            hopper.dispensar(5)  # Vuelve a entregar: estado listo
+    finally:
+        hopper.al_cambiar_estado = aviso
+    return {
+        "atasco_transitorio_segundos": (transitorio, "s", MENOR, EXACTA),
+        "atasco_permanente_segundos": (permanente, "s", MENOR, EXACTA)
+    }
+
+
+def caso_persistencia(core):
+    # Los mismos objetos de persistencia que usa el servicio, sobre archivos
+    # propios del directorio de trabajo del benchmark
+    configuracion = ArchivoConfiguracion("bench_config.json")
+    config = dict(core.cargar_configuracion())
+    configuracion.guardar(config)
+    bitacora = Bitacora(ruta_journal="bench.journal", ruta_snapshot="bench_snapshot.json")
+    bitacora.recuperar()
+    deltas = {"fichas_restantes": -1, "fichas_expendidas": 1}
+    resultados = {
+        "bitacora_registrar_us": (medir_us(lambda: bitacora.registrar("ficha", deltas), 5000), "µs", MENOR),
+        "guardar_configuracion_us": (medir_us(lambda: configuracion.guardar(dict(config)), 300), "µs", MENOR),
+    }
+    bitacora.cerrar()
+    return resultados
+
+
+def caso_ipc(core):
+    # Ida y vuelta GUI -> servicio por el socket Unix para un evento
+    servicio = ServicioExpendedora(core, ruta_socket="bench.sock")
+    servicio.iniciar()
+    cliente = ClienteServicio("bench.sock")
+    # Cada "ficha" saca una ficha cobrada: se cargan antes las que usa la medición
+    cliente.evento("venta", {"fichas_restantes": 5 * 2000})
+    deltas = {"fichas_restantes": -1, "fichas_expendidas": 1}
+    resultados = {
+        "ipc_evento_us": (medir_us(lambda: cliente.evento("ficha", deltas), 2000), "µs", MENOR),
+        "ipc_estado_us": (medir_us(cliente.sincronizar, 2000), "µs", MENOR),
+    }
+    cliente.cerrar()
+    servicio.detener()
+    return resultados
+
+
+def caso_telemetria(core):
+    # Costo de encolar desde el hilo de Tk (sin hilo de envío: solo el put)
+    cola = ColaTelemetria()
+    datos = {"device_id": "EXPENDEDORA_1", "dato1": 35, "dato2": 10000.0}
+    valor = medir_us(lambda: cola.encolar("http://127.0.0.1/", datos, "Datos"), 20000)
+    return {"telemetria_encolar_us": (valor, "µs", MENOR)}
+
+
+CASOS = [caso_convertir_fichas, caso_entrega, caso_atasco, caso_persistencia, caso_ipc, caso_telemetria]
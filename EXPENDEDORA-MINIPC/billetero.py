@@ -0,0 +1,183 @@
+# billetero.py - Decodificador de pulsos del billetero/monedero en ECOIN
+#
+# El billetero emite un tren de N pulsos por billete (N según la
+# denominación) a decenas de Hz. El callback de flanco solo guarda la marca
+# de tiempo en un buffer circular de tamaño fijo; la decodificación corre
+# aparte: agrupa los pulsos en ráfagas separadas por al menos `pausa_fin`
+# segundos, traduce la cantidad de pulsos a un monto y llama a al_billete(monto).
+#
+# Con el reloj real la decodificación corre en un hilo propio que duerme
+# mientras no hay pulsos. Con el reloj virtual de gpio_sim se programa en el
+# reloj, así un tren de pulsos simulado se decodifica de forma determinística
+# aunque al mismo tiempo haya una entrega en curso.
+
+import threading
+import time
+
+from reloj import RELOJ_REAL
+from trazas import obtener_trazador
+
+# Pulsos por billete -> monto (se puede cambiar en config.json, "billetero")
+DENOMINACIONES_POR_DEFECTO = {1: 1000, 2: 2000, 5: 5000, 10: 10000, 20: 20000}
+
+
+class DecodificadorPulsos:
+    def __init__(self, gpio, pin, denominaciones=None, pausa_fin=0.25, debounce=0.005,
+                 capacidad=256, al_billete=None, reloj=RELOJ_REAL):
+        self.gpio = gpio
+        self.pin = pin
+        self.reloj = reloj
+        self.denominaciones = {int(pulsos): monto for pulsos, monto in
+                               (denominaciones or DENOMINACIONES_POR_DEFECTO).items()}
+        self.pausa_fin = pausa_fin  # Silencio que cierra una ráfaga (un billete)
+        self.debounce = debounce
+        self.capacidad = capacidad
+        self.al_billete = al_billete
+
+        # Buffer circular: el callback escribe, procesar() lee. Los índices
+        # crecen sin límite y se toman módulo capacidad.
+        self._marcas = [0.0] * capacidad
+        self._escritos = 0
+        self._leidos = 0
+        self._ultimo_pulso = None
+
+        self.billetes = 0  # Ráfagas decodificadas
+        self.rechazados = 0  # Ráfagas con una cantidad de pulsos desconocida
+        self.perdidos = 0  # Pulsos pisados por desborde del buffer
+
+        self._cond = threading.Condition()
+        self._detenido = False
+        self._hilo = None
+        self._programar = getattr(reloj, "programar", None)  # Solo el reloj virtual
+
+        gpio.add_event_detect(pin, gpio.FALLING, callback=self._on_flanco,
+                              bouncetime=max(1, int(debounce * 1000)))
+
+    def _on_flanco(self, canal):
+        ahora = self.reloj.monotonic()
+        if self._ultimo_pulso is not None and ahora - self._ultimo_pulso < self.debounce:
+            return  # Rebote
+        self._ultimo_pulso = ahora
+        self._marcas[self._escritos % self.capacidad] = ahora
+        self._escritos += 1
+        if self._programar:
+            self._programar(self.pausa_fin, self.procesar)
+        else:
+            with self._cond:
+                self._cond.notify()
+
+    def procesar(self):
+        # Decodifica las ráfagas completas. Devuelve los segundos que faltan
+        # para que termine la ráfaga en curso, o None si no hay pulsos pendientes.
+        ahora = self.reloj.monotonic()
+        escritos = self._escritos
+        if escritos - self._leidos > self.capacidad:
+            perdidos = escritos - self._leidos - self.capacidad
+            self.perdidos += perdidos
+            self._leidos = escritos - self.capacidad
+            print(f"Billetero: se perdieron {perdidos} pulso(s) por desborde del buffer")
+
+        rafagas = []  # (pulsos, marca del primer pulso)
+        inicio = self._leidos
+        anterior = None
+        for i in range(self._leidos, escritos):
+            marca = self._marcas[i % self.capacidad]
+            if anterior is not None and marca - anterior >= self.pausa_fin:
+                rafagas.append((i - inicio, self._marcas[inicio % self.capacidad]))
+                inicio = i
+            anterior = marca
+
+        espera = None
+        if escritos > inicio:
+            if ahora - anterior >= self.pausa_fin:
+                rafagas.append((escritos - inicio, self._marcas[inicio % self.capacidad]))
+                inicio = escritos
+            else:
+                espera = anterior + self.pausa_fin - ahora
+        self._leidos = inicio
+
+        for pulsos, primera in rafagas:
+            self._decodificar(pulsos, ahora - primera)
+        return espera
+
+    def _decodificar(self, pulsos, duracion):
+        monto = self.denominaciones.get(pulsos)
+        if monto is None:
+            self.rechazados += 1
+            print(f"Billetero: ráfaga de {pulsos} pulso(s) sin denominación, ignorada")
+            return
+        self.billetes += 1
+        print(f"Billetero: billete de ${monto} ({pulsos} pulsos)")
+        # Cada billete abre una traza; lo que haga al_billete en este hilo la hereda
+        trazador = obtener_trazador()
+        trazador.nueva_traza()
+        trazador.registrar("deteccion_billete", time.time() - duracion, duracion, pulsos=pulsos, monto=monto)
+        if self.al_billete:
+            self.al_billete(monto)
+
+    def iniciar(self):
+        # Con el reloj virtual no hace falta hilo: procesar() queda programado
+        if self._programar is None and self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, daemon=True)
+            self._hilo.start()
+        return self
+
+    def _bucle(self):
+        while True:
+            espera = self.procesar()
+            with self._cond:
+                if self._detenido:
+                    return
+                if espera is None:
+                    self._cond.wait_for(lambda: self._escritos > self._leidos or self._detenido)
+                else:
+                    self._cond.wait(espera)
+
+    def detener(self):
+        self.gpio.remove_event_detect(self.pin)
+        with self._cond:
+            self._detenido = True
+            self._cond.notify()
+        if self._hilo:
+            self._hilo.join()
+            self._hilo = None
+
+
+if __name__ == "__main__":
+    # Billetes seguidos mientras el hopper entrega fichas, todo en tiempo virtual
+    import contextlib
+    import io
+    import random
+
+    from gpio_sim import GPIO, HopperSimulado, programar_tren_pulsos
+    from hopper import Hopper
+    from sensor_hopper import SensorHopper
+
+    SALIDA, ENTHOPER, ECOIN = 24, 23, 35
+    GPIO.reiniciar()
+    for pin in (ENTHOPER, ECOIN):
+        GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+    GPIO.setup(SALIDA, GPIO.OUT)
+    GPIO.conectar(HopperSimulado(SALIDA, ENTHOPER, fichas=100000))
+    hopper = Hopper(GPIO, SALIDA, SensorHopper(GPIO, ENTHOPER, reloj=GPIO.reloj), reloj=GPIO.reloj)
+
+    recibidos = []
+    billetero = DecodificadorPulsos(GPIO, ECOIN, al_billete=recibidos.append, capacidad=64,
+                                    reloj=GPIO.reloj).iniciar()
+
+    # 500 billetes a 20 Hz con la pausa mínima entre billetes (0.3 s)
+    azar = random.Random(14)
+    enviados = []
+    momento = 0.0
+    for _ in range(500):
+        pulsos = azar.choice(list(billetero.denominaciones))
+        programar_tren_pulsos(ECOIN, pulsos, inicio=momento, ancho=0.02, separacion=0.03)
+        enviados.append(billetero.denominaciones[pulsos])
+        momento += pulsos * 0.05 + 0.3
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        while GPIO.reloj.pendientes():
+            hopper.dispensar(35)  # El reloj avanza mientras el motor entrega
+    print(f"Billetes: enviados {len(enviados)}, decodificados {len(recibidos)}, "
+          f"rechazados {billetero.rechazados}, pulsos perdidos {billetero.perdidos}")
+    assert recibidos == enviados and billetero.perdidos == 0
@@ -0,0 +1,205 @@
+# bitacora.py - Diario de eventos (append-only) para los contadores de la expendedora
+#
+# Cada venta, promo o ficha entregada se agrega como una línea JSON compacta al
+# archivo de diario en lugar de reescribir todo config.json. Las líneas se
+# acumulan en memoria y se escriben + fsync en grupo (group commit) como máximo
+# cada `intervalo_commit` segundos, que es la ventana de pérdida de datos
+# configurable. Cada `eventos_por_snapshot` eventos se guarda un snapshot
+# completo y el diario se trunca (compactación).
+#
+# Al iniciar, los contadores se reconstruyen con el snapshot + la cola del diario.
+# Si no hay snapshot y se parte de una semilla (los contadores que antes
+# vivían en config.json) se escribe el snapshot enseguida: config.json ya no
+# guarda contadores, así que la semilla puede no volver a estar.
+
+import json
+import os
+import threading
+import time
+
+from contadores import LibroContadores
+from metricas import CUBETAS_DISCO, obtener_registro
+
+journal_file = "contadores.journal"
+snapshot_file = "contadores_snapshot.json"
+
+ESCRITURA_JOURNAL = obtener_registro().histograma(
+    "expendedora_bitacora_commit_segundos", "Escritura + fsync de un grupo de eventos del diario", CUBETAS_DISCO)
+ESCRITURA_SNAPSHOT = obtener_registro().histograma(
+    "expendedora_bitacora_snapshot_segundos", "Escritura atómica del snapshot de contadores", CUBETAS_DISCO)
+
+
+def escribir_atomico(ruta, contenido, newline=None):
+    # Escribe en un temporal, fsync y rename: nunca queda un archivo a medio escribir.
+    # newline: fin de línea a usar ("\r\n" para conservar un archivo CRLF)
+    tmp = ruta + ".tmp"
+    with open(tmp, 'w', newline=newline) as f:
+        f.write(contenido)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, ruta)
+
+
+class Bitacora:
+    def __init__(self, ruta_journal=journal_file, ruta_snapshot=snapshot_file,
+                 intervalo_commit=1.0, eventos_por_snapshot=1000):
+        self.ruta_journal = ruta_journal
+        self.ruta_snapshot = ruta_snapshot
+        self.intervalo_commit = intervalo_commit  # Ventana máxima de pérdida (segundos)
+        self.eventos_por_snapshot = eventos_por_snapshot
+
+        self.libro = LibroContadores()
+        self.seq = 0
+        self._eventos_desde_snapshot = 0
+        self._pendientes = []
+        self._lock = threading.Lock()        # Libro, seq y eventos pendientes
+        self._lock_disco = threading.Lock()  # Escrituras al diario/snapshot, en orden
+        self._journal = None
+        self._despertar = threading.Event()
+        self._detener = False
+        self._hilo = None
+
+    # --- RECUPERACIÓN AL INICIO ---
+    def recuperar(self, semilla=None):
+        # Reconstruye los contadores desde snapshot + diario. `semilla` es el
+        # estado a usar si todavía no existe snapshot (por ejemplo los
+        # contadores que antes se guardaban en config.json).
+        snapshot_seq = 0
+        sembrado = False
+        if os.path.exists(self.ruta_snapshot):
+            with open(self.ruta_snapshot, 'r') as f:
+                snapshot = json.load(f)
+            snapshot_seq = snapshot.get("seq", 0)
+            self.libro.cargar(snapshot)
+        elif semilla:
+            self.libro.cargar(semilla)
+            sembrado = True
+
+        self.seq = snapshot_seq
+        if os.path.exists(self.ruta_journal):
+            with open(self.ruta_journal, 'r') as f:
+                for linea in f:
+                    try:
+                        registro = json.loads(linea)
+                    except ValueError:
+                        # Última línea cortada por un corte de luz: se descarta
+                        break
+                    if registro["q"] <= snapshot_seq:
+                        continue  # Ya incluido en el snapshot
+                    self._aplicar(registro)
+                    self.seq = registro["q"]
+                    self._eventos_desde_snapshot += 1
+
+        self._journal = open(self.ruta_journal, 'a')
+        if sembrado:
+            self.compactar()  # Semilla (y cola del diario) a un snapshot atómico
+        if self.intervalo_commit > 0:
+            self._hilo = threading.Thread(target=self._bucle_commit, daemon=True)
+            self._hilo.start()
+        return self.libro
+
+    def _aplicar(self, registro):
+        for periodo in registro.get("r", ()):
+            self.libro.reiniciar(periodo)
+        if "d" in registro:
+            self.libro.aplicar(registro["d"])
+
+    # --- REGISTRO DE EVENTOS ---
+    def registrar(self, tipo, deltas=None, reiniciar=()):
+        # Aplica un evento al libro de contadores y lo agrega al diario.
+        # `reiniciar` lista los períodos que vuelven a cero (apertura, cierre,
+        # cierre parcial).
+        with self._lock:
+            self.seq += 1
+            registro = {"q": self.seq, "e": tipo, "ts": round(time.time(), 3)}
+            if reiniciar:
+                registro["r"] = list(reiniciar)
+            if deltas:
+                registro["d"] = deltas
+            self._aplicar(registro)
+            self._pendientes.append(json.dumps(registro, separators=(',', ':')))
+            self._eventos_desde_snapshot += 1
+            toca_snapshot = self._eventos_desde_snapshot >= self.eventos_por_snapshot
+
+        # El disco se toca fuera de _lock: registrar() nunca espera un fsync
+        # ajeno. Con hilo de commit, la compactación también la hace el hilo.
+        if self.intervalo_commit <= 0:
+            if toca_snapshot:
+                self.compactar()
+            else:
+                self.flush()
+        elif toca_snapshot:
+            self._despertar.set()
+
+    def _tomar_pendientes(self):
+        # Intercambia la lista de eventos acumulados bajo el lock (sin E/S)
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, []
+        return pendientes
+
+    def _escribir(self, pendientes):
+        # Group commit: una sola escritura + fsync para todos los eventos acumulados
+        if not pendientes:
+            return
+        inicio = time.perf_counter()
+        self._journal.write("\n".join(pendientes) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        ESCRITURA_JOURNAL.observar(time.perf_counter() - inicio)
+
+    # Los métodos siguientes se llaman con _lock_disco tomado: así dos grupos
+    # nunca se escriben fuera de orden en el diario.
+    def _escribir_pendientes(self):
+        self._escribir(self._tomar_pendientes())
+
+    def _compactar(self):
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, []
+            snapshot = {"seq": self.seq}
+            snapshot.update(self.libro.a_dict())
+            self._eventos_desde_snapshot = 0
+        self._escribir(pendientes)
+        inicio = time.perf_counter()
+        escribir_atomico(self.ruta_snapshot, json.dumps(snapshot))
+        ESCRITURA_SNAPSHOT.observar(time.perf_counter() - inicio)
+        # Si se corta la luz antes de truncar, la recuperación salta los
+        # eventos con seq <= snapshot.seq. Los eventos registrados después de
+        # tomar el snapshot siguen en _pendientes y van al diario nuevo.
+        self._journal.close()
+        self._journal = open(self.ruta_journal, 'w')
+
+    def _bucle_commit(self):
+        while not self._detener:
+            self._despertar.wait(self.intervalo_commit)
+            self._despertar.clear()
+            with self._lock_disco:
+                if not self._journal or self._detener:
+                    continue
+                if self._eventos_desde_snapshot >= self.eventos_por_snapshot:
+                    self._compactar()
+                else:
+                    self._escribir_pendientes()
+
+    def flush(self):
+        with self._lock_disco:
+            if self._journal:
+                self._escribir_pendientes()
+
+    def compactar(self):
+        with self._lock_disco:
+            if self._journal:
+                self._compactar()
+
+    def cerrar(self):
+        # Idempotente: una segunda llamada (o sin recuperar()) no hace nada
+        self._detener = True
+        self._despertar.set()
+        if self._hilo:
+            self._hilo.join()
+            self._hilo = None
+        with self._lock_disco:
+            if self._journal is None:
+                return
+            self._compactar()
+            self._journal.close()
+            self._journal = None
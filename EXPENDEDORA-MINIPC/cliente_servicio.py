@@ -0,0 +1,161 @@
+# cliente_servicio.py - Cliente liviano del servicio de la expendedora
+#
+# La GUI no toca el hardware ni la bitácora: cada evento se manda al servicio
+# (servicio.py) por el socket Unix y la respuesta trae el libro de contadores
+# actualizado, que se copia en un libro local de solo lectura para mostrarlo.
+#
+# Cada pedido lleva un id único y el servicio descarta los repetidos, así un
+# reintento nunca aplica dos veces un evento o una compra. Igual solo se
+# reenvía cuando el pedido seguro no llegó a atenderse: falló la escritura o
+# una conexión vieja (servicio reiniciado) se cerró sin responder. Si se
+# vence el tiempo esperando la respuesta no se reenvía: el servicio puede
+# estar atendiéndolo todavía.
+
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from contadores import LibroContadores
+
+SOCKET_FILE = "expendedora.sock"
+
+
+class ErrorServicio(Exception):
+    pass
+
+
+class ClienteServicio:
+    def __init__(self, ruta_socket=SOCKET_FILE, timeout=2.0):
+        self.ruta_socket = ruta_socket
+        self.timeout = timeout
+        self.libro = LibroContadores()  # Copia local del libro del servicio
+        self.ultimo_estado = {}
+        self.usuario = None  # Empleado de la sesión; viaja en cada pedido
+        self._sock = None
+        self._archivo = None
+        self._lock = threading.Lock()
+        self._prefijo = uuid.uuid4().hex[:12]  # Ids únicos entre clientes y reinicios
+        self._ids = itertools.count(1)
+
+    def _conectar(self):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(self.timeout)
+        self._sock.connect(self.ruta_socket)
+        self._archivo = self._sock.makefile("rwb")
+
+    def _desconectar(self):
+        if self._archivo:
+            self._archivo.close()
+        if self._sock:
+            self._sock.close()
+        self._sock = None
+        self._archivo = None
+
+    def llamar(self, cmd, **datos):
+        pedido = dict(datos, cmd=cmd, id=f"{self._prefijo}-{next(self._ids)}")
+        if self.usuario:
+            pedido.setdefault("usuario", self.usuario)
+        linea = (json.dumps(pedido) + "\n").encode("utf-8")
+        with self._lock:
+            for intento in range(2):
+                reutilizada = self._sock is not None
+                enviado = False
+                try:
+                    if not reutilizada:
+                        self._conectar()
+                    self._archivo.write(linea)
+                    self._archivo.flush()
+                    enviado = True
+                    respuesta = self._archivo.readline()
+                    if not respuesta:
+                        raise ConnectionResetError("El servicio cerró la conexión")
+                    break
+                except socket.timeout:
+                    # La respuesta puede llegar tarde: se descarta la conexión
+                    # para no leerla como respuesta del pedido siguiente
+                    self._desconectar()
+                    if enviado:
+                        raise ErrorServicio("El servicio no respondió a tiempo")
+                    raise ErrorServicio("Sin conexión con el servicio: tiempo excedido")
+                except OSError as e:
+                    self._desconectar()
+                    # Reintento único: el servicio pudo haberse reiniciado y
+                    # la conexión guardada ya no sirve. Si la conexión era
+                    # nueva y el pedido salió, no se reenvía.
+                    if intento or (enviado and not reutilizada):
+                        raise ErrorServicio(f"Sin conexión con el servicio: {e}")
+
+        respuesta = json.loads(respuesta)
+        if not respuesta.get("ok"):
+            raise ErrorServicio(respuesta.get("error", "Error desconocido"))
+        if "libro" in respuesta:
+            self.libro.cargar(respuesta["libro"])
+        return respuesta
+
+    def sincronizar(self):
+        self.ultimo_estado = self.llamar("estado")
+        return self.ultimo_estado
+
+    def evento(self, tipo, deltas=None, reiniciar=(), reporte=None):
+        return self.llamar("evento", tipo=tipo, deltas=deltas, reiniciar=list(reiniciar), reporte=reporte)
+
+    def cierre(self, tipo):
+        # "cierre" o "cierre_parcial": devuelve los contadores del período cerrado
+        return self.llamar("cierre", tipo=tipo)["cerrado"]
+
+    def enviar(self, url, datos, descripcion="Datos", persistente=True, informa=None):
+        # informa: tipo de cierre cuyo reporte es este envío (queda en el historial)
+        return self.llamar("enviar", url=url, datos=datos, descripcion=descripcion,
+                           persistente=persistente, informa=informa)
+
+    def comprar(self, tipo, fichas=0, deltas=None, monto=None):
+        # Devuelve la compra encolada (o None si el crédito no alcanza una ficha)
+        if tipo == "billete":
+            return self.llamar("comprar", tipo=tipo, monto=monto)["compra"]
+        return self.llamar("comprar", tipo=tipo, fichas=fichas, deltas=deltas)["compra"]
+
+    def dispensar(self, cantidad):
+        return self.llamar("dispensar", cantidad=cantidad)
+
+    def historial(self, consulta, **parametros):
+        return self.llamar("historial", consulta=consulta, **parametros)["filas"]
+
+    def trazas(self, **parametros):
+        # traza="..." para una compra, ultimos=N para los N tramos más nuevos
+        return self.llamar("trazas", **parametros)["tramos"]
+
+    def perfil(self, activar=None):
+        return self.llamar("perfil", activar=activar)
+
+    def cerrar(self):
+        with self._lock:
+            self._desconectar()
+
+
+def iniciar_servicio_si_falta(ruta_socket=SOCKET_FILE, espera=10.0):
+    # Si no hay servicio escuchando, lo lanza en su propia sesión para que
+    # sobreviva a un cierre o caída de la GUI
+    cliente = ClienteServicio(ruta_socket)
+    try:
+        cliente.sincronizar()
+        return cliente
+    except ErrorServicio:
+        pass
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "servicio.py")
+    subprocess.Popen([sys.executable, script], start_new_session=True)
+    limite = time.monotonic() + espera
+    while True:
+        try:
+            cliente.sincronizar()
+            return cliente
+        except ErrorServicio:
+            if time.monotonic() > limite:
+                raise
+            time.sleep(0.1)
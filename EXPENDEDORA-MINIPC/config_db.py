@@ -0,0 +1,101 @@
+# config_db.py - Configuración en SQLite con una sola conexión y caché en memoria
+#
+# Antes cada get_config abría y cerraba su propia conexión (seis por billete en
+# convertir_fichas). Acá se mantiene una conexión abierta en modo WAL y toda la
+# tabla config (son pocas filas) se lee de una vez a un diccionario. set_config
+# escribe en la base e invalida la caché.
+
+import sqlite3
+import threading
+
+DB_FILE = "expendedora.db"
+
+# Escalones de precio: (clave del valor, valor por defecto, clave de fichas, fichas por defecto)
+TARIFAS = (
+    ("VALOR1", 1000, "FICHAS1", 1),
+    ("VALOR2", 5000, "FICHAS2", 2),
+    ("VALOR3", 10000, "FICHAS3", 5),
+)
+
+
+class ConfigDB:
+    def __init__(self, db_file=DB_FILE):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._cache = None
+        self._tarifas = None
+
+        # La conexión se comparte entre hilos, siempre bajo self._lock
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS config (clave TEXT PRIMARY KEY, valor INTEGER)''')
+        self._conn.commit()
+
+    def _cargar(self):
+        # Una sola consulta para toda la tabla
+        if self._cache is None:
+            self._cache = dict(self._conn.execute("SELECT clave, valor FROM config"))
+        return self._cache
+
+    def get(self, clave, default=0):
+        with self._lock:
+            return self._cargar().get(clave, default)
+
+    def set(self, clave, valor):
+        with self._lock:
+            self._conn.execute("INSERT INTO config (clave, valor) VALUES (?, ?) ON CONFLICT(clave) DO UPDATE SET valor=?", (clave, valor, valor))
+            self._conn.commit()
+            self._cache = None
+            self._tarifas = None
+
+    def obtener_tarifas(self):
+        # Lista de (valor, fichas) de todos los escalones, cacheada hasta el próximo set().
+        # Con la lista ya armada no hace falta el lock: leer el atributo es atómico
+        # y set() solo lo reemplaza por None.
+        tarifas = self._tarifas
+        if tarifas is not None:
+            return tarifas
+        with self._lock:
+            if self._tarifas is None:
+                config = self._cargar()
+                self._tarifas = [(config.get(clave_valor, valor), config.get(clave_fichas, fichas))
+                                 for clave_valor, valor, clave_fichas, fichas in TARIFAS]
+            return self._tarifas
+
+    def cerrar(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    # Micro-benchmark: latencia de leer las tarifas de una conversión antes
+    # (seis conexiones por billete) y después (conexión + caché)
+    import os
+    import tempfile
+    import time
+
+    db = os.path.join(tempfile.mkdtemp(), "bench.db")
+    store = ConfigDB(db)
+    for clave_valor, valor, clave_fichas, fichas in TARIFAS:
+        store.set(clave_valor, valor)
+        store.set(clave_fichas, fichas)
+
+    def get_config_anterior(clave, default=0):
+        conn = sqlite3.connect(db)
+        cursor = conn.cursor()
+        cursor.execute("SELECT valor FROM config WHERE clave=?", (clave,))
+        row = cursor.fetchone()
+        conn.close()
+        return row[0] if row else default
+
+    def conversion_anterior():
+        return [(get_config_anterior(clave_valor, valor), get_config_anterior(clave_fichas, fichas))
+                for clave_valor, valor, clave_fichas, fichas in TARIFAS]
+
+    assert conversion_anterior() == store.obtener_tarifas()
+    for nombre, funcion, n in [("antes (6 conexiones)", conversion_anterior, 2000),
+                               ("después (caché)", store.obtener_tarifas, 200000)]:
+        inicio = time.perf_counter()
+        for _ in range(n):
+            funcion()
+        print(f"{nombre}: {(time.perf_counter() - inicio) / n * 1e6:.2f} µs por conversión")
@@ -0,0 +1,68 @@
+# configuracion.py - config.json parseado una vez y recargado solo si cambia
+#
+# La GUI edita config.json desde otro proceso, así que no alcanza con leerlo
+# al arrancar. obtener() devuelve el diccionario ya parseado y como mucho una
+# vez cada `revision` segundos hace un stat: solo si cambió el mtime o el
+# tamaño lo vuelve a leer. El diccionario devuelto es compartido y no debe
+# modificarse; para cambiar la configuración se arma una copia y se llama a
+# guardar(), que escribe de forma atómica.
+#
+# Como cada recarga devuelve un diccionario nuevo, quien derive algo de la
+# configuración (la tabla de precios) puede compararlo por identidad.
+
+import json
+import os
+import threading
+import time
+
+from bitacora import escribir_atomico
+
+
+class ArchivoConfiguracion:
+    def __init__(self, ruta, por_defecto=None, revision=1.0):
+        self.ruta = ruta
+        self.por_defecto = por_defecto or {}
+        self.revision = revision  # Segundos mínimos entre dos stat
+        self.recargas = 0
+        self._lock = threading.Lock()
+        self._config = None
+        self._firma = None  # (st_mtime_ns, st_size) del archivo leído
+        self._proxima_revision = 0.0
+
+    def _firma_actual(self):
+        try:
+            estado = os.stat(self.ruta)
+        except FileNotFoundError:
+            return None
+        return estado.st_mtime_ns, estado.st_size
+
+    def obtener(self):
+        ahora = time.monotonic()
+        if self._config is not None and ahora < self._proxima_revision:
+            return self._config
+        with self._lock:
+            self._proxima_revision = ahora + self.revision
+            firma = self._firma_actual()
+            if self._config is None or firma != self._firma:
+                self._config = self._leer(firma)
+                self._firma = firma
+                self.recargas += 1
+            return self._config
+
+    def _leer(self, firma):
+        if firma is None:
+            return dict(self.por_defecto)
+        try:
+            with open(self.ruta, 'r') as f:
+                return json.load(f)
+        except ValueError as e:
+            # Archivo a medio escribir por un editor sin rename: se conserva lo anterior
+            print(f"config.json inválido, se mantiene la configuración anterior: {e}")
+            return self._config if self._config is not None else dict(self.por_defecto)
+
+    def guardar(self, config):
+        with self._lock:
+            escribir_atomico(self.ruta, json.dumps(config, indent=4))
+            self._config = config
+            self._firma = self._firma_actual()
+            self._proxima_revision = time.monotonic() + self.revision
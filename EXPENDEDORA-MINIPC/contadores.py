@@ -0,0 +1,71 @@
+# contadores.py - Libro único de contadores de la expendedora
+#
+# Antes cada evento se sumaba a mano en tres diccionarios (contadores,
+# contadores_apertura y contadores_parciales). Acá cada evento se aplica una
+# sola vez a los totales históricos, guardados en posiciones fijas de una
+# lista. Los contadores desde la apertura y desde el último cierre parcial son
+# vistas: total - base del período. Reiniciar un período solo copia los totales
+# actuales como nueva base.
+
+CLAVES = (
+    "fichas_expendidas",
+    "dinero_ingresado",
+    "promo1_contador",
+    "promo2_contador",
+    "promo3_contador",
+    "fichas_restantes"
+)
+INDICE = {clave: i for i, clave in enumerate(CLAVES)}
+
+TOTAL = "contadores"
+APERTURA = "contadores_apertura"
+PARCIAL = "contadores_parciales"
+PERIODOS = (TOTAL, APERTURA, PARCIAL)
+
+
+class LibroContadores:
+    __slots__ = ("totales", "bases")
+
+    def __init__(self):
+        self.totales = [0] * len(CLAVES)
+        self.bases = {APERTURA: [0] * len(CLAVES), PARCIAL: [0] * len(CLAVES)}
+
+    def aplicar(self, deltas):
+        totales = self.totales
+        for clave, delta in deltas.items():
+            totales[INDICE[clave]] += delta
+
+    def reiniciar(self, periodo):
+        # El período vuelve a cero sin tocar los totales
+        self.bases[periodo] = list(self.totales)
+
+    def valor(self, clave, periodo=TOTAL):
+        i = INDICE[clave]
+        if periodo == TOTAL:
+            return self.totales[i]
+        return self.totales[i] - self.bases[periodo][i]
+
+    def vista(self, periodo=TOTAL):
+        if periodo == TOTAL:
+            return dict(zip(CLAVES, self.totales))
+        return {clave: total - base for clave, total, base in zip(CLAVES, self.totales, self.bases[periodo])}
+
+    # --- SERIALIZACIÓN ---
+    def a_dict(self):
+        return {
+            TOTAL: self.vista(TOTAL),
+            "bases": {periodo: dict(zip(CLAVES, base)) for periodo, base in self.bases.items()}
+        }
+
+    def cargar(self, datos):
+        # Acepta el formato propio (totales + bases) y el viejo de config.json
+        # (un diccionario completo por período)
+        totales = datos.get(TOTAL) or {}
+        self.totales = [totales.get(clave, 0) for clave in CLAVES]
+        bases = datos.get("bases") or {}
+        for periodo in (APERTURA, PARCIAL):
+            if periodo in bases:
+                self.bases[periodo] = [bases[periodo].get(clave, 0) for clave in CLAVES]
+            else:
+                vista = datos.get(periodo) or {}
+                self.bases[periodo] = [total - vista.get(clave, 0) for clave, total in zip(CLAVES, self.totales)]
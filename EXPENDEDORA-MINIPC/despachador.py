@@ -0,0 +1,148 @@
+# despachador.py - Hilo de entrega de fichas con cola de compras
+#
+# Las compras (promo, monto manual o crédito de billete) se encolan y un único
+# hilo las entrega en orden con el hopper. Quien encola no se bloquea, así que
+# un cliente puede pagar una segunda compra mientras la primera sigue saliendo.
+# El avance se informa con callbacks que corren en el hilo de entrega:
+#   al_entregar(compra)            después de cada ficha
+#   al_terminar(compra, resultado) con el resumen de Hopper.dispensar
+#
+# Cada compra lleva el id de traza de quien la encoló (trazas.py); el hilo de
+# entrega lo adopta y deja tramos de espera en cola, entrega y cada ficha.
+
+import itertools
+import queue
+import threading
+import time
+
+from trazas import obtener_trazador
+
+TIPOS_COMPRA = ("promo", "manual", "billete")
+
+
+class Despachador:
+    def __init__(self, hopper, al_entregar=None, al_terminar=None):
+        self.hopper = hopper
+        self.al_entregar = al_entregar
+        self.al_terminar = al_terminar
+
+        self._cola = queue.Queue()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()  # Protege en_curso, _pendientes y "entregadas"
+        self._pendientes = []  # Compras en la cola, en orden de llegada
+        self.en_curso = None
+        self._hilo = None
+        self._ultima_ficha = 0.0
+
+    def iniciar(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, daemon=True)
+            self._hilo.start()
+        return self
+
+    def detener(self, timeout=None):
+        # Termina después de las compras ya encoladas. Devuelve False si el
+        # hilo sigue vivo al vencer el timeout (una entrega que no termina);
+        # se puede volver a llamar para seguir esperándolo.
+        if self._hilo:
+            self._cola.put(None)
+            self._hilo.join(timeout)
+            if self._hilo.is_alive():
+                return False
+            self._hilo = None
+        return True
+
+    def descartar_pendientes(self):
+        # Saca de la cola las compras que todavía no empezaron; sus fichas
+        # siguen en fichas_restantes. Devuelve cuántas fichas quedaron sin entregar.
+        descartadas = 0
+        detener = False
+        with self._lock:
+            while True:
+                try:
+                    compra = self._cola.get_nowait()
+                except queue.Empty:
+                    break
+                self._cola.task_done()
+                if compra is None:
+                    detener = True
+                else:
+                    self._pendientes.remove(compra)
+                    descartadas += compra["fichas"]
+        if detener:
+            self._cola.put(None)  # La señal de detener salió junto con las compras
+        return descartadas
+
+    def encolar(self, tipo, fichas, **datos):
+        # Devuelve una copia de la compra con su id para seguirla en estado()
+        if tipo not in TIPOS_COMPRA:
+            raise ValueError(f"Tipo de compra desconocido: {tipo}")
+        fichas = int(fichas)
+        if fichas <= 0:
+            raise ValueError("La compra debe tener al menos una ficha")
+        trazador = obtener_trazador()
+        traza = trazador.actual()
+        if traza is None:
+            traza = trazador.nueva_traza()  # SIN_MUESTRA también es una traza ya decidida
+        compra = dict(datos, id=next(self._ids), tipo=tipo, fichas=fichas, entregadas=0,
+                      traza=traza, encolada=time.time())
+        with self._lock:
+            self._pendientes.append(compra)
+        self._cola.put(compra)
+        return dict(compra)
+
+    def estado(self):
+        with self._lock:
+            return {
+                "en_curso": dict(self.en_curso) if self.en_curso else None,
+                "en_cola": [dict(compra) for compra in self._pendientes]
+            }
+
+    def fichas_por_entregar(self):
+        # Fichas de la compra en curso y de la cola que todavía no salieron
+        with self._lock:
+            compras = self._pendientes + ([self.en_curso] if self.en_curso else [])
+            return sum(compra["fichas"] - compra["entregadas"] for compra in compras)
+
+    def esperar(self):
+        # Bloquea hasta que no queden compras por entregar
+        self._cola.join()
+
+    def _bucle(self):
+        while True:
+            compra = self._cola.get()
+            try:
+                if compra is None:
+                    return
+                with self._lock:
+                    self._pendientes.remove(compra)
+                    self.en_curso = compra
+                trazador = obtener_trazador()
+                trazador.usar(compra["traza"])
+                trazador.registrar("espera_cola", compra["encolada"], time.time() - compra["encolada"])
+                self._ultima_ficha = time.perf_counter()
+                with trazador.tramo("entrega", fichas=compra["fichas"]):
+                    resultado = self.hopper.dispensar(compra["fichas"], lambda: self._ficha_entregada(compra))
+                with self._lock:
+                    self.en_curso = None
+                if self.al_terminar:
+                    self.al_terminar(dict(compra), resultado)
+            except Exception as e:
+                print(f"Error al entregar la compra {compra['id']}: {e}")
+            finally:
+                with self._lock:
+                    self.en_curso = None
+                obtener_trazador().usar(None)
+                self._cola.task_done()
+
+    def _ficha_entregada(self, compra):
+        ahora = time.perf_counter()
+        duracion, self._ultima_ficha = ahora - self._ultima_ficha, ahora
+        with self._lock:
+            compra["entregadas"] += 1
+            copia = dict(compra)
+        trazador = obtener_trazador()
+        if trazador.registrando():
+            trazador.registrar("ficha", time.time() - duracion, duracion, n=copia["entregadas"])
+        if self.al_entregar:
+            self.al_entregar(copia)
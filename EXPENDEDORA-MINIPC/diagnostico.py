@@ -0,0 +1,390 @@
+# diagnostico.py - Captura de alta frecuencia del hopper para diagnóstico
+#
+# Con "diagnostico": {"activo": true} en config.json cada hopper muestrea su
+# sensor, la barrera y su salida de motor a `frecuencia` Hz mientras entrega
+# fichas. Las muestras van a un buffer circular de arrays preasignados (un
+# tiempo y un byte con los tres niveles por muestra): muestrear no crea
+# objetos nuevos ni crece la memoria.
+#
+# Cuando pasa algo raro se vuelca el buffer a un archivo binario, con
+# `posterior` segundos más después del disparo. El muestreo solo copia el
+# buffer (memcpy de los arrays); el archivo lo escribe otro hilo, así no queda
+# un hueco en las muestras mientras se escribe. Disparan un volcado:
+#   - "timeout": el hopper esperó un pulso que no llegó.
+#   - "pulso_largo": el sensor quedó activo más de `ancho_maximo` segundos
+#     (ficha trabada frente al sensor o sensor sucio).
+#   - "conteo": los flancos vistos en las muestras no coinciden con las
+#     fichas que contó el sensor por interrupción (doble caída o rebote). Se
+#     compara al terminar la ventana posterior, cuando el muestreo ya vio
+#     todos los flancos de la entrega.
+#
+# Formato del archivo (little endian):
+#   "EXPD", versión (H), largo del encabezado JSON (I), encabezado JSON,
+#   microsegundos desde la primera muestra (I por muestra), niveles (B por
+#   muestra; bit 0 sensor, bit 1 barrera, bit 2 motor).
+#
+#   python diagnostico.py captura.bin [...]  -> anchos de pulso por canal
+#   python diagnostico.py --demo             -> captura simulada con anomalías
+
+import json
+import os
+import queue
+import struct
+import threading
+import time
+from array import array
+from datetime import datetime
+
+from metricas import obtener_registro
+from reloj import RELOJ_REAL
+
+MAGIA = b"EXPD"
+VERSION = 1
+CANALES = ("sensor", "barrera", "motor")
+ACTIVO_EN = (0, 0, 1)  # Sensor y barrera activos en bajo, motor en alto
+
+CONFIG_POR_DEFECTO = {
+    "frecuencia": 2000,  # Muestras por segundo
+    "segundos": 8.0,  # Historia que guarda el buffer (más que tiempo_espera_ficha)
+    "posterior": 0.5,  # Segundos que se siguen capturando después de un disparo
+    "ancho_maximo": 0.06,  # Segundos máximos de un pulso normal del sensor
+    "carpeta": "diagnostico"
+}
+
+VOLCADOS = obtener_registro().contador(
+    "expendedora_diagnostico_volcados_total", "Capturas de diagnóstico del hopper volcadas a disco")
+
+
+class CapturaDiagnostico:
+    def __init__(self, gpio, pin_sensor, pin_barrera, pin_motor, hopper="principal", reloj=RELOJ_REAL, **config):
+        self.gpio = gpio
+        self.pines = (pin_sensor, pin_barrera, pin_motor)
+        self.hopper = hopper
+        self.reloj = reloj
+
+        opciones = dict(CONFIG_POR_DEFECTO)
+        opciones.update(config)
+        self.frecuencia = opciones["frecuencia"]
+        self.posterior = opciones["posterior"]
+        self.ancho_maximo = opciones["ancho_maximo"]
+        self.carpeta = opciones["carpeta"]
+
+        # Buffer circular: se escribe en _indice y da la vuelta al llenarse
+        self.capacidad = int(self.frecuencia * opciones["segundos"])
+        self._tiempos = array("d", bytes(8 * self.capacidad))
+        self._niveles = array("B", bytes(self.capacidad))
+        self._indice = 0
+        self._llenas = 0
+
+        self.volcados = []  # Rutas de los archivos escritos
+        self._numero_volcado = 0
+        self._escrituras = queue.Queue()
+        self._escritor = None
+        self._activa = False
+        self._hasta = None  # Fin de la captura (None: entrega en curso)
+        self._motivo = None  # Disparo pendiente de volcar
+        self._volcar_en = None
+        self._bajo_desde = None  # Comienzo del pulso actual del sensor
+        self._pulso_largo = False
+        self._flancos = 0  # Flancos del sensor vistos en las muestras
+        self._pulsos_inicio = None  # None: no hay conteo abierto
+        self._flancos_inicio = 0
+        self._pulsos_fin = None
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._hilo = None
+
+    # --- Control desde el hopper ---
+
+    def iniciar(self, pulsos_sensor):
+        # Comienza (o extiende) la captura al arrancar una entrega. Si llega
+        # dentro de la ventana posterior de la anterior, el conteo sigue
+        # abierto desde la primera y se compara al final de la captura.
+        with self._lock:
+            if self._pulsos_inicio is None:
+                self._pulsos_inicio = pulsos_sensor
+                self._flancos_inicio = self._flancos
+            self._hasta = None
+            if self._activa:
+                return
+            self._activa = True
+        if hasattr(self.reloj, "programar"):
+            # Reloj virtual: cada muestra es un evento, sin hilos
+            self.reloj.programar(0.0, self._muestra_programada)
+        else:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, daemon=True, name=f"diagnostico {self.hopper}")
+                self._hilo.start()
+            self._despertar.set()
+
+    def terminar(self, pulsos_sensor):
+        # Fin de la entrega: los flancos se comparan con estos pulsos cuando
+        # termina la ventana posterior (el muestreo puede ir atrasado)
+        with self._lock:
+            self._pulsos_fin = pulsos_sensor
+            self._hasta = self.reloj.monotonic() + self.posterior
+
+    def disparar(self, motivo, detalle=""):
+        # Agenda un volcado; mientras hay uno pendiente los demás disparos se ignoran
+        with self._lock:
+            if self._motivo is not None or not self._activa:
+                return
+            self._motivo = motivo
+            self._volcar_en = self.reloj.monotonic() + self.posterior
+        print(f"Diagnóstico {self.hopper}: {motivo}{': ' + detalle if detalle else ''}")
+
+    # --- Muestreo ---
+
+    def _muestrear(self):
+        # Una muestra; devuelve False cuando la captura terminó
+        ahora = self.reloj.monotonic()
+        entrada = self.gpio.input
+        sensor = entrada(self.pines[0])
+        nivel = (1 if sensor else 0) | (2 if entrada(self.pines[1]) else 0) | (4 if entrada(self.pines[2]) else 0)
+
+        i = self._indice
+        self._tiempos[i] = ahora
+        anterior = self._niveles[i - 1] if self._llenas else 1
+        self._niveles[i] = nivel
+        self._indice = i + 1 if i + 1 < self.capacidad else 0
+        if self._llenas < self.capacidad:
+            self._llenas += 1
+
+        if not sensor:
+            if anterior & 1:
+                self._flancos += 1
+                self._bajo_desde = ahora
+                self._pulso_largo = False
+            elif not self._pulso_largo and ahora - self._bajo_desde > self.ancho_maximo:
+                self._pulso_largo = True
+                self.disparar("pulso_largo", f"sensor activo más de {self.ancho_maximo * 1000:.0f} ms")
+
+        if self._volcar_en is not None and ahora >= self._volcar_en:
+            self.volcar()
+        if self._hasta is not None and ahora >= self._hasta:
+            detalle = None
+            with self._lock:
+                terminada = self._hasta is not None and ahora >= self._hasta
+                if terminada:
+                    self._activa = False
+                    flancos = self._flancos - self._flancos_inicio
+                    pulsos = self._pulsos_fin - self._pulsos_inicio
+                    self._pulsos_inicio = None
+                    if flancos != pulsos and self._motivo is None:
+                        self._motivo = "conteo"
+                        detalle = f"{flancos} flancos muestreados, {pulsos} pulsos contados"
+            if terminada:
+                if detalle:
+                    print(f"Diagnóstico {self.hopper}: conteo: {detalle}")
+                if self._motivo is not None:
+                    self.volcar()  # Disparo al final de la entrega
+                return False
+        return True
+
+    def _muestra_programada(self):
+        if self._muestrear():
+            self.reloj.programar(1 / self.frecuencia, self._muestra_programada)
+
+    def _bucle(self):
+        # Hardware real: muestras a intervalos fijos contra un plazo absoluto
+        periodo = 1 / self.frecuencia
+        while True:
+            self._despertar.wait()
+            self._despertar.clear()
+            proximo = time.monotonic()
+            while self._muestrear():
+                proximo += periodo
+                espera = proximo - time.monotonic()
+                if espera > 0:
+                    time.sleep(espera)
+                elif espera < -10 * periodo:
+                    proximo = time.monotonic()  # Muy atrasado: no recuperar en ráfaga
+
+    # --- Volcado ---
+
+    def _copiar(self):
+        # Copia cronológica del buffer: slices de array, sin objetos por muestra
+        if self._llenas < self.capacidad:
+            return self._tiempos[:self._llenas], self._niveles[:self._llenas]
+        i = self._indice
+        return self._tiempos[i:] + self._tiempos[:i], self._niveles[i:] + self._niveles[:i]
+
+    def muestras(self):
+        # (tiempos, niveles) en orden cronológico
+        tiempos, niveles = self._copiar()
+        return list(tiempos), list(niveles)
+
+    def volcar(self):
+        # Copia el buffer y deja la escritura al hilo escritor; devuelve la
+        # ruta que tendrá el archivo (esperar_volcados() para que exista)
+        motivo = self._motivo or "manual"
+        self._motivo = None
+        self._volcar_en = None
+        tiempos, niveles = self._copiar()
+        if not tiempos:
+            return None
+        fecha = datetime.now()
+        self._numero_volcado += 1
+        # Microsegundos + número de volcado: dos volcados seguidos no se pisan
+        ruta = os.path.join(self.carpeta, f"diag_{self.hopper}_{fecha:%Y%m%d_%H%M%S_%f}_"
+                                          f"{self._numero_volcado}_{motivo}.bin")
+        if self._escritor is None:
+            self._escritor = threading.Thread(target=self._bucle_escritura, daemon=True,
+                                              name=f"diagnostico {self.hopper} escritura")
+            self._escritor.start()
+        self._escrituras.put((ruta, motivo, fecha, tiempos, niveles))
+        return ruta
+
+    def esperar_volcados(self):
+        # Bloquea hasta que todos los volcados pedidos estén en disco
+        self._escrituras.join()
+
+    def _bucle_escritura(self):
+        while True:
+            volcado = self._escrituras.get()
+            try:
+                self._escribir(*volcado)
+            except OSError as e:
+                print(f"Diagnóstico {self.hopper}: no se pudo escribir {volcado[0]}: {e}")
+            finally:
+                self._escrituras.task_done()
+
+    def _escribir(self, ruta, motivo, fecha, tiempos, niveles):
+        encabezado = json.dumps({
+            "hopper": self.hopper,
+            "motivo": motivo,
+            "fecha": fecha.strftime("%Y-%m-%d %H:%M:%S"),
+            "frecuencia": self.frecuencia,
+            "canales": CANALES,
+            "pines": self.pines,
+            "activo_en": ACTIVO_EN
+        }).encode("utf-8")
+        micros = array("I", (min(int((t - tiempos[0]) * 1e6), 0xFFFFFFFF) for t in tiempos))
+
+        os.makedirs(self.carpeta, exist_ok=True)
+        with open(ruta, "xb") as f:
+            f.write(MAGIA + struct.pack("<HI", VERSION, len(encabezado)) + encabezado)
+            f.write(micros.tobytes())
+            f.write(niveles.tobytes())
+        self.volcados.append(ruta)
+        VOLCADOS.inc()
+        print(f"Diagnóstico {self.hopper}: {len(tiempos)} muestras volcadas en {ruta}")
+
+
+def leer(ruta):
+    # (encabezado, segundos, niveles) de un archivo de captura
+    with open(ruta, "rb") as f:
+        datos = f.read()
+    if datos[:4] != MAGIA:
+        raise ValueError(f"{ruta} no es una captura de diagnóstico")
+    version, largo = struct.unpack_from("<HI", datos, 4)
+    if version != VERSION:
+        raise ValueError(f"Versión de captura no soportada: {version}")
+    inicio = 10 + largo
+    encabezado = json.loads(datos[10:inicio])
+    cantidad = (len(datos) - inicio) // 5
+    micros = array("I")
+    micros.frombytes(datos[inicio:inicio + 4 * cantidad])
+    niveles = array("B")
+    niveles.frombytes(datos[inicio + 4 * cantidad:inicio + 5 * cantidad])
+    return encabezado, [m / 1e6 for m in micros], niveles
+
+
+def _percentil(valores, p):
+    return valores[min(len(valores) - 1, int(p * len(valores)))]
+
+
+def analizar(ruta):
+    # Anchos de pulso (ms) por canal y separación entre fichas del sensor
+    encabezado, segundos, niveles = leer(ruta)
+    informe = {"archivo": ruta, "motivo": encabezado["motivo"], "hopper": encabezado["hopper"],
+               "muestras": len(segundos), "duracion": segundos[-1] if segundos else 0.0, "canales": {}}
+    for bit, (canal, activo) in enumerate(zip(encabezado["canales"], encabezado["activo_en"])):
+        anchos, inicios = [], []
+        desde = None
+        for t, nivel in zip(segundos, niveles):
+            encendido = (nivel >> bit & 1) == activo
+            if encendido and desde is None:
+                desde = t
+            elif not encendido and desde is not None:
+                anchos.append((t - desde) * 1000)
+                inicios.append(desde)
+                desde = None
+        separaciones = [(b - a) * 1000 for a, b in zip(inicios, inicios[1:])]
+        informe["canales"][canal] = {"pulsos": len(anchos), "anchos_ms": anchos, "separaciones_ms": separaciones}
+    return informe
+
+
+def imprimir(informe, columnas=40):
+    print(f"{informe['archivo']}: hopper {informe['hopper']}, motivo {informe['motivo']}, "
+          f"{informe['muestras']} muestras en {informe['duracion']:.2f} s")
+    for canal, datos in informe["canales"].items():
+        anchos = sorted(datos["anchos_ms"])
+        if not anchos:
+            print(f"  {canal}: sin pulsos")
+            continue
+        print(f"  {canal}: {datos['pulsos']} pulsos, ancho min {anchos[0]:.1f} / p50 {_percentil(anchos, 0.5):.1f} / "
+              f"p90 {_percentil(anchos, 0.9):.1f} / max {anchos[-1]:.1f} ms")
+        separaciones = sorted(datos["separaciones_ms"])
+        if separaciones:
+            print(f"    separación min {separaciones[0]:.1f} / p50 {_percentil(separaciones, 0.5):.1f} / "
+                  f"max {separaciones[-1]:.1f} ms")
+        if canal == "sensor":
+            # Histograma de anchos en 10 cubetas
+            paso = max((anchos[-1] - anchos[0]) / 10, 0.5)
+            cubetas = [0] * 10
+            for ancho in anchos:
+                cubetas[min(9, int((ancho - anchos[0]) / paso))] += 1
+            mayor = max(cubetas)
+            for i, cuenta in enumerate(cubetas):
+                if cuenta:
+                    desde = anchos[0] + i * paso
+                    print(f"    {desde:6.1f}-{desde + paso:6.1f} ms {cuenta:5d} {'#' * max(1, cuenta * columnas // mayor)}")
+
+
+if __name__ == "__main__":
+    import argparse
+    import contextlib
+    import io
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Análisis de capturas de diagnóstico del hopper")
+    parser.add_argument("archivos", nargs="*", help="Capturas .bin a analizar")
+    parser.add_argument("--demo", action="store_true", help="Simular entregas con anomalías y analizarlas")
+    argumentos = parser.parse_args()
+
+    archivos = list(argumentos.archivos)
+    if argumentos.demo:
+        from gpio_sim import GPIO, HopperSimulado
+        from hopper import Hopper
+        from sensor_hopper import SensorHopper
+
+        SALIDA, ENTHOPER, BARRERA = 24, 23, 34
+        GPIO.reiniciar()
+        for pin in (ENTHOPER, BARRERA):
+            GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        GPIO.setup(SALIDA, GPIO.OUT)
+        simulado = GPIO.conectar(HopperSimulado(SALIDA, ENTHOPER, fichas=1000, inercia=0.12))
+        hopper = Hopper(GPIO, SALIDA, SensorHopper(GPIO, ENTHOPER, reloj=GPIO.reloj), reloj=GPIO.reloj,
+                        tiempo_espera_ficha=1)
+        carpeta = tempfile.mkdtemp(prefix="diagnostico_")
+        hopper.diagnostico = CapturaDiagnostico(GPIO, ENTHOPER, BARRERA, SALIDA, reloj=GPIO.reloj, carpeta=carpeta)
+
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            hopper.dispensar(15)  # Normal: sin volcado
+            simulado.ancho_pulso = 0.08  # Ficha que tapa el sensor
+            hopper.dispensar(5)
+            simulado.ancho_pulso = 0.02
+            simulado.atasco_en = simulado.entregadas + 3
+            hopper.dispensar(10)  # Atasco: timeout
+            GPIO.reloj.avanzar(1)
+            hopper.diagnostico.esperar_volcados()
+        print(f"Demo: {GPIO.reloj.ahora:.1f} s virtuales en {time.perf_counter() - inicio:.2f} s reales, "
+              f"{len(hopper.diagnostico.volcados)} volcados en {carpeta}")
+        archivos += hopper.diagnostico.volcados
+
+    for archivo in archivos:
+        imprimir(analizar(archivo))
+    if not archivos:
+        parser.print_help()
@@ -1,31 +1,53 @@
-from expendedora_gui import ExpendedoraGUI
 from gpio_sim import GPIO #import rpi.GPIO as GPIO  # Descomentar para usar en hardware real
 # from gpio_sim import GPIO  # Simulación de GPIO para pruebas sin hardware
-import time
-import requests
-import sqlite3
+from sensor_hopper import SensorHopper
+from hopper import ESTADO_VACIO_O_ATASCADO, GrupoHoppers, Hopper
+from billetero import DecodificadorPulsos
+from reloj import RELOJ_REAL
+import telemetria
+from planificador import obtener_planificador
+from config_db import ConfigDB
+from configuracion import ArchivoConfiguracion
+from registro_diario import RegistroDiario
+from metricas import CUBETAS_MICRO, obtener_registro
+from trazas import obtener_trazador
+import precios
 import threading
-import tkinter as tk
-import json
-import os
-from datetime import datetime
+import time
 
 config_file = "config.json"
 registro_file = "registro.json"
 
 # --- CONFIGURACIÓN DE PINES ---
-ECOIN = 35  
-SALIDA = 24  
-AC = 16  
-BOTON_ENTREGA = 26  
-TEST = 4
-TEST1 = 34
-TEST2 = 35
-ENTHOPER = 23  # Sensor para contar fichas
-SALHOPER = 12  
-BOTON = 36  
-SAL1 = 0  
-BARRERA = 34  
+# Valores por defecto; config.json ("pines") puede cambiar cualquiera por nombre
+PINES_POR_DEFECTO = {
+    "ECOIN": 35,
+    "SALIDA": 24,
+    "AC": 16,
+    "BOTON_ENTREGA": 26,
+    "TEST": 4,
+    "TEST1": 34,
+    "TEST2": 35,
+    "ENTHOPER": 23,  # Sensor para contar fichas
+    "SALHOPER": 12,
+    "BOTON": 36,
+    "SAL1": 0,  # Motor del segundo hopper en los gabinetes que lo tienen
+    "BARRERA": 34
+}
+
+# --- HOPPERS ---
+# config.json "hoppers": lista de {"nombre", "motor", "sensor"} y opcionalmente
+# "reversa" (pin que invierte el motor para destrabar), cada uno un número de
+# pin o un nombre de la tabla de pines; cualquier otra clave pisa los tiempos
+# de "hopper" para ese hopper. Ejemplo con dos:
+#   [{"nombre": "principal", "motor": "SALIDA", "sensor": "ENTHOPER"},
+#    {"nombre": "secundario", "motor": "SAL1", "sensor": 25}]
+# Con más de uno las entregas se reparten entre todos (hopper.GrupoHoppers).
+HOPPERS_POR_DEFECTO = [{"nombre": "principal", "motor": "SALIDA", "sensor": "ENTHOPER"}]
+
+# --- TIEMPOS DEL SENSOR DEL HOPPER ---
+# (los tiempos del motor se configuran en config.json, sección "hopper")
+DEBOUNCE_SENSOR = 0.005  # Segundos mínimos entre dos pulsos de ENTHOPER
 
 # --- CONFIGURACIÓN DE LA BASE DE DATOS ---
 DB_FILE = "expendedora.db"
@@ -33,6 +55,8 @@ DB_FILE = "expendedora.db"
 # --- CONFIGURACIÓN DE SERVIDORES ---
 SERVER_HEARTBEAT = "http://192.168.1.35/esp32_project/insert_heartbeat.php"
 SERVER_CIERRE = "http://192.168.1.35/esp32_project/insert_close_expendedora.php"
+INTERVALO_HEARTBEAT = 60  # Segundos entre heartbeats
+JITTER_HEARTBEAT = 5  # Desfase al azar para no coincidir con otras máquinas
 
 # --- VARIABLES DEL SISTEMA ---
 cuenta = 0
@@ -42,102 +66,187 @@ r_sal = 0
 promo1_count = 0
 promo2_count = 0
 promo3_count = 0
+# cuenta y fichas se tocan desde el hilo de entrega, el del servicio y el
+# planificador: toda lectura-modificación-escritura va bajo este lock
+lock_contadores = threading.RLock()
 
 # ----------CONEXION CON GUI Y LOGICA PARA GUARDAR REGISTROS---------------
+# config.json se parsea una vez y se recarga solo si cambia (configuracion.py).
+# El diccionario es compartido: no modificarlo, guardar una copia.
+configuracion = ArchivoConfiguracion(config_file, por_defecto={"promociones": {}, "valor_ficha": 1.0})
+
 def cargar_configuracion():
-    if os.path.exists(config_file):
-        with open(config_file, 'r') as f:
-            return json.load(f)
-    else:
-        return {"promociones": {}, "valor_ficha": 1.0}
+    return configuracion.obtener()
 
 def guardar_configuracion(config):
-    with open(config_file, 'w') as f:
-        json.dump(config, f, indent=4)
+    configuracion.guardar(config)
+
+pines = dict(PINES_POR_DEFECTO, **cargar_configuracion().get("pines", {}))
+ECOIN = pines["ECOIN"]
+SALIDA = pines["SALIDA"]
+AC = pines["AC"]
+BOTON_ENTREGA = pines["BOTON_ENTREGA"]
+TEST = pines["TEST"]
+TEST1 = pines["TEST1"]
+TEST2 = pines["TEST2"]
+ENTHOPER = pines["ENTHOPER"]
+SALHOPER = pines["SALHOPER"]
+BOTON = pines["BOTON"]
+SAL1 = pines["SAL1"]
+BARRERA = pines["BARRERA"]
+
+def _definir_hoppers():
+    # [(nombre, pin_motor, pin_sensor, ajustes)] a partir de config.json;
+    # ajustes puede traer pin_reversa
+    definiciones = []
+    for i, definicion in enumerate(cargar_configuracion().get("hoppers") or HOPPERS_POR_DEFECTO):
+        ajustes = dict(cargar_configuracion().get("hopper", {}))
+        ajustes.update(definicion)
+        nombre = ajustes.pop("nombre", f"hopper{i + 1}")
+        motor, sensor = (pines[p] if isinstance(p, str) else p for p in (ajustes.pop("motor"), ajustes.pop("sensor")))
+        reversa = ajustes.pop("reversa", None)
+        if reversa is not None:
+            ajustes["pin_reversa"] = pines[reversa] if isinstance(reversa, str) else reversa
+        definiciones.append((nombre, motor, sensor, ajustes))
+    return definiciones
+
+definiciones_hoppers = _definir_hoppers()
+
+# registro.json vive en memoria; se escribe diferido y atómico (registro_diario.py)
+INTERVALO_REGISTRO = 1.0  # Segundos mínimos entre escrituras de registro.json
+_registro_diario = None
+
+def obtener_registro_diario():
+    global _registro_diario
+    if _registro_diario is None:
+        _registro_diario = RegistroDiario(registro_file, INTERVALO_REGISTRO)
+    return _registro_diario
 
 def iniciar_apertura():
-    registro = {
-        "apertura": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        "fichas_expendidas": 0,
-        "dinero_ingresado": 0,
-        "promociones_usadas": {
-            "Promo 1": 0,
-            "Promo 2": 0,
-            "Promo 3": 0
-        }
-    }
-    guardar_registro(registro)
-    return registro
+    return obtener_registro_diario().iniciar_apertura()
 
 def cargar_registro():
-    if os.path.exists(registro_file):
-        with open(registro_file, 'r') as f:
-            return json.load(f)
-    else:
-        return iniciar_apertura()
+    return obtener_registro_diario().a_dict()
 
 def guardar_registro(registro):
-    with open(registro_file, 'w') as f:
-        json.dump(registro, f, indent=4)
-
-def actualizar_registro(tipo, cantidad):
-    registro = cargar_registro()
-    if tipo == "ficha":
-        registro["fichas_expendidas"] += cantidad
-        registro["dinero_ingresado"] += cantidad * cargar_configuracion()["valor_ficha"]
-    elif tipo in ["Promo 1", "Promo 2", "Promo 3"]:
-        registro["promociones_usadas"][tipo] += 1
-        registro["dinero_ingresado"] += cargar_configuracion()["promociones"][tipo]["precio"]
-    guardar_registro(registro)
+    obtener_registro_diario().reemplazar(registro)
 
 def realizar_cierre():
-    registro = cargar_registro()
-    registro["cierre"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    guardar_registro(registro)
-    return registro
+    return obtener_registro_diario().realizar_cierre()
+
+def cerrar_registro():
+    # Escribe lo pendiente de registro.json (al detener el servicio)
+    if _registro_diario:
+        _registro_diario.cerrar()
 
 # --- CONFIGURACIÓN GPIO ---
 GPIO.setmode(GPIO.BCM)
-for pin in [ECOIN, AC, TEST, TEST1, TEST2, BOTON, BARRERA, ENTHOPER]:
+sensores_hoppers = [sensor for _, _, sensor, _ in definiciones_hoppers]
+for pin in [ECOIN, AC, TEST, TEST1, TEST2, BOTON, BARRERA, ENTHOPER] + [p for p in sensores_hoppers if p != ENTHOPER]:
     GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
 
-for pin in [SALIDA, SALHOPER, SAL1]:
+motores_hoppers = [motor for _, motor, _, _ in definiciones_hoppers]
+motores_hoppers += [a["pin_reversa"] for _, _, _, a in definiciones_hoppers if "pin_reversa" in a]
+for pin in dict.fromkeys([SALIDA, SALHOPER, SAL1] + motores_hoppers):
     GPIO.setup(pin, GPIO.OUT)
     GPIO.output(pin, GPIO.LOW)
 
+# El simulador trae su propio reloj virtual; con RPi.GPIO se usa el tiempo real
+reloj = getattr(GPIO, "reloj", RELOJ_REAL)
+
+# Sin hardware se conecta un hopper simulado por hopper para que la entrega produzca pulsos
+hoppers_simulados = []
+if hasattr(GPIO, "conectar"):
+    from gpio_sim import HopperSimulado
+    hoppers_simulados = [GPIO.conectar(HopperSimulado(motor, sensor, pin_reversa=ajustes.get("pin_reversa")))
+                         for _, motor, sensor, ajustes in definiciones_hoppers]
+hopper_simulado = hoppers_simulados[0] if hoppers_simulados else None
+
+# Cada hopper cuenta con su propio sensor, por flanco descendente (sin espera activa)
+hoppers = [Hopper(GPIO, motor, SensorHopper(GPIO, sensor, debounce=DEBOUNCE_SENSOR, reloj=reloj),
+                  nombre=nombre, reloj=reloj, **ajustes)
+           for nombre, motor, sensor, ajustes in definiciones_hoppers]
+sensor_hopper = hoppers[0].sensor
+
+# Captura de diagnóstico opcional (diagnostico.py): sensor, barrera y motor a kHz
+ajustes_diagnostico = dict(cargar_configuracion().get("diagnostico", {}))
+if ajustes_diagnostico.pop("activo", False):
+    from diagnostico import CapturaDiagnostico
+    for h in hoppers:
+        h.diagnostico = CapturaDiagnostico(GPIO, h.sensor.pin, BARRERA, h.pin_motor, hopper=h.nombre,
+                                           reloj=reloj, **ajustes_diagnostico)
+
+# Un hopper que queda vacío o atascado (o que vuelve a entregar) se avisa
+# enseguida con un heartbeat, sin esperar al próximo
+def _estado_hopper_cambiado(h, anterior, estado):
+    if ESTADO_VACIO_O_ATASCADO in (anterior, estado):
+        enviar_pulso()
+
+for h in hoppers:
+    h.al_cambiar_estado = _estado_hopper_cambiado
+obtener_registro().medidor("expendedora_hoppers_vacios_o_atascados", "Hoppers sin fichas tras agotar los reintentos",
+                           lambda: sum(h.estado == ESTADO_VACIO_O_ATASCADO for h in hoppers))
+
+if len(hoppers) == 1:
+    hopper = hoppers[0]
+else:
+    hopper = GrupoHoppers(hoppers, reloj=reloj, **cargar_configuracion().get("grupo_hoppers", {}))
+
 # --- CONFIGURACIÓN DE BASE DE DATOS ---
+# Una sola conexión (WAL) con caché en memoria, creada en el primer uso
+config_db = None
+
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''CREATE TABLE IF NOT EXISTS config (clave TEXT PRIMARY KEY, valor INTEGER)''')
-    conn.commit()
-    conn.close()
+    global config_db
+    if config_db is None:
+        config_db = ConfigDB(DB_FILE)
+    return config_db
 
 def get_config(clave, default=0):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT valor FROM config WHERE clave=?", (clave,))
-    row = cursor.fetchone()
-    conn.close()
-    return row[0] if row else default
+    return init_db().get(clave, default)
 
 def set_config(clave, valor):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO config (clave, valor) VALUES (?, ?) ON CONFLICT(clave) DO UPDATE SET valor=?", (clave, valor, valor))
-    conn.commit()
-    conn.close()
+    init_db().set(clave, valor)
+
+# --- TABLA DE PRECIOS ---
+# Escalones de la base compilados una vez. Las promociones y la ficha suelta
+# (valor_ficha) solo entran a la conversión de billetes si se activan en
+# config.json ("precios": {"incluir_promociones", "ficha_suelta"}); sin eso la
+# conversión es la de siempre y el crédito menor a VALOR1 queda guardado. Se recompila si set_config invalidó las tarifas o si
+# cambió config.json (la configuración recargada es otro diccionario).
+tabla_precios = None
+_origen_precios = None
+
+def obtener_tabla_precios():
+    global tabla_precios, _origen_precios
+    tarifas = init_db().obtener_tarifas()
+    config = cargar_configuracion()
+    if _origen_precios is None or tarifas is not _origen_precios[0] or config is not _origen_precios[1]:
+        opciones = config.get("precios", {})
+        promociones = config.get("promociones") if opciones.get("incluir_promociones", False) else None
+        valor_ficha = config.get("valor_ficha") if opciones.get("ficha_suelta", False) else None
+        tabla_precios = precios.compilar(tarifas, promociones, valor_ficha,
+                                         opciones.get("politica", precios.POLITICA_ESCALONES))
+        _origen_precios = (tarifas, config)
+    return tabla_precios
 
 # --- ENVÍO DE DATOS AL SERVIDOR ---
 def enviar_pulso():
-    data = {"device_id": "EXPENDEDORA_1"}
-    try:
-        response = requests.post(SERVER_HEARTBEAT, json=data)
-        print("Heartbeat enviado:", response.text)
-    except requests.RequestException as e:
-        print("Error enviando heartbeat:", e)
+    # El heartbeat lleva datos de salud sin costo extra de hilos
+    data = {
+        "device_id": "EXPENDEDORA_1",
+        "cola_telemetria": telemetria.obtener_cola().profundidad(),
+        "hoppers": hopper.estados()
+    }
+    if hopper.ultima_entrega:
+        data["ultima_entrega_segundos"] = round(hopper.ultima_entrega["segundos"], 3)
+        data["fichas_por_segundo"] = round(hopper.ultima_entrega["fichas_por_segundo"], 2)
+    # Un heartbeat perdido no se reintenta: el siguiente ya lo reemplaza
+    telemetria.enviar(SERVER_HEARTBEAT, data, "Heartbeat", persistente=False)
 
-    threading.Timer(60, enviar_pulso).start()  
+def iniciar_heartbeat():
+    # Un solo hilo planificador para todas las tareas periódicas
+    return obtener_planificador().cada(INTERVALO_HEARTBEAT, enviar_pulso, jitter=JITTER_HEARTBEAT)
 
 def enviar_cierre_diario():
     global r_cuenta, r_sal, promo1_count, promo2_count, promo3_count
@@ -151,68 +260,71 @@ def enviar_cierre_diario():
         "dato5": r_sal
     }
     
-    try:
-        response = requests.post(SERVER_CIERRE, json=data)
-        print("Cierre enviado:", response.text)
-    except requests.RequestException as e:
-        print("Error enviando cierre:", e)
+    telemetria.enviar(SERVER_CIERRE, data, "Cierre")
 
     r_cuenta = r_sal = promo1_count = promo2_count = promo3_count = 0  
 
 # --- CONVERSIÓN DE DINERO A FICHAS ---
+LATENCIA_CONVERSION = obtener_registro().histograma(
+    "expendedora_convertir_fichas_segundos", "Duración de convertir_fichas", CUBETAS_MICRO)
+
 def convertir_fichas():
     global cuenta, fichas, r_sal
 
-    valor1 = get_config("VALOR1", 1000)
-    valor2 = get_config("VALOR2", 5000)
-    valor3 = get_config("VALOR3", 10000)
-    fichas1 = get_config("FICHAS1", 1)
-    fichas2 = get_config("FICHAS2", 2)
-    fichas3 = get_config("FICHAS3", 5)
-
-    if cuenta >= valor1 and cuenta < valor2:
-        fichas += fichas1
-        cuenta -= valor1
-    elif cuenta >= valor2 and cuenta < valor3:
-        fichas += fichas2
-        cuenta -= valor2
-    elif cuenta >= valor3:
-        fichas += fichas3
-        cuenta -= valor3
-
-    r_sal += fichas
+    inicio = time.perf_counter()
+    # Todo el crédito en una sola pasada por la tabla compilada; lo que no
+    # alcanza para ningún escalón queda en `cuenta` para el próximo billete
+    tabla = obtener_tabla_precios()
+
+    with lock_contadores:
+        obtenidas, cuenta = tabla.convertir(cuenta)
+        fichas += obtenidas
+        r_sal += obtenidas
+    duracion = time.perf_counter() - inicio
+    LATENCIA_CONVERSION.observar(duracion)
+    trazador = obtener_trazador()
+    if trazador.registrando():  # Solo en las compras que entran al muestreo
+        trazador.registrar("conversion", time.time() - duracion, duracion, fichas=obtenidas)
+
+def acreditar_billete(monto):
+    # Suma un billete al crédito y devuelve cuántas fichas le corresponden
+    global cuenta
+    with lock_contadores:
+        cuenta += monto
+        antes = fichas
+        convertir_fichas()
+        return fichas - antes
+
+# --- BILLETERO ---
+# Los trenes de pulsos de ECOIN se decodifican por ráfaga y cada billete se
+# acredita en `cuenta`. El servicio reemplaza al_billete para además
+# registrar la venta y encolar la entrega.
+billetero = DecodificadorPulsos(GPIO, ECOIN, al_billete=acreditar_billete, reloj=reloj,
+                                **cargar_configuracion().get("billetero", {}))
 
 # --- MANEJO DE HOPPER Y ENTREGA DE FICHAS ---
-def entregar_fichas(gui=None):
+def descontar_ficha(gui=None):
     global fichas
+    with lock_contadores:
+        fichas -= 1  # Reduce el contador de fichas
+        restantes = fichas
+    print(f"Ficha dispensada. Fichas restantes: {restantes}")
 
-    while fichas > 0:
-        GPIO.output(SALIDA, GPIO.HIGH)  # Activa el motor
-        sensor_detectado = False
-        tiempo_inicio = time.time()  # Marca de tiempo para evitar bloqueos
-
-        # Verifica la detección del sensor para contar la ficha dispensada
-        while not sensor_detectado:
-            if GPIO.input(ENTHOPER) == GPIO.LOW:  # El sensor detecta una ficha
-                sensor_detectado = True
-
-            # Si el tiempo excede un límite (e.g., 5 segundos), salir del ciclo
-            if time.time() - tiempo_inicio > 5:
-                print("Error: Tiempo excedido esperando ficha.")
-                break
-
-        GPIO.output(SALIDA, GPIO.LOW)  # Desactiva el motor
-        time.sleep(0.4)  # Pausa antes de intentar la siguiente ficha
+    # Actualizar la GUI si se proporciona
+    if gui:
+        gui.actualizar_fichas(restantes)
 
-        if sensor_detectado:
-            fichas -= 1  # Reduce el contador de fichas
-            print(f"Ficha dispensada. Fichas restantes: {fichas}")
-
-            # Actualizar la GUI si se proporciona
-            if gui:
-                gui.actualizar_fichas(fichas)
-        else:
-            print("Error: No se detectó la salida de una ficha.")
+def entregar_fichas(gui=None):
+    # Repite mientras salgan fichas; si una corrida no entrega ninguna el
+    # hopper ya agotó sus reintentos (vacío o atascado) y las que faltan
+    # quedan en `fichas` para la próxima
+    while fichas > 0:
+        # En modo continuo el motor queda encendido hasta entregar todas
+        resultado = hopper.dispensar(fichas, lambda: descontar_ficha(gui))
+        if resultado["entregadas"] == 0:
+            print(f"Error: el hopper no entregó fichas (vacío o atascado), quedan {fichas} pendientes.")
+            return False
+    return True
 
 # --- FUNCIONES PARA LA GUI ---
 def obtener_dinero_ingresado():
@@ -222,10 +334,10 @@ def obtener_fichas_disponibles():
     return fichas
 
 def expender_fichas(cantidad):
-    global fichas
-    if fichas >= cantidad:
-        for _ in range(cantidad):
-            entregar_fichas()
+    # Entrega en el hilo de quien llama; el servicio usa despachador.py
+    if obtener_fichas_disponibles() >= cantidad:
+        # Entrega exactamente `cantidad` fichas en una sola corrida del motor
+        hopper.dispensar(cantidad, descontar_ficha)
         return True
     else:
         print("Error: No hay suficientes fichas en el dispensador.")
@@ -233,13 +345,9 @@ def expender_fichas(cantidad):
 
 # --- PROGRAMA PRINCIPAL ---
 def main():
-    init_db()
-    enviar_pulso()
-
-    # Iniciar la interfaz gráfica
-    root = tk.Tk()
-    app = ExpendedoraGUI(root)
-    root.mainloop()
+    # El core corre como servicio sin interfaz; la GUI se conecta por socket
+    from servicio import main as main_servicio
+    main_servicio()
 
 if __name__ == "__main__":
     main()
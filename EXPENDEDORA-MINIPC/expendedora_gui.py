@@ -3,8 +3,11 @@ from tkinter import messagebox
 import json
 import os
 from datetime import datetime
-import requests
-from User_management import UserManagement
+from bitacora import escribir_atomico
+from cliente_servicio import iniciar_servicio_si_falta
+from contadores import APERTURA, PARCIAL
+from repintado import Repintado
+from segundo_plano import LlamadasEnSegundoPlano
 
 url = "http://192.168.1.33/esp32_project/expendedora/insert_close_expendedora.php"  # URL DE CIERRES y subcierres
 urlDatos = "http://192.168.1.33/esp32_project/expendedora/insert_data_expendedora.php"  # URL DE REPORTES
@@ -12,9 +15,15 @@ urlSubcierre = "http://192.168.1.33/esp32_project/expendedora/insert_subcierre_e
 
 
 class ExpendedoraGUI:
-    def __init__(self, root, username):
+    def __init__(self, root, username, servicio=None):
         self.root = root
         self.username = username
+        # Hardware, contadores y telemetría los maneja el servicio (servicio.py)
+        self.servicio = servicio or iniciar_servicio_si_falta()
+        self.servicio.usuario = username  # Los eventos quedan a nombre del empleado
+        # Los pedidos al servicio salen de un hilo aparte: Tk nunca espera al socket
+        self.llamadas = LlamadasEnSegundoPlano(root)
+        self._sincronizando = False
         self.root.title("Expendedora - Control")
         self.root.geometry("800x500")
         self.root.configure(bg="#f0f0f0")
@@ -26,36 +35,7 @@ class ExpendedoraGUI:
             "Promo 3": {"precio": 0, "fichas": 0}
         }
         self.valor_ficha = 1.0
-
-        # Contadores de la página principal
-        self.contadores = {
-            "fichas_expendidas": 0,
-            "dinero_ingresado": 0,
-            "promo1_contador": 0,
-            "promo2_contador": 0,
-            "promo3_contador": 0,
-            "fichas_restantes": 0
-        }
-
-        # Contadores de apertura
-        self.contadores_apertura = {
-            "fichas_expendidas": 0,
-            "dinero_ingresado": 0,
-            "promo1_contador": 0,
-            "promo2_contador": 0,
-            "promo3_contador": 0,
-            "fichas_restantes": 0
-        }
-
-        # Contadores parciales
-        self.contadores_parciales = {
-            "fichas_expendidas": 0,
-            "dinero_ingresado": 0,
-            "promo1_contador": 0,
-            "promo2_contador": 0,
-            "promo3_contador": 0,
-            "fichas_restantes": 0
-        }
+        self.persistencia = {"intervalo_commit": 1.0, "eventos_por_snapshot": 1000}
 
         # Archivo de configuración
         self.config_file = "config.json"
@@ -75,10 +55,10 @@ class ExpendedoraGUI:
 
         tk.Label(self.menu_frame, text="Menú", bg="#333", fg="white", font=("Arial", 14, "bold")).pack(pady=10)
 
-        tk.Button(self.menu_frame, text="Inicio", bg="#444", fg="white", font=("Arial", 12), width=20, command=lambda: self.mostrar_frame(self.main_frame)).pack(pady=5)
-        tk.Button(self.menu_frame, text="Configuración", bg="#444", fg="white", font=("Arial", 12), width=20, command=lambda: self.mostrar_frame(self.config_frame)).pack(pady=5)
-        tk.Button(self.menu_frame, text="Cierre y Reportes", bg="#444", fg="white", font=("Arial", 12), width=20, command=lambda: self.mostrar_frame(self.reportes_frame)).pack(pady=5)
-        tk.Button(self.menu_frame, text="Simulación", bg="#444", fg="white", font=("Arial", 12), width=20, command=lambda: self.mostrar_frame(self.simulacion_frame)).pack(pady=5)
+        tk.Button(self.menu_frame, text="Inicio", bg="#444", fg="white", font=("Arial", 12), width=20, command=lambda: self.mostrar_frame("main")).pack(pady=5)
+        tk.Button(self.menu_frame, text="Configuración", bg="#444", fg="white", font=("Arial", 12), width=20, command=lambda: self.mostrar_frame("config")).pack(pady=5)
+        tk.Button(self.menu_frame, text="Cierre y Reportes", bg="#444", fg="white", font=("Arial", 12), width=20, command=lambda: self.mostrar_frame("reportes")).pack(pady=5)
+        tk.Button(self.menu_frame, text="Simulación", bg="#444", fg="white", font=("Arial", 12), width=20, command=lambda: self.mostrar_frame("simulacion")).pack(pady=5)
         tk.Button(self.menu_frame, text="Cerrar Sesión", bg="#D32F2F", fg="white", font=("Arial", 12), width=20, command=self.cerrar_sesion).pack(pady=(50, 5))
 
         # Página principal
@@ -89,6 +69,8 @@ class ExpendedoraGUI:
         self.contadores_frame = tk.Frame(self.main_frame, bg="#ddd", bd=2, relief="groove")
         self.contadores_frame.pack(side="left", padx=10, pady=10, fill="y")
 
+        # Las etiquetas se repintan agrupadas, una vez por cuadro y solo si cambian
+        self.repintado = Repintado(root)
         self.contadores_labels = {}
         for key, text in [
             ("fichas_expendidas", "Fichas expendidas"),
@@ -98,12 +80,18 @@ class ExpendedoraGUI:
             ("promo3_contador", "Promo 3 usadas"),
             ("fichas_restantes", "Fichas restantes")
         ]:
-            label = tk.Label(self.contadores_frame, text=f"{text}: {self.contadores[key]}", font=("Arial", 14), bg="#ddd")
+            label = tk.Label(self.contadores_frame, text=self.texto_contador(key, text), font=("Arial", 14), bg="#ddd")
             label.pack(pady=5)
             self.contadores_labels[key] = label
+            self.repintado.registrar(key, label, lambda k=key, t=text: self.texto_contador(k, t))
 
         self.fichas_restantes_label = self.contadores_labels["fichas_restantes"]
 
+        # Avance de la entrega en curso y compras en espera
+        self.entrega_label = tk.Label(self.contadores_frame, text=self.texto_entrega(), font=("Arial", 12), bg="#ddd")
+        self.entrega_label.pack(pady=5)
+        self.repintado.registrar("entrega", self.entrega_label, self.texto_entrega)
+
         # Frame para botones de acción
         self.botones_frame = tk.Frame(self.main_frame, bg="#f4f4f4")
         self.botones_frame.pack(side="right", padx=10, pady=10, fill="y")
@@ -115,8 +103,31 @@ class ExpendedoraGUI:
         tk.Button(self.botones_frame, text="Simular Promo 3", command=lambda: self.simular_promo("Promo 3"), bg="#FF9800", fg="white", font=("Arial", 12), width=20, bd=0).pack(pady=5)
         tk.Button(self.botones_frame, text="Simular Salida de Fichas", command=self.simular_salida_fichas, bg="#FFC107", fg="black", font=("Arial", 12), width=20, bd=0).pack(pady=5)
 
+        # Las demás páginas se construyen la primera vez que se muestran, así
+        # la pantalla de ventas aparece sin esperarlas
+        self.frames = {"main": self.main_frame}
+        self.constructores = {
+            "config": self.construir_config,
+            "reportes": self.construir_reportes,
+            "simulacion": self.construir_simulacion
+        }
+
+        # Footer
+        self.footer_frame = tk.Frame(root, bg="#333")
+        self.footer_frame.pack(side="bottom", fill="x")
+
+        self.footer_label = tk.Label(self.footer_frame, text="", bg="#333", fg="white", font=("Arial", 12))
+        self.footer_label.pack(pady=5)
+
+        self.actualizar_fecha_hora()  # Llamar a la función para mostrar la fecha y hora
+
+        self.mostrar_frame("main")
+        self.root.protocol("WM_DELETE_WINDOW", self.cerrar_ventana)
+        self.refrescar_contadores()
+
+    def construir_simulacion(self):
         # Página de simulación
-        self.simulacion_frame = tk.Frame(root, bg="#ffffff")
+        self.simulacion_frame = tk.Frame(self.root, bg="#ffffff")
         tk.Label(self.simulacion_frame, text="Simulación de Entradas y Salidas", font=("Arial", 14, "bold"), bg="#fff").pack(pady=10)
 
         tk.Button(self.simulacion_frame, text="Simular Billetero", command=self.simular_billetero, bg="#007BFF", fg="white", font=("Arial", 12), width=20, bd=0).pack(pady=5)
@@ -125,75 +136,147 @@ class ExpendedoraGUI:
         tk.Button(self.simulacion_frame, text="Simular Promo 2", command=lambda: self.simular_promo("Promo 2"), bg="#FF9800", fg="white", font=("Arial", 12), width=20, bd=0).pack(pady=5)
         tk.Button(self.simulacion_frame, text="Simular Promo 3", command=lambda: self.simular_promo("Promo 3"), bg="#FF9800", fg="white", font=("Arial", 12), width=20, bd=0).pack(pady=5)
         tk.Button(self.simulacion_frame, text="Simular Entrega de Fichas", command=self.simular_entrega_fichas, bg="#4CAF50", fg="white", font=("Arial", 12), width=20, bd=0).pack(pady=5)
+        return self.simulacion_frame
 
+    def construir_config(self):
         # Página de configuración
-        self.config_frame = tk.Frame(root, bg="#ffffff")
+        self.config_frame = tk.Frame(self.root, bg="#ffffff")
         tk.Label(self.config_frame, text="Configuración de Promociones", font=("Arial", 14, "bold"), bg="#fff").pack(pady=10)
         for promo in ["Promo 1", "Promo 2", "Promo 3"]:
             tk.Button(self.config_frame, text=f"Configurar {promo}", command=lambda p=promo: self.configurar_promo(p), bg="#007BFF", fg="white", font=("Arial", 12), width=20, bd=0).pack(pady=5)
         tk.Button(self.config_frame, text="Configurar Valor de Ficha", command=self.configurar_valor_ficha, bg="#007BFF", fg="white", font=("Arial", 12), width=20, bd=0).pack(pady=5)
+        return self.config_frame
 
+    def construir_reportes(self):
         # Página de reportes y cierre del día
-        self.reportes_frame = tk.Frame(root, bg="#ffffff")
+        self.reportes_frame = tk.Frame(self.root, bg="#ffffff")
         tk.Label(self.reportes_frame, text="Cierre y Reportes", font=("Arial", 14, "bold"), bg="#fff").pack(pady=10)
         tk.Button(self.reportes_frame, text="Realizar Apertura", command=self.realizar_apertura, bg="#007BFF", fg="white", font=("Arial", 12), width=20, bd=0).pack(pady=5)
         tk.Button(self.reportes_frame, text="Realizar Cierre", command=self.realizar_cierre, bg="#D32F2F", fg="white", font=("Arial", 12), width=20, bd=0).pack(pady=5)
         tk.Button(self.reportes_frame, text="Realizar Cierre Parcial", command=self.realizar_cierre_parcial, bg="#FF9800", fg="white", font=("Arial", 12), width=20, bd=0).pack(pady=5)  # Botón de Cierre Parcial
+        tk.Button(self.reportes_frame, text="Ver Historial", command=self.ver_historial, bg="#4CAF50", fg="white", font=("Arial", 12), width=20, bd=0).pack(pady=5)
+        return self.reportes_frame
 
-        # Footer
-        self.footer_frame = tk.Frame(root, bg="#333")
-        self.footer_frame.pack(side="bottom", fill="x")
-
-        self.footer_label = tk.Label(self.footer_frame, text="", bg="#333", fg="white", font=("Arial", 12))
-        self.footer_label.pack(pady=5)
-
-        self.actualizar_fecha_hora()  # Llamar a la función para mostrar la fecha y hora
-
-        self.mostrar_frame(self.main_frame)
+    def cerrar_ventana(self):
+        # El servicio sigue corriendo: solo se cierra la conexión
+        self.llamadas.detener()
+        self.servicio.cerrar()
+        self.root.destroy()
 
     def enviar_datos_al_servidor(self):
         datos = {
             "device_id": "EXPENDEDORA_1",
-            "dato1": self.contadores['fichas_expendidas'],
-            "dato2": self.contadores['dinero_ingresado'],
+            "dato1": self.libro.valor('fichas_expendidas'),
+            "dato2": self.libro.valor('dinero_ingresado'),
         }
+        # Se envía en segundo plano: no bloquea el hilo de Tk
+        self.enviar_telemetria(urlDatos, datos, "Datos")
 
-        try:
-            response = requests.post(urlDatos, json=datos)
-            if response.status_code == 200:
-                print("Datos enviados con éxito")
-            else:
-                print(f"Error al enviar datos: {response.status_code}")
-        except requests.exceptions.RequestException as e:
-            print(f"Error al conectar con el servidor: {e}")
-
-    def mostrar_frame(self, frame):
-        for f in [self.main_frame, self.config_frame, self.reportes_frame, self.simulacion_frame]:
+    def mostrar_frame(self, nombre):
+        if nombre not in self.frames:
+            self.frames[nombre] = self.constructores[nombre]()
+        for f in self.frames.values():
             f.pack_forget()
-        frame.pack(fill="both", expand=True)
+        self.frames[nombre].pack(fill="both", expand=True)
 
     def cargar_configuracion(self):
+        config = {}
         if os.path.exists(self.config_file):
             with open(self.config_file, 'r') as f:
                 config = json.load(f)
                 self.promociones = config.get("promociones", self.promociones)
                 self.valor_ficha = config.get("valor_ficha", self.valor_ficha)
-                self.contadores = config.get("contadores", self.contadores)
-                self.contadores_apertura = config.get("contadores_apertura", self.contadores_apertura)
-                self.contadores_parciales = config.get("contadores_parciales", self.contadores_parciales)
-        else:
+                self.persistencia.update(config.get("persistencia", {}))
+
+        # Los contadores viven en el servicio (libro + bitácora); acá se
+        # muestra la copia que llega en cada respuesta
+        self.libro = self.servicio.libro
+
+        if not os.path.exists(self.config_file):
             self.guardar_configuracion()
 
     def guardar_configuracion(self):
-        config = {
+        # Solo promociones y precios: los contadores se guardan en la bitácora.
+        # Se conservan las demás secciones del archivo (por ejemplo "hopper")
+        # y su fin de línea (el del repositorio es CRLF).
+        config = {}
+        fin_de_linea = "\r\n"
+        if os.path.exists(self.config_file):
+            with open(self.config_file, 'r') as f:
+                config = json.load(f)
+                if isinstance(f.newlines, str):
+                    fin_de_linea = f.newlines
+        for clave in ("contadores", "contadores_apertura", "contadores_parciales"):
+            config.pop(clave, None)
+        config.update({
             "promociones": self.promociones,
             "valor_ficha": self.valor_ficha,
-            "contadores": self.contadores,
-            "contadores_apertura": self.contadores_apertura,
-            "contadores_parciales": self.contadores_parciales
-        }
-        with open(self.config_file, 'w') as f:
-            json.dump(config, f, indent=4)
+            "persistencia": self.persistencia
+        })
+        # Temporal + fsync + rename: el servicio (configuracion.py) o un corte
+        # de luz nunca ven un config.json a medio escribir
+        escribir_atomico(self.config_file, json.dumps(config, indent=4), newline=fin_de_linea)
+
+    def registrar_evento(self, tipo, deltas=None, reiniciar=(), reporte=None, al_terminar=None):
+        # El servicio aplica el evento una sola vez al libro de contadores y
+        # lo agrega al diario (O(registro) en lugar de reescribir config.json).
+        # reporte: lo informado al servidor en un cierre, para auditoria.py
+        # al_terminar() corre cuando el servicio confirmó el evento
+        def registrado(respuesta):
+            self.repintado.marcar(*(deltas or ()))
+            if al_terminar:
+                al_terminar()
+
+        self.llamadas.llamar(lambda: self.servicio.evento(tipo, deltas, reiniciar, reporte), registrado,
+                             lambda e: messagebox.showerror("Error", f"No se pudo registrar el evento: {e}"))
+
+    def registrar_compra(self, tipo, fichas, deltas):
+        # El servicio registra la venta y encola la entrega en su hilo de
+        # despacho: la GUI no espera al hopper y se puede encolar otra compra
+        self.llamadas.llamar(lambda: self.servicio.comprar(tipo, fichas, deltas),
+                             lambda compra: self.repintado.marcar(*deltas, "entrega"),
+                             lambda e: messagebox.showerror("Error", f"No se pudo registrar la compra: {e}"))
+
+    def enviar_telemetria(self, url, datos, descripcion):
+        # La cola de envíos vive en el servicio y sobrevive a un cierre de la GUI
+        self.llamadas.llamar(lambda: self.servicio.enviar(url, datos, descripcion),
+                             al_fallar=lambda e: print(f"Error al encolar {descripcion}: {e}"))
+
+    def refrescar_contadores(self):
+        # Las entregas del hopper ocurren en el servicio: traer el libro al día.
+        # Si la sincronización anterior sigue en vuelo (servicio lento) no se
+        # encola otra.
+        if not self._sincronizando:
+            self._sincronizando = True
+            self.llamadas.llamar(self.servicio.sincronizar, self._sincronizado, self._sincronizado)
+        self.root.after(500, self.refrescar_contadores)
+
+    def _sincronizado(self, resultado):
+        self._sincronizando = False
+        if isinstance(resultado, Exception):
+            print(f"Error al sincronizar con el servicio: {resultado}")
+        else:
+            self.repintado.marcar()
+
+    def texto_contador(self, key, text):
+        if key == "dinero_ingresado":
+            return f"{text}: ${self.libro.valor(key):.2f}"
+        return f"{text}: {self.libro.valor(key)}"
+
+    def texto_entrega(self):
+        despacho = self.servicio.ultimo_estado.get("despacho") or {}
+        en_curso = despacho.get("en_curso")
+        en_cola = len(despacho.get("en_cola", []))
+        texto = f"Entregando: {en_curso['entregadas']}/{en_curso['fichas']}" if en_curso else "Hopper libre"
+        if en_cola:
+            texto += f" ({en_cola} en cola)"
+        estados = self.servicio.ultimo_estado.get("hoppers") or {}
+        bloqueados = [nombre for nombre, estado in estados.items() if estado == "vacio_o_atascado"]
+        if bloqueados:
+            texto += f" - Hopper vacío o atascado: {', '.join(bloqueados)}"
+        elif "recuperando" in estados.values():
+            texto += " - Destrabando hopper..."
+        return texto
 
     def configurar_promo(self, promo):
         config_window = tk.Toplevel(self.root)
@@ -258,21 +341,11 @@ class ExpendedoraGUI:
         def confirmar_fichas():
             try:
                 cantidad_fichas = int(fichas_entry.get())
-                self.contadores["fichas_restantes"] += cantidad_fichas  # Sumar fichas en lugar de asignar
-                self.contadores_apertura["fichas_restantes"] += cantidad_fichas  # Actualizar el contador de apertura
-                self.contadores_parciales["fichas_restantes"] += cantidad_fichas  # Actualizar el contador parcial
-                self.fichas_restantes_label.config(text=f"Fichas restantes: {self.contadores['fichas_restantes']}")
-                self.contadores["dinero_ingresado"] += cantidad_fichas * self.valor_ficha
-                self.contadores_apertura["dinero_ingresado"] += cantidad_fichas * self.valor_ficha  # Actualizar el contador de apertura
-                self.contadores_parciales["dinero_ingresado"] += cantidad_fichas * self.valor_ficha  # Actualizar el
-                self.contadores_parciales["dinero_ingresado"] += cantidad_fichas * self.valor_ficha  # Actualizar el contador parcial
-                self.fichas_restantes_label.config(text=f"Fichas restantes: {self.contadores['fichas_restantes']}")
-                self.contadores["dinero_ingresado"] += cantidad_fichas * self.valor_ficha
-                self.contadores_apertura["dinero_ingresado"] += cantidad_fichas * self.valor_ficha  # Actualizar el contador de apertura
-                self.contadores_parciales["dinero_ingresado"] += cantidad_fichas * self.valor_ficha  # Actualizar el contador parcial
-                self.contadores_labels["dinero_ingresado"].config(text=f"Dinero ingresado: ${self.contadores['dinero_ingresado']:.2f}")
-                self.guardar_configuracion()  # Guardar los contadores actualizados
-                self.actualizar_contadores_gui()
+                # Sumar fichas y dinero al libro de contadores y encolar la entrega
+                self.registrar_compra("manual", cantidad_fichas, {
+                    "fichas_restantes": cantidad_fichas,
+                    "dinero_ingresado": cantidad_fichas * self.valor_ficha
+                })
                 fichas_window.destroy()
             except ValueError:
                 messagebox.showerror("Error", "Ingrese un valor numérico válido.")
@@ -282,44 +355,54 @@ class ExpendedoraGUI:
 
     def realizar_apertura(self):
         # Inicia la apertura del día
-        self.contadores_apertura = {
-            "fichas_expendidas": 0,
-            "dinero_ingresado": 0,
-            "promo1_contador": 0,
-            "promo2_contador": 0,
-            "promo3_contador": 0,
-            "fichas_restantes": 0
-        }
-        self.contadores_parciales = {
-            "fichas_expendidas": 0,
-            "dinero_ingresado": 0,
-            "promo1_contador": 0,
-            "promo2_contador": 0,
-            "promo3_contador": 0,
-            "fichas_restantes": 0
-        }
-        self.actualizar_contadores_gui()
-        self.guardar_configuracion()
-        messagebox.showinfo("Apertura", "Apertura del día realizada con éxito.")
+        self.registrar_evento("apertura", reiniciar=(APERTURA, PARCIAL), al_terminar=lambda: messagebox.showinfo(
+            "Apertura", "Apertura del día realizada con éxito."))
+
+    def cerrar_periodo(self, tipo, armar_envio, url_envio, descripcion, informar):
+        # El servicio lee y reinicia el período en un solo paso; se informa
+        # exactamente lo que devuelve (informar(cerrado)), no la copia local.
+        # El envío al servidor sale en la misma llamada de fondo, justo
+        # detrás de su cierre, y el servicio guarda lo enviado para auditoria.py
+        def cerrar_y_enviar():
+            cerrado = self.servicio.cierre(tipo)
+            try:
+                # Queda guardado hasta que el servidor lo acepte
+                self.servicio.enviar(url_envio, armar_envio(cerrado), descripcion, informa=tipo)
+            except Exception as e:
+                print(f"Error al encolar {descripcion}: {e}")
+            return cerrado
+
+        def cerrado(contadores):
+            self.repintado.marcar()
+            informar(contadores)
+
+        self.llamadas.llamar(cerrar_y_enviar, cerrado,
+                             lambda e: messagebox.showerror("Error", f"No se pudo realizar el cierre: {e}"))
 
     def realizar_cierre(self):
         # Realiza el cierre del día
+        self.cerrar_periodo("cierre", self.datos_cierre, url, "Datos de cierre", self.informar_cierre)
+
+    def datos_cierre(self, contadores_apertura):
+        # Lo que se envía al servidor en el cierre
+        return {
+            "id_expendedora": "EXPENDEDORA_1",
+            "fichas": contadores_apertura['fichas_expendidas'],
+            "dinero": contadores_apertura['dinero_ingresado'],
+            "p1": contadores_apertura['promo1_contador'],
+            "p2": contadores_apertura['promo2_contador'],
+            "p3": contadores_apertura['promo3_contador']
+        }
+
+    def informar_cierre(self, contadores_apertura):
         cierre_info = {
             "device_id": "EXPENDEDORA_1",
-            "fichas_expendidas": self.contadores_apertura['fichas_expendidas'],
-            "dinero_ingresado": self.contadores_apertura['dinero_ingresado'],
-            "promo1_contador": self.contadores_apertura['promo1_contador'],
-            "promo2_contador": self.contadores_apertura['promo2_contador'],
-            "promo3_contador": self.contadores_apertura['promo3_contador'],
-            "fichas_restantes": self.contadores_apertura['fichas_restantes']
-        }
-        info = {
-            "id_expendedora": "EXPENDEDORA_1",
-            "fichas": self.contadores_apertura['fichas_expendidas'],
-            "dinero": self.contadores_apertura['dinero_ingresado'],
-            "p1": self.contadores_apertura['promo1_contador'],
-            "p2": self.contadores_apertura['promo2_contador'],
-            "p3": self.contadores_apertura['promo3_contador']
+            "fichas_expendidas": contadores_apertura['fichas_expendidas'],
+            "dinero_ingresado": contadores_apertura['dinero_ingresado'],
+            "promo1_contador": contadores_apertura['promo1_contador'],
+            "promo2_contador": contadores_apertura['promo2_contador'],
+            "promo3_contador": contadores_apertura['promo3_contador'],
+            "fichas_restantes": contadores_apertura['fichas_restantes']
         }
         mensaje_cierre = (
             f"Fichas expendidas: {cierre_info['fichas_expendidas']}\n"
@@ -330,47 +413,26 @@ class ExpendedoraGUI:
             f"Fichas restantes: {cierre_info['fichas_restantes']}"
         )
         messagebox.showinfo("Cierre", f"Cierre del día realizado:\n{mensaje_cierre}")
-        
-        # Enviar datos al servidor
-        try:
-            response = requests.post(url, json=info)
-            if response.status_code == 200:
-                print("Datos de cierre enviados con éxito")
-            else:
-                print(f"Error al enviar datos de cierre: {response.status_code}")
-        except requests.exceptions.RequestException as e:
-            print(f"Error al conectar con el servidor: {e}")
-        
-        self.contadores_apertura = {
-            "fichas_expendidas": 0,
-            "dinero_ingresado": 0,
-            "promo1_contador": 0,
-            "promo2_contador": 0,
-            "promo3_contador": 0,
-            "fichas_restantes": 0
-        }
-        self.contadores_parciales = {
-            "fichas_expendidas": 0,
-            "dinero_ingresado": 0,
-            "promo1_contador": 0,
-            "promo2_contador": 0,
-            "promo3_contador": 0,
-            "fichas_restantes": 0
-        }
-        self.guardar_configuracion()
 
     def realizar_cierre_parcial(self):
         # Realiza el cierre parcial
-        subcierre_info = {
+        self.cerrar_periodo("cierre_parcial", self.datos_cierre_parcial, urlSubcierre,
+                            "Datos de cierre parcial", self.informar_cierre_parcial)
+
+    def datos_cierre_parcial(self, contadores_parciales):
+        # Lo que se envía al servidor en el cierre parcial
+        return {
             "device_id": "EXPENDEDORA_1",
-            "partial_fichas": self.contadores_parciales['fichas_expendidas'],
-            "partial_dinero": self.contadores_parciales['dinero_ingresado'],
-            "partial_p1": self.contadores_parciales['promo1_contador'],
-            "partial_p2": self.contadores_parciales['promo2_contador'],
-            "partial_p3": self.contadores_parciales['promo3_contador'],
+            "partial_fichas": contadores_parciales['fichas_expendidas'],
+            "partial_dinero": contadores_parciales['dinero_ingresado'],
+            "partial_p1": contadores_parciales['promo1_contador'],
+            "partial_p2": contadores_parciales['promo2_contador'],
+            "partial_p3": contadores_parciales['promo3_contador'],
             "employee_id": self.username  # Reemplazar con el ID del empleado actual
         }
-        
+
+    def informar_cierre_parcial(self, contadores_parciales):
+        subcierre_info = self.datos_cierre_parcial(contadores_parciales)
         mensaje_subcierre = (
             f"Fichas expendidas: {subcierre_info['partial_fichas']}\n"
             f"Dinero ingresado: ${subcierre_info['partial_dinero']:.2f}\n"
@@ -379,51 +441,48 @@ class ExpendedoraGUI:
             f"Promo 3 usadas: {subcierre_info['partial_p3']}"
         )
         messagebox.showinfo("Cierre Parcial", f"Cierre parcial realizado:\n{mensaje_subcierre}")
-        
-        # Enviar datos al servidor
-        try:
-            response = requests.post(urlSubcierre, json=subcierre_info)
-            if response.status_code == 200:
-                print("Datos de cierre parcial enviados con éxito")
-            else:
-                print(f"Error al enviar datos de cierre parcial: {response.status_code}")
-        except requests.exceptions.RequestException as e:
-            print(f"Error al conectar con el servidor: {e}")
-
-        # Reiniciar los contadores parciales
-        self.contadores_parciales = {
-            "fichas_expendidas": 0,
-            "dinero_ingresado": 0,
-            "promo1_contador": 0,
-            "promo2_contador": 0,
-            "promo3_contador": 0,
-            "fichas_restantes": 0
-        }
-        self.guardar_configuracion()
+
+    def ver_historial(self):
+        # Reportes locales desde los resúmenes del servicio (no recorren eventos)
+        self.llamadas.llamar(lambda: (self.servicio.historial("por_dia", dias=30),
+                                      self.servicio.historial("promos_por_semana", semanas=12)),
+                             lambda filas: self.mostrar_historial(*filas),
+                             lambda e: messagebox.showerror("Error", f"No se pudo leer el historial: {e}"))
+
+    def mostrar_historial(self, dias, semanas):
+        historial_window = tk.Toplevel(self.root)
+        historial_window.title("Historial")
+        historial_window.geometry("600x400")
+        texto = tk.Text(historial_window, font=("Courier", 10))
+        texto.pack(fill="both", expand=True)
+
+        texto.insert("end", "Últimos 30 días\n")
+        texto.insert("end", f"{'Día':<12}{'Fichas':>8}{'Dinero':>14}{'P1':>6}{'P2':>6}{'P3':>6}\n")
+        for fila in dias:
+            texto.insert("end", f"{fila['dia']:<12}{fila['fichas_expendidas']:>8.0f}{fila['dinero_ingresado']:>14.2f}"
+                                f"{fila['promo1_contador']:>6.0f}{fila['promo2_contador']:>6.0f}{fila['promo3_contador']:>6.0f}\n")
+
+        texto.insert("end", "\nPromociones por semana\n")
+        texto.insert("end", f"{'Semana':<12}{'P1':>6}{'P2':>6}{'P3':>6}{'Dinero':>14}\n")
+        for fila in semanas:
+            texto.insert("end", f"{fila['semana']:<12}{fila['promo1']:>6.0f}{fila['promo2']:>6.0f}"
+                                f"{fila['promo3']:>6.0f}{fila['dinero']:>14.2f}\n")
+        texto.config(state="disabled")
 
     def cerrar_sesion(self):
         # Realizar cierre parcial antes de cerrar sesión
+        from User_management import UserManagement  # Solo se usa al cerrar sesión
         messagebox.showinfo("Cerrar Sesión", "La sesión ha sido cerrada.")
+        self.llamadas.detener()
+        self.servicio.cerrar()
         self.root.destroy()
         user_management = UserManagement(self.root)
         user_management.run()  # No se pasa ningún argumento aquí
 
-    def actualizar_contadores_gui(self):
-        for key in self.contadores_labels:
-            self.contadores_labels[key].config(text=f"{key.replace('_', ' ').title()}: {self.contadores[key]}")
-
     def expender_fichas_gui(self):
-        if self.contadores["fichas_restantes"] > 0:
-            self.contadores["fichas_restantes"] -= 1
-            self.contadores_apertura["fichas_restantes"] -= 1  # Actualizar el contador de apertura
-            self.contadores_parciales["fichas_restantes"] -= 1  # Actualizar el contador parcial
-            self.contadores["fichas_expendidas"] += 1
-            self.contadores_apertura["fichas_expendidas"] += 1  # Actualizar el contador de apertura
-            self.contadores_parciales["fichas_expendidas"] += 1  # Actualizar el contador parcial
-            self.actualizar_contadores_gui()
-            self.guardar_configuracion()
-            if self.contadores["fichas_restantes"] == 0:
-                self.enviar_datos_al_servidor()
+        if self.libro.valor("fichas_restantes") > 0:
+            self.registrar_evento("ficha", {"fichas_restantes": -1, "fichas_expendidas": 1},
+                                  al_terminar=self.enviar_datos_si_no_quedan)
         else:
             messagebox.showerror("Error", "No hay suficientes fichas.")
 
@@ -436,34 +495,18 @@ class ExpendedoraGUI:
     def simular_entrega_fichas(self):
         messagebox.showinfo("Simulación", "Se están entregando fichas.")
         
+    def enviar_datos_si_no_quedan(self):
+        if self.libro.valor("fichas_restantes") == 0:
+            self.enviar_datos_al_servidor()
+
     def simular_salida_fichas(self):
-        if self.contadores["fichas_restantes"] > 0:
-            self.contadores["fichas_expendidas"] += 1
-            self.contadores_apertura["fichas_expendidas"] += 1  # Actualizar el contador de apertura
-            self.contadores_parciales["fichas_expendidas"] += 1  # Actualizar el contador parcial
-            self.contadores["fichas_restantes"] -= 1
-            self.contadores_apertura["fichas_restantes"] -= 1  # Actualizar el contador de apertura
-            self.contadores_parciales["fichas_restantes"] -= 1  # Actualizar el contador parcial
-            self.actualizar_contadores_gui()
-            self.guardar_configuracion()
-            if self.contadores["fichas_restantes"] == 0:
-                self.enviar_datos_al_servidor()
+        if self.libro.valor("fichas_restantes") > 0:
+            self.registrar_evento("ficha", {"fichas_expendidas": 1, "fichas_restantes": -1},
+                                  al_terminar=self.enviar_datos_si_no_quedan)
         else:
             messagebox.showerror("Error", "No hay suficientes fichas.")
             
     def simular_promo(self, promo):
-        # Aumentar el número de fichas restantes según la promoción
-        self.contadores["fichas_restantes"] += self.promociones[promo]["fichas"]  # Sumar fichas en lugar de asignar
-        self.contadores_apertura["fichas_restantes"] += self.promociones[promo]["fichas"]  # Actualizar el contador de apertura
-        self.contadores_parciales["fichas_restantes"] += self.promociones[promo]["fichas"]  # Actualizar el contador parcial
-        self.contadores_labels["fichas_restantes"].config(text=f"Fichas restantes: {self.contadores['fichas_restantes']}")
-        
-        # Aumentar el dinero ingresado según el precio de la promoción
-        self.contadores["dinero_ingresado"] += self.promociones[promo]["precio"]
-        self.contadores_apertura["dinero_ingresado"] += self.promociones[promo]["precio"]  # Actualizar el contador de apertura
-        self.contadores_parciales["dinero_ingresado"] += self.promociones[promo]["precio"]  # Actualizar el contador parcial
-        self.contadores_labels["dinero_ingresado"].config(text=f"Dinero ingresado: ${self.contadores['dinero_ingresado']:.2f}")
-
         # Diccionario para simular el switch
         promo_contadores = {
             "Promo 1": "promo1_contador",
@@ -471,16 +514,17 @@ class ExpendedoraGUI:
             "Promo 3": "promo3_contador"
         }
 
-        # Incrementar el contador de la promoción correspondiente
-        if promo in promo_contadores:
-            self.contadores[promo_contadores[promo]] += 1
-            self.contadores_apertura[promo_contadores[promo]] += 1  # Actualizar el contador de apertura
-            self.contadores_parciales[promo_contadores[promo]] += 1  # Actualizar el contador parcial
-            self.contadores_labels[promo_contadores[promo]].config(text=f"{promo} usadas: {self.contadores[promo_contadores[promo]]}")
-        else:
+        if promo not in promo_contadores:
             messagebox.showerror("Error", "Promoción no válida.")
-        
-        self.guardar_configuracion()  # Guardar los contadores actualizados
+            return
+
+        # Fichas restantes, dinero ingresado y uso de la promo en un solo
+        # evento; la entrega queda en la cola del servicio
+        self.registrar_compra("promo", self.promociones[promo]["fichas"], {
+            "fichas_restantes": self.promociones[promo]["fichas"],
+            "dinero_ingresado": self.promociones[promo]["precio"],
+            promo_contadores[promo]: 1
+        })
 
     def actualizar_fecha_hora(self):
         # Obtener la fecha y hora actual
@@ -1,4 +1,112 @@
 # gpio_sim.py - Simulación de RPi.GPIO para pruebas en PC
+#
+# Además de guardar el nivel de cada pin, simula el hardware conectado con un
+# reloj virtual determinístico: el hopper (pulsos en el sensor mientras el
+# motor está encendido, atascos, hopper vacío, inercia del motor), trenes de
+# pulsos del billetero y eventos de barrera. Nada duerme de verdad: cuando el
+# código espera, el reloj salta al próximo evento programado.
+
+import heapq
+import itertools
+import threading
+
+from reloj import correr_en_hilos
+
+
+class RelojVirtual:
+    def __init__(self):
+        self.ahora = 0.0
+        self._eventos = []
+        self._orden = itertools.count()
+        self._lock = threading.RLock()
+        self._cambio = threading.Condition(self._lock)
+        self._esperas = {}  # hilo -> (límite, predicado) de quien está en esperar()
+        self._corriendo = 0  # Hilos de paralelo() que están fuera de esperar()
+        self._local = threading.local()
+
+    def monotonic(self):
+        return self.ahora
+
+    def programar(self, retardo, funcion):
+        # Ejecuta funcion() cuando el reloj llegue a ahora + retardo
+        with self._lock:
+            heapq.heappush(self._eventos, (self.ahora + retardo, next(self._orden), funcion))
+
+    def _listo(self, limite, predicado):
+        return predicado() or (limite is not None and self.ahora >= limite)
+
+    def esperar(self, cond, predicado, timeout):
+        # Igual que RelojReal.esperar, pero procesando eventos en lugar de dormir.
+        # Con varios hilos el tiempo avanza solo si ninguno de paralelo() está
+        # corriendo y nadie tiene su espera cumplida, y nunca más allá del
+        # límite más cercano de los que esperan.
+        yo = threading.get_ident()
+        participante = getattr(self._local, "participante", False)
+        with self._lock:
+            limite = None if timeout is None else self.ahora + timeout
+            self._esperas[yo] = (limite, predicado)
+            if participante:
+                self._corriendo -= 1
+            try:
+                while True:
+                    if predicado():
+                        return True
+                    if limite is not None and self.ahora >= limite:
+                        return False
+                    if len(self._esperas) == 1 and not self._corriendo:
+                        hasta = limite  # Un solo hilo: el caso de siempre
+                    elif self._corriendo or any(self._listo(*espera) for hilo, espera in self._esperas.items()
+                                                if hilo != yo):
+                        # Otro hilo tiene que correr antes de que el tiempo avance
+                        self._cambio.notify_all()
+                        self._cambio.wait()
+                        continue
+                    else:
+                        limites = [l for l, _ in self._esperas.values() if l is not None]
+                        hasta = min(limites) if limites else None
+                    if self._eventos and (hasta is None or self._eventos[0][0] <= hasta):
+                        momento, _, funcion = heapq.heappop(self._eventos)
+                        self.ahora = max(self.ahora, momento)
+                        funcion()
+                    elif hasta is not None:
+                        self.ahora = max(self.ahora, hasta)
+                    else:
+                        return False  # Sin eventos ni límite: nada más puede pasar
+            finally:
+                del self._esperas[yo]
+                if participante:
+                    self._corriendo += 1
+                self._cambio.notify_all()
+
+    def paralelo(self, funciones):
+        # Como RelojReal.paralelo; cada hilo cuenta como corriendo hasta que espera
+        with self._lock:
+            self._corriendo += len(funciones)
+
+        def envolver(funcion):
+            def participar():
+                anterior = getattr(self._local, "participante", False)
+                self._local.participante = True
+                try:
+                    return funcion()
+                finally:
+                    self._local.participante = anterior
+                    with self._lock:
+                        self._corriendo -= 1
+                        self._cambio.notify_all()
+            return participar
+
+        return correr_en_hilos(funciones, envolver)
+
+    def sleep(self, segundos):
+        self.esperar(None, lambda: False, segundos)
+
+    def avanzar(self, segundos):
+        self.sleep(segundos)
+
+    def pendientes(self):
+        return len(self._eventos)
+
 
 class GPIO:
     BCM = "BCM"
@@ -7,28 +115,169 @@ class GPIO:
     PUD_UP = "PULL_UP"
     HIGH = 1
     LOW = 0
+    RISING = "RISING"
+    FALLING = "FALLING"
+    BOTH = "BOTH"
+
+    verbose = True  # Imprimir cada setup/output (apagar en escenarios largos)
+    reloj = RelojVirtual()
 
     _pins = {}
+    _callbacks = {}
+    _motores = {}
+
+    @classmethod
+    def reiniciar(cls, verbose=False):
+        # Estado limpio y reloj en cero para un escenario nuevo
+        cls._pins.clear()
+        cls._callbacks.clear()
+        cls._motores.clear()
+        cls.reloj = RelojVirtual()
+        cls.verbose = verbose
 
     @classmethod
     def setmode(cls, mode):
-        print(f"GPIO modo configurado: {mode}")
+        if cls.verbose:
+            print(f"GPIO modo configurado: {mode}")
 
     @classmethod
     def setup(cls, pin, mode, pull_up_down=None):
-        cls._pins[pin] = cls.LOW
-        print(f"Pin {pin} configurado como {mode}")
+        # Con pull-up una entrada en reposo lee HIGH
+        cls._pins[pin] = cls.HIGH if pull_up_down == cls.PUD_UP else cls.LOW
+        if cls.verbose:
+            print(f"Pin {pin} configurado como {mode}")
 
     @classmethod
     def output(cls, pin, state):
         cls._pins[pin] = state
-        print(f"Pin {pin} cambiado a {'HIGH' if state else 'LOW'}")
+        if pin in cls._motores:
+            dispositivo = cls._motores[pin]
+            if pin == dispositivo.pin_motor:
+                dispositivo.motor(state)
+            else:
+                dispositivo.reversa(state)
+        if cls.verbose:
+            print(f"Pin {pin} cambiado a {'HIGH' if state else 'LOW'}")
 
     @classmethod
     def input(cls, pin):
         return cls._pins.get(pin, cls.LOW)
 
+    @classmethod
+    def add_event_detect(cls, pin, edge, callback=None, bouncetime=None):
+        # Igual que RPi.GPIO: callback(canal) en cada flanco. El antirrebote
+        # queda a cargo de quien registra el callback.
+        cls._callbacks[pin] = (edge, callback)
+
+    @classmethod
+    def remove_event_detect(cls, pin):
+        cls._callbacks.pop(pin, None)
+
+    @classmethod
+    def simular_entrada(cls, pin, state):
+        # Cambia el nivel de un pin de entrada y dispara el callback si hay flanco
+        anterior = cls._pins.get(pin, cls.LOW)
+        cls._pins[pin] = state
+        if pin not in cls._callbacks or anterior == state:
+            return
+        edge, callback = cls._callbacks[pin]
+        flanco = cls.RISING if state else cls.FALLING
+        if callback and edge in (flanco, cls.BOTH):
+            callback(pin)
+
+    @classmethod
+    def conectar(cls, dispositivo):
+        # Conecta un dispositivo simulado que reacciona a su pin de motor (y de reversa)
+        cls._motores[dispositivo.pin_motor] = dispositivo
+        if getattr(dispositivo, "pin_reversa", None) is not None:
+            cls._motores[dispositivo.pin_reversa] = dispositivo
+        return dispositivo
+
     @classmethod
     def cleanup(cls):
         cls._pins.clear()
-        print("GPIO limpiado")
+        cls._callbacks.clear()
+        cls._motores.clear()
+        if cls.verbose:
+            print("GPIO limpiado")
+
+
+# --- ESCENARIOS ---
+def programar_pulso(pin, inicio, ancho):
+    # Un pulso activo en bajo: flanco descendente en `inicio`, sube tras `ancho`
+    GPIO.reloj.programar(inicio, lambda: GPIO.simular_entrada(pin, GPIO.LOW))
+    GPIO.reloj.programar(inicio + ancho, lambda: GPIO.simular_entrada(pin, GPIO.HIGH))
+
+
+def programar_tren_pulsos(pin, cantidad, inicio=0.0, ancho=0.03, separacion=0.05):
+    # Tren de pulsos como el que emite el billetero (N pulsos por denominación)
+    for i in range(cantidad):
+        programar_pulso(pin, inicio + i * (ancho + separacion), ancho)
+
+
+def programar_barrera(pin, inicio=0.0, duracion=0.2):
+    programar_pulso(pin, inicio, duracion)
+
+
+class HopperSimulado:
+    def __init__(self, pin_motor, pin_sensor, fichas=1000, intervalo=0.1,
+                 retardo_arranque=0.05, ancho_pulso=0.02, inercia=0.0, atasco_en=None,
+                 destraba_tras=None, pin_reversa=None):
+        self.pin_motor = pin_motor
+        self.pin_reversa = pin_reversa
+        self.pin_sensor = pin_sensor
+        self.fichas = fichas  # Fichas cargadas; en 0 el hopper está vacío
+        self.intervalo = intervalo  # Segundos entre fichas con el motor encendido
+        self.retardo_arranque = retardo_arranque
+        self.ancho_pulso = ancho_pulso
+        self.inercia = inercia  # Segundos que sigue girando después de apagarlo
+        self.atasco_en = atasco_en  # Se atasca al entregar esta cantidad de fichas
+        self.destraba_tras = destraba_tras  # Rearranques/reversas que lo destraban (None: nunca)
+
+        self.entregadas = 0
+        self.encendido = False
+        self.atascado = False
+        self.intentos_destrabe = 0
+        self._generacion = 0
+        self._apagado_en = 0.0
+
+    def _intento_destrabe(self):
+        if not self.atascado:
+            return
+        self.intentos_destrabe += 1
+        if self.destraba_tras is not None and self.intentos_destrabe >= self.destraba_tras:
+            self.desatascar()
+
+    def reversa(self, estado):
+        if estado:
+            self._intento_destrabe()
+
+    def motor(self, estado):
+        if estado and not self.encendido:
+            self._intento_destrabe()
+            self.encendido = True
+            self._generacion += 1
+            generacion = self._generacion
+            GPIO.reloj.programar(self.retardo_arranque, lambda: self._caida(generacion))
+        elif not estado and self.encendido:
+            self.encendido = False
+            self._apagado_en = GPIO.reloj.ahora
+
+    def desatascar(self):
+        self.atascado = False
+        self.atasco_en = None
+        self.intentos_destrabe = 0
+
+    def _caida(self, generacion):
+        if generacion != self._generacion:
+            return  # El motor se reinició: esta secuencia quedó vieja
+        if not self.encendido and GPIO.reloj.ahora > self._apagado_en + self.inercia:
+            return
+        if self.atasco_en is not None and self.entregadas >= self.atasco_en:
+            self.atascado = True
+        if self.atascado or self.fichas <= 0:
+            return  # Sin pulsos: el sensor no ve nada
+        self.fichas -= 1
+        self.entregadas += 1
+        programar_pulso(self.pin_sensor, 0.0, self.ancho_pulso)
+        GPIO.reloj.programar(self.intervalo, lambda: self._caida(generacion))
@@ -0,0 +1,182 @@
+# historial.py - Historial local de eventos con resúmenes por hora y por día
+#
+# Cada evento del libro de contadores (venta, promo, billete, ficha,
+# apertura, cierre...) se guarda en la tabla `eventos` de expendedora.db con
+# sus deltas. Las tablas `resumen_hora` y `resumen_dia` se mantienen al
+# insertar: se suman los deltas a la fila de su hora/día, así un reporte de
+# 90 días lee como mucho 90 * 24 filas en lugar de recorrer los eventos.
+#
+# Cada evento guarda además el usuario de la sesión y, en los eventos
+# informe_cierre / informe_cierre_parcial, lo que se envió al servidor
+# (columna reporte, JSON) para poder auditarlo después con auditoria.py.
+#
+# registrar() solo agrega el evento a una lista en memoria; volcar() (cada
+# `intervalo_volcado` segundos, desde el planificador) escribe todo junto en
+# una transacción. Los eventos crudos más viejos que `retencion_dias` se
+# borran con podar(); los resúmenes se conservan.
+
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from contadores import CLAVES
+
+DB_FILE = "expendedora.db"
+
+_COLUMNAS = ", ".join(CLAVES)
+_SUMAS = ", ".join(f"{clave} = {clave} + excluded.{clave}" for clave in CLAVES)
+
+
+class Historial:
+    def __init__(self, db_file=DB_FILE, retencion_dias=90, intervalo_volcado=1.0):
+        self.db_file = db_file
+        self.retencion_dias = retencion_dias
+        self.intervalo_volcado = intervalo_volcado
+        self._pendientes = []  # (ts, tipo, valores, usuario, reporte) todavía sin escribir
+        self._lock = threading.Lock()  # Solo para _pendientes: registrar() nunca espera al disco
+        self._lock_conexion = threading.Lock()
+
+        # Una conexión compartida entre hilos, siempre bajo self._lock_conexion
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        columnas = ", ".join(f"{clave} REAL NOT NULL DEFAULT 0" for clave in CLAVES)
+        self._conn.executescript(f'''
+            CREATE TABLE IF NOT EXISTS eventos (
+                id INTEGER PRIMARY KEY, ts REAL NOT NULL, tipo TEXT NOT NULL, {columnas},
+                usuario TEXT, reporte TEXT);
+            CREATE INDEX IF NOT EXISTS eventos_ts ON eventos (ts);
+            CREATE INDEX IF NOT EXISTS eventos_tipo_ts ON eventos (tipo, ts);
+            CREATE TABLE IF NOT EXISTS resumen_hora (
+                hora TEXT PRIMARY KEY, eventos INTEGER NOT NULL DEFAULT 0, {columnas});
+            CREATE TABLE IF NOT EXISTS resumen_dia (
+                dia TEXT PRIMARY KEY, eventos INTEGER NOT NULL DEFAULT 0, {columnas});
+        ''')
+        # Bases creadas antes de que existieran usuario y reporte
+        existentes = {fila[1] for fila in self._conn.execute("PRAGMA table_info(eventos)")}
+        for columna in ("usuario", "reporte"):
+            if columna not in existentes:
+                self._conn.execute(f"ALTER TABLE eventos ADD COLUMN {columna} TEXT")
+        self._conn.commit()
+
+    # --- ESCRITURA ---
+    def registrar(self, tipo, deltas=None, ts=None, usuario=None, reporte=None):
+        # reporte: lo que se envió al servidor por un cierre (se guarda como JSON)
+        deltas = deltas or {}
+        valores = tuple(deltas.get(clave, 0) for clave in CLAVES)
+        if reporte is not None:
+            reporte = json.dumps(reporte)
+        with self._lock:
+            self._pendientes.append((ts or time.time(), tipo, valores, usuario, reporte))
+
+    def volcar(self):
+        # Escribe los eventos acumulados y suma sus deltas a los resúmenes.
+        # La lista se toma con la conexión ya reservada: una consulta que
+        # llega mientras tanto espera a que estos eventos estén escritos.
+        with self._lock_conexion:
+            with self._lock:
+                pendientes, self._pendientes = self._pendientes, []
+            if not pendientes:
+                return 0
+
+            horas = {}
+            dias = {}
+            for ts, _, valores, _, _ in pendientes:
+                momento = datetime.fromtimestamp(ts)
+                for resumen, clave in ((horas, momento.strftime("%Y-%m-%d %H:00")),
+                                       (dias, momento.strftime("%Y-%m-%d"))):
+                    acumulado = resumen.setdefault(clave, [0] * (len(CLAVES) + 1))
+                    acumulado[0] += 1
+                    for i, valor in enumerate(valores, 1):
+                        acumulado[i] += valor
+
+            marcas = ", ".join("?" * (len(CLAVES) + 1))
+            with self._conn:
+                self._conn.executemany(
+                    f"INSERT INTO eventos (ts, tipo, {_COLUMNAS}, usuario, reporte) VALUES (?, {marcas}, ?, ?)",
+                    [(ts, tipo, *valores, usuario, reporte) for ts, tipo, valores, usuario, reporte in pendientes])
+                for tabla, columna, resumen in (("resumen_hora", "hora", horas), ("resumen_dia", "dia", dias)):
+                    self._conn.executemany(
+                        f"INSERT INTO {tabla} ({columna}, eventos, {_COLUMNAS}) VALUES (?, {marcas}) "
+                        f"ON CONFLICT({columna}) DO UPDATE SET eventos = eventos + excluded.eventos, {_SUMAS}",
+                        [(clave, *acumulado) for clave, acumulado in resumen.items()])
+            return len(pendientes)
+
+    def podar(self, dias=None):
+        # Borra los eventos crudos viejos; los resúmenes no se tocan
+        limite = time.time() - (dias or self.retencion_dias) * 86400
+        with self._lock_conexion:
+            with self._conn:
+                return self._conn.execute("DELETE FROM eventos WHERE ts < ?", (limite,)).rowcount
+
+    # --- CONSULTAS ---
+    def _consultar(self, sql, parametros=()):
+        self.volcar()
+        with self._lock_conexion:
+            cursor = self._conn.execute(sql, parametros)
+            nombres = [columna[0] for columna in cursor.description]
+            return [dict(zip(nombres, fila)) for fila in cursor]
+
+    def por_hora(self, dias=1):
+        desde = datetime.fromtimestamp(time.time() - dias * 86400).strftime("%Y-%m-%d %H:00")
+        return self._consultar("SELECT * FROM resumen_hora WHERE hora >= ? ORDER BY hora", (desde,))
+
+    def por_dia(self, dias=90):
+        desde = datetime.fromtimestamp(time.time() - dias * 86400).strftime("%Y-%m-%d")
+        return self._consultar("SELECT * FROM resumen_dia WHERE dia >= ? ORDER BY dia", (desde,))
+
+    def promos_por_semana(self, semanas=12):
+        desde = datetime.fromtimestamp(time.time() - semanas * 7 * 86400).strftime("%Y-%m-%d")
+        return self._consultar(
+            "SELECT strftime('%Y-%W', dia) AS semana, SUM(promo1_contador) AS promo1, "
+            "SUM(promo2_contador) AS promo2, SUM(promo3_contador) AS promo3, "
+            "SUM(dinero_ingresado) AS dinero, SUM(fichas_expendidas) AS fichas "
+            "FROM resumen_dia WHERE dia >= ? GROUP BY semana ORDER BY semana", (desde,))
+
+    def eventos(self, desde, hasta=None, tipo=None):
+        # Eventos crudos entre dos timestamps (usa el índice por ts o por tipo, ts)
+        sql = "SELECT * FROM eventos WHERE ts >= ? AND ts < ?"
+        parametros = [desde, hasta or time.time() + 1]
+        if tipo:
+            sql += " AND tipo = ?"
+            parametros.append(tipo)
+        return self._consultar(sql + " ORDER BY ts", parametros)
+
+    def cerrar(self):
+        self.volcar()
+        with self._lock_conexion:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    # 90 días de ventas simuladas y tiempo de los reportes sobre los resúmenes
+    import os
+    import random
+    import tempfile
+
+    historial = Historial(os.path.join(tempfile.mkdtemp(), "historial.db"))
+    azar = random.Random(16)
+    ahora = time.time()
+    inicio = time.perf_counter()
+    for dia in range(90, 0, -1):
+        for _ in range(300):
+            ts = ahora - dia * 86400 + azar.uniform(9, 21) * 3600
+            promo = azar.choice(["promo1_contador", "promo2_contador", "promo3_contador"])
+            historial.registrar("promo", {promo: 1, "dinero_ingresado": 2000, "fichas_restantes": 5}, ts)
+            for _ in range(5):
+                historial.registrar("ficha", {"fichas_expendidas": 1, "fichas_restantes": -1}, ts)
+        historial.volcar()
+    print(f"{90 * 300 * 6} eventos cargados en {time.perf_counter() - inicio:.1f} s")
+
+    for nombre, consulta in [("90 días por hora", lambda: historial.por_hora(90)),
+                             ("90 días por día", lambda: historial.por_dia(90)),
+                             ("promos por semana", lambda: historial.promos_por_semana(13))]:
+        inicio = time.perf_counter()
+        filas = consulta()
+        print(f"{nombre}: {len(filas)} filas en {(time.perf_counter() - inicio) * 1000:.1f} ms")
+
+    total = sum(fila["promo1_contador"] + fila["promo2_contador"] + fila["promo3_contador"]
+                for fila in historial.por_dia(91))
+    assert total == 90 * 300
+    print(f"Eventos crudos borrados con retención de 30 días: {historial.podar(30)}")
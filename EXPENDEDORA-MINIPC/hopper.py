@@ -0,0 +1,430 @@
+# hopper.py - Control del motor del hopper y entrega de fichas
+#
+# Dos modos de entrega:
+#   - "ficha": el modo original, enciende y apaga el motor por cada ficha con
+#     una pausa fija entre fichas.
+#   - "continuo": deja el motor encendido y cuenta los pulsos del sensor hasta
+#     llegar al objetivo. El motor se apaga `anticipo_parada` fichas antes para
+#     compensar la inercia; las que caen después se cuentan igual y, si faltan,
+#     se completan ficha por ficha. El anticipo se ajusta solo después de cada
+#     entrega según las fichas que cayeron por inercia.
+#
+# Los tiempos son por hopper y se configuran en config.json ("hopper").
+#
+# Atascos: cada hopper aprende cuánto tarda normalmente entre fichas (y del
+# encendido a la primera) y declara un atasco cuando pasan `factor_atasco`
+# veces la mediana de esos intervalos sin pulso, en lugar de esperar siempre
+# `tiempo_espera_ficha` (que queda como tope y como espera mientras no hay
+# datos). Ante un atasco apaga el motor, lo invierte si tiene pin de reversa
+# y vuelve a arrancar, hasta `reintentos` veces. Si no sale ninguna ficha
+# queda en estado "vacio_o_atascado" hasta que vuelva a entregar; los
+# cambios de estado se avisan con al_cambiar_estado(hopper, anterior, estado).
+# Si el hopper tiene una captura de diagnóstico (diagnostico.py) la arranca
+# en cada entrega y le avisa de los tiempos excedidos.
+#
+# Pase lo que pase durante una entrega (un al_entregar o al_cambiar_estado
+# que falla, por ejemplo) el motor queda apagado y el estado vuelve a
+# "listo" antes de que la excepción siga su camino.
+#
+# GrupoHoppers reparte una entrega entre varios hoppers (cada uno con su
+# motor y su sensor) que giran en paralelo, y tiene la misma interfaz que
+# Hopper. Si uno se atasca o se vacía, lo que le faltó se completa con los
+# demás y queda fuera de uso por `rehabilitar_tras` segundos.
+
+import threading
+from collections import deque
+
+from metricas import CUBETAS_FICHA, obtener_registro
+from reloj import RELOJ_REAL
+
+MODO_FICHA = "ficha"
+MODO_CONTINUO = "continuo"
+
+ESTADO_LISTO = "listo"
+ESTADO_ENTREGANDO = "entregando"
+ESTADO_RECUPERANDO = "recuperando"  # Atasco detectado: reintentando
+ESTADO_VACIO_O_ATASCADO = "vacio_o_atascado"  # Reintentos agotados sin fichas
+
+VENTANA_INTERVALOS = 31  # Intervalos recientes de los que se toma la mediana
+
+CONFIG_POR_DEFECTO = {
+    "modo": MODO_CONTINUO,
+    "tiempo_espera_ficha": 5,  # Tope de la espera sin pulso (y espera mientras no aprendió)
+    "pausa_entre_fichas": 0.4,  # Solo modo "ficha"
+    "tiempo_asentamiento": 0.15,  # Espera de fichas por inercia tras apagar el motor
+    "anticipo_parada": 0,  # Fichas antes del objetivo en que se apaga el motor
+    "factor_atasco": 4,  # Atasco tras este múltiplo de la mediana sin pulso
+    "espera_minima": 0.3,  # Piso de la espera aprendida
+    "muestras_minimas": 5,  # Intervalos aprendidos antes de usar la mediana
+    "reintentos": 2,  # Rearranques del motor después de un atasco
+    "pausa_reintento": 0.2,  # Motor apagado antes de cada reintento
+    "tiempo_reversa": 0.3  # Reversa por reintento (solo con pin de reversa)
+}
+
+LATENCIA_FICHA = obtener_registro().histograma(
+    "expendedora_ficha_segundos", "Tiempo hasta cada ficha entregada (desde el arranque o la anterior)",
+    CUBETAS_FICHA)
+FICHAS_ENTREGADAS = obtener_registro().contador(
+    "expendedora_fichas_entregadas_total", "Fichas detectadas por el sensor durante entregas")
+TIEMPOS_EXCEDIDOS = obtener_registro().contador(
+    "expendedora_sensor_timeouts_total", "Esperas del sensor del hopper vencidas sin pulso")
+REINTENTOS_ATASCO = obtener_registro().contador(
+    "expendedora_reintentos_atasco_total", "Rearranques del motor del hopper tras un atasco")
+RECUPERACION_ATASCO = obtener_registro().histograma(
+    "expendedora_recuperacion_atasco_segundos",
+    "Desde la última ficha antes de un atasco hasta que vuelven a caer o el hopper se da por vacío/atascado",
+    CUBETAS_FICHA)
+FALLAS_HOPPER = obtener_registro().contador(
+    "expendedora_hopper_fallas_total", "Entregas parciales que sacaron a un hopper del grupo")
+
+
+class Hopper:
+    def __init__(self, gpio, pin_motor, sensor, nombre="principal", reloj=RELOJ_REAL, pin_reversa=None, **config):
+        self.gpio = gpio
+        self.reloj = reloj
+        self.pin_motor = pin_motor
+        self.pin_reversa = pin_reversa  # Opcional: invierte el motor para destrabar
+        self.sensor = sensor
+        self.nombre = nombre
+
+        opciones = dict(CONFIG_POR_DEFECTO)
+        opciones.update(config)
+        self.modo = opciones["modo"]
+        self.tiempo_espera_ficha = opciones["tiempo_espera_ficha"]
+        self.pausa_entre_fichas = opciones["pausa_entre_fichas"]
+        self.tiempo_asentamiento = opciones["tiempo_asentamiento"]
+        self.anticipo_parada = opciones["anticipo_parada"]
+        self.factor_atasco = opciones["factor_atasco"]
+        self.espera_minima = opciones["espera_minima"]
+        self.muestras_minimas = opciones["muestras_minimas"]
+        self.reintentos = opciones["reintentos"]
+        self.pausa_reintento = opciones["pausa_reintento"]
+        self.tiempo_reversa = opciones["tiempo_reversa"]
+
+        self.estado = ESTADO_LISTO
+        self.al_cambiar_estado = None  # callback(hopper, anterior, estado)
+        self._intervalos = deque(maxlen=VENTANA_INTERVALOS)  # Entre fichas con el motor girando
+        self._arranques = deque(maxlen=VENTANA_INTERVALOS)  # Del encendido a la primera ficha
+        self.ultima_entrega = None
+        self.diagnostico = None  # CapturaDiagnostico opcional
+
+    def dispensar(self, cantidad, al_entregar=None, modo=None):
+        # Entrega `cantidad` fichas y llama a al_entregar() por cada una.
+        # Devuelve un resumen con entregadas, segundos, fichas_por_segundo y exceso.
+        modo = modo or self.modo
+        inicio = self.reloj.monotonic()
+        if self.estado != ESTADO_VACIO_O_ATASCADO:
+            self._cambiar_estado(ESTADO_ENTREGANDO)  # Vacío/atascado sigue así hasta que salga una ficha
+        try:
+            if self.diagnostico:
+                self.diagnostico.iniciar(self.sensor.pulsos)
+            if modo == MODO_CONTINUO and cantidad > 1:
+                entregadas = self._dispensar_continuo(cantidad, al_entregar)
+            else:
+                entregadas = self._dispensar_por_ficha(cantidad, al_entregar)
+        finally:
+            self.detener_motor()
+            if self.diagnostico:
+                self.diagnostico.terminar(self.sensor.pulsos)
+            if self.estado != ESTADO_VACIO_O_ATASCADO:
+                self._cambiar_estado(ESTADO_LISTO)
+        segundos = self.reloj.monotonic() - inicio
+
+        resultado = {
+            "hopper": self.nombre,
+            "modo": modo,
+            "solicitadas": cantidad,
+            "entregadas": min(entregadas, cantidad),
+            "exceso": max(0, entregadas - cantidad),
+            "segundos": segundos,
+            "fichas_por_segundo": entregadas / segundos if segundos > 0 else 0.0
+        }
+        self.ultima_entrega = resultado
+        print(f"Hopper {self.nombre}: {resultado['entregadas']}/{cantidad} fichas en "
+              f"{segundos:.2f} s ({resultado['fichas_por_segundo']:.1f} fichas/s)")
+        if resultado["exceso"]:
+            print(f"Hopper {self.nombre}: {resultado['exceso']} ficha(s) de más por inercia del motor")
+        return resultado
+
+    def estados(self):
+        return {self.nombre: self.estado}
+
+    def detener_motor(self):
+        # Motor (y reversa) en LOW; se puede llamar en cualquier momento
+        self.gpio.output(self.pin_motor, self.gpio.LOW)
+        if self.pin_reversa is not None:
+            self.gpio.output(self.pin_reversa, self.gpio.LOW)
+
+    def _cambiar_estado(self, estado):
+        anterior, self.estado = self.estado, estado
+        if anterior == estado:
+            return
+        if estado == ESTADO_VACIO_O_ATASCADO:
+            print(f"Hopper {self.nombre}: vacío o atascado, sin fichas tras {self.reintentos} reintento(s)")
+        if self.al_cambiar_estado:
+            self.al_cambiar_estado(self, anterior, estado)
+
+    def espera_ficha(self, arranque=False):
+        # Segundos sin pulso hasta declarar un atasco: un múltiplo de la mediana
+        # aprendida, o tiempo_espera_ficha mientras no hay suficientes datos.
+        # Sin arranques aprendidos (modo continuo) se usa el intervalo entre fichas.
+        muestras = self._intervalos
+        if arranque and len(self._arranques) >= self.muestras_minimas:
+            muestras = self._arranques
+        if len(muestras) < self.muestras_minimas:
+            return self.tiempo_espera_ficha
+        mediana = sorted(muestras)[len(muestras) // 2]
+        return min(self.tiempo_espera_ficha, max(self.espera_minima, self.factor_atasco * mediana))
+
+    def _esperar_ficha(self, desde, arranque):
+        # Espera el próximo pulso con el motor encendido (arranque: recién
+        # encendido). Devuelve el total de pulsos, o None si después de los
+        # reintentos no salió ninguna ficha.
+        if arranque or self.sensor.ultimo_pulso is None:
+            referencia = self.reloj.monotonic()
+        else:
+            referencia = self.sensor.ultimo_pulso
+        total = self.sensor.esperar_pulso(desde, self.espera_ficha(arranque))
+        if total is None:
+            return self._recuperar(desde, referencia)
+        (self._arranques if arranque else self._intervalos).append(
+            (self.sensor.ultimo_pulso - referencia) / (total - desde))
+        if self.estado != ESTADO_ENTREGANDO:
+            self._cambiar_estado(ESTADO_ENTREGANDO)
+        return total
+
+    def _recuperar(self, desde, referencia):
+        # Atasco: motor apagado, reversa si hay pin, y de nuevo encendido,
+        # hasta `reintentos` veces. Deja el motor encendido.
+        self._tiempo_excedido()
+        if self.estado != ESTADO_VACIO_O_ATASCADO:
+            self._cambiar_estado(ESTADO_RECUPERANDO)
+        for intento in range(self.reintentos):
+            REINTENTOS_ATASCO.inc()
+            self.gpio.output(self.pin_motor, self.gpio.LOW)
+            if self.pin_reversa is not None:
+                self.gpio.output(self.pin_reversa, self.gpio.HIGH)
+                try:
+                    self.reloj.sleep(self.tiempo_reversa)
+                finally:
+                    self.gpio.output(self.pin_reversa, self.gpio.LOW)
+            self.reloj.sleep(self.pausa_reintento)
+            self.gpio.output(self.pin_motor, self.gpio.HIGH)
+            total = self.sensor.esperar_pulso(desde, self.espera_ficha(arranque=True))
+            if total is not None:
+                RECUPERACION_ATASCO.observar(self.reloj.monotonic() - referencia)
+                print(f"Hopper {self.nombre}: destrabado en el reintento {intento + 1}")
+                self._cambiar_estado(ESTADO_ENTREGANDO)
+                return total
+            self._tiempo_excedido()
+        RECUPERACION_ATASCO.observar(self.reloj.monotonic() - referencia)
+        self._cambiar_estado(ESTADO_VACIO_O_ATASCADO)
+        return None
+
+    def _tiempo_excedido(self):
+        TIEMPOS_EXCEDIDOS.inc()
+        print("Error: Tiempo excedido esperando ficha.")
+        if self.diagnostico:
+            self.diagnostico.disparar("timeout")
+
+    def _dispensar_por_ficha(self, cantidad, al_entregar):
+        entregadas = 0
+        for _ in range(cantidad):
+            pulsos_inicio = self.sensor.pulsos
+            arranque = self.reloj.monotonic()
+            self.gpio.output(self.pin_motor, self.gpio.HIGH)  # Activa el motor
+            try:
+                sensor_detectado = self._esperar_ficha(pulsos_inicio, arranque=True) is not None
+            finally:
+                self.gpio.output(self.pin_motor, self.gpio.LOW)  # Desactiva el motor
+            if not sensor_detectado:
+                break
+            LATENCIA_FICHA.observar(self.reloj.monotonic() - arranque)
+            FICHAS_ENTREGADAS.inc()
+            entregadas += 1
+            if al_entregar:
+                al_entregar()
+            self.reloj.sleep(self.pausa_entre_fichas)  # Pausa antes de la siguiente ficha
+        return entregadas
+
+    def _dispensar_continuo(self, cantidad, al_entregar):
+        base = self.sensor.pulsos
+        entregadas = 0
+        parar_en = max(1, cantidad - self.anticipo_parada)
+        anterior = self.reloj.monotonic()
+
+        def contar(total):
+            nonlocal entregadas, anterior
+            ahora = self.reloj.monotonic()
+            LATENCIA_FICHA.observar(ahora - anterior)
+            anterior = ahora
+            FICHAS_ENTREGADAS.inc(total - base - entregadas)
+            while entregadas < total - base:
+                entregadas += 1
+                if entregadas <= cantidad and al_entregar:
+                    al_entregar()
+
+        self.gpio.output(self.pin_motor, self.gpio.HIGH)  # Motor encendido toda la entrega
+        tiempo_excedido = False
+        try:
+            while entregadas < parar_en:
+                total = self._esperar_ficha(base + entregadas, arranque=entregadas == 0)
+                if total is None:
+                    tiempo_excedido = True
+                    break
+                contar(total)  # Llama a al_entregar con el motor encendido
+        finally:
+            self.gpio.output(self.pin_motor, self.gpio.LOW)
+
+        # Fichas que caen por inercia después de apagar el motor
+        al_apagar = entregadas
+        while True:
+            total = self.sensor.esperar_pulso(base + entregadas, self.tiempo_asentamiento)
+            if total is None:
+                break
+            contar(total)
+        inercia = entregadas - al_apagar
+
+        if tiempo_excedido:
+            return entregadas
+
+        # Ajuste del anticipo: si sobraron fichas se apaga antes la próxima vez,
+        # si faltaron se apaga más tarde
+        if inercia > self.anticipo_parada:
+            self.anticipo_parada += 1
+        elif inercia < self.anticipo_parada:
+            self.anticipo_parada -= 1
+
+        if entregadas < cantidad:
+            entregadas += self._dispensar_por_ficha(cantidad - entregadas, al_entregar)
+        return entregadas
+
+
+class GrupoHoppers:
+    def __init__(self, hoppers, reloj=RELOJ_REAL, rehabilitar_tras=600):
+        self.hoppers = list(hoppers)
+        self.reloj = reloj
+        self.rehabilitar_tras = rehabilitar_tras  # Segundos fuera de uso tras una falla
+        self.fallados = {}  # nombre -> momento de la última falla
+        self.ultima_entrega = None
+        self._turno = 0  # Rota quién recibe el resto del reparto
+
+    def disponibles(self):
+        ahora = self.reloj.monotonic()
+        return [h for h in self.hoppers
+                if ahora - self.fallados.get(h.nombre, float("-inf")) >= self.rehabilitar_tras]
+
+    def estados(self):
+        estados = {}
+        for hopper in self.hoppers:
+            estados.update(hopper.estados())
+        return estados
+
+    def fuera_de_uso(self):
+        disponibles = self.disponibles()
+        return [h.nombre for h in self.hoppers if h not in disponibles]
+
+    def detener_motor(self):
+        for hopper in self.hoppers:
+            hopper.detener_motor()
+
+    def rehabilitar(self, nombre=None):
+        # Vuelve a usar un hopper (o todos) antes de que venza la espera
+        if nombre is None:
+            self.fallados.clear()
+        else:
+            self.fallados.pop(nombre, None)
+
+    def _repartir(self, cantidad, hoppers):
+        # Partes iguales; el resto va a los primeros a partir del turno
+        partes = min(len(hoppers), cantidad)
+        orden = hoppers[self._turno % len(hoppers):] + hoppers[:self._turno % len(hoppers)]
+        self._turno += 1
+        base, resto = divmod(cantidad, partes)
+        return [(hopper, base + (1 if i < resto else 0)) for i, hopper in enumerate(orden[:partes])]
+
+    def dispensar(self, cantidad, al_entregar=None, modo=None):
+        # Misma interfaz que Hopper.dispensar; "partes" trae el resumen de cada hopper
+        inicio = self.reloj.monotonic()
+        lock = threading.Lock()
+        entregadas = 0
+
+        def entregar():
+            # Los callbacks llegan de varios hilos: se serializan acá
+            nonlocal entregadas
+            with lock:
+                entregadas += 1
+                if entregadas <= cantidad and al_entregar:
+                    al_entregar()
+
+        partes = []
+        fallados_ahora = set()
+        try:
+            while entregadas < cantidad:
+                candidatos = [h for h in self.hoppers if h.nombre not in fallados_ahora]
+                sanos = [h for h in self.disponibles() if h.nombre not in fallados_ahora]
+                usar = sanos or candidatos  # Si todos fallaron antes, se vuelve a probar
+                if not usar:
+                    print(f"Hoppers: sin hoppers para entregar {cantidad - entregadas} ficha(s)")
+                    break
+                resultados = self._en_paralelo(self._repartir(cantidad - entregadas, usar), entregar, modo)
+                partes.extend(resultados)
+                for resultado in resultados:
+                    if resultado["entregadas"] < resultado["solicitadas"]:
+                        fallados_ahora.add(resultado["hopper"])
+                        self.fallados[resultado["hopper"]] = self.reloj.monotonic()
+                        FALLAS_HOPPER.inc()
+                        print(f"Hopper {resultado['hopper']}: fuera de uso, se completa con los demás")
+        finally:
+            # _en_paralelo espera a todos los hilos aunque alguno falle; igual
+            # ningún motor del grupo queda encendido al salir
+            self.detener_motor()
+
+        segundos = self.reloj.monotonic() - inicio
+        resultado = {
+            "hopper": "+".join(dict.fromkeys(parte["hopper"] for parte in partes)),
+            "modo": modo or self.hoppers[0].modo,
+            "solicitadas": cantidad,
+            "entregadas": min(entregadas, cantidad),
+            "exceso": max(0, entregadas - cantidad),
+            "segundos": segundos,
+            "fichas_por_segundo": entregadas / segundos if segundos > 0 else 0.0,
+            "partes": partes
+        }
+        self.ultima_entrega = resultado
+        return resultado
+
+    def _en_paralelo(self, asignacion, entregar, modo):
+        # Un hilo por hopper (el reloj virtual los coordina en la simulación)
+        return self.reloj.paralelo([lambda h=hopper, c=cantidad: h.dispensar(c, entregar, modo)
+                                    for hopper, cantidad in asignacion])
+
+
+if __name__ == "__main__":
+    # Promo de 35 fichas con uno y con dos hoppers simulados, y un atasco
+    # del segundo a mitad de la entrega (se completa con el principal)
+    import contextlib
+    import io
+
+    from gpio_sim import GPIO, HopperSimulado
+    from sensor_hopper import SensorHopper
+
+    PINES = [(24, 23), (0, 25)]  # (motor, sensor): SALIDA/ENTHOPER y SAL1
+
+    def armar(cantidad_hoppers, atasco_en=None):
+        GPIO.reiniciar()
+        hoppers = []
+        for i, (motor, sensor) in enumerate(PINES[:cantidad_hoppers]):
+            GPIO.setup(sensor, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+            GPIO.setup(motor, GPIO.OUT)
+            GPIO.conectar(HopperSimulado(motor, sensor, atasco_en=atasco_en if i else None))
+            hoppers.append(Hopper(GPIO, motor, SensorHopper(GPIO, sensor, reloj=GPIO.reloj),
+                                  nombre=f"hopper{i + 1}", reloj=GPIO.reloj, modo="continuo"))
+        return GrupoHoppers(hoppers, reloj=GPIO.reloj)
+
+    for titulo, hoppers, atasco_en in (("1 hopper", 1, None), ("2 hoppers", 2, None), ("2 hoppers, atasco", 2, 6)):
+        grupo = armar(hoppers, atasco_en)
+        with contextlib.redirect_stdout(io.StringIO()):
+            resultado = grupo.dispensar(35)
+        partes = ", ".join(f"{p['hopper']}={p['entregadas']}/{p['solicitadas']}" for p in resultado["partes"])
+        print(f"{titulo:<18} {resultado['entregadas']} fichas en {resultado['segundos']:.2f} s virtuales ({partes})")
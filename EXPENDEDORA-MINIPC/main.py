@@ -1,25 +1,47 @@
+import arranque  # Primero: toma el tiempo de los imports que siguen
 import threading
 import tkinter as tk
-from expendedora_gui import ExpendedoraGUI
-from expendedora_core import enviar_pulso, init_db
+from cliente_servicio import iniciar_servicio_si_falta
 from User_management import UserManagement
 
-def start_gui():
-    root = tk.Tk()
-    app = ExpendedoraGUI(root, username="username") 
-    root.mainloop()
-def main(username):
-    # Inicializar la base de datos
-    init_db()
-    
-    # Iniciar el envío de pulsos al servidor
-    threading.Thread(target=enviar_pulso).start()
+arranque.marcar("imports")
+
+
+def _levantar_servicio(levantado):
+    try:
+        levantado["cliente"] = iniciar_servicio_si_falta()
+    except Exception as e:
+        print(f"No se pudo iniciar el servicio: {e}")
+
+
+def abrir_gui(username, hilo_servicio, levantado):
+    arranque.marcar("login", espera=True)
+    from expendedora_gui import ExpendedoraGUI  # Recién ahora: no demora el login
+    arranque.marcar("import_gui")
+
+    # El servicio (hardware, base de datos, heartbeat) corre en su propio
+    # proceso; se lanzó al arrancar y acá solo se espera que esté listo
+    hilo_servicio.join()
+    servicio = levantado.get("cliente") or iniciar_servicio_si_falta()
+    arranque.marcar("servicio")
     
     # Iniciar la interfaz gráfica
     root = tk.Tk()
-    app = ExpendedoraGUI(root, username)  # Pasar el nombre de usuario
+    app = ExpendedoraGUI(root, username, servicio)  # Pasar el nombre de usuario
+    root.update()  # Dibujar la pantalla de ventas antes de tomar el tiempo
+    arranque.marcar("pantalla_ventas")
+    arranque.informe()
     root.mainloop()
 
+def main():
+    # El servicio se levanta en segundo plano mientras se muestra el login
+    levantado = {}
+    hilo_servicio = threading.Thread(target=_levantar_servicio, args=(levantado,), daemon=True)
+    hilo_servicio.start()
+    user_management = UserManagement(lambda username: abrir_gui(username, hilo_servicio, levantado))
+    user_management.root.update()
+    arranque.marcar("login_visible")
+    user_management.run()  # No se pasa ningún argumento aquí
+
 if __name__ == "__main__":
-    user_management = UserManagement(main)
-    user_management.run()  # No se pasa ningún argumento aquí
\ No newline at end of file
+    main()
\ No newline at end of file
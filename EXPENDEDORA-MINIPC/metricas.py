@@ -0,0 +1,189 @@
+# metricas.py - Registro de métricas y endpoint /metrics (formato Prometheus)
+#
+# Tres tipos: Contador (solo sube), Medidor (valor actual, fijo o calculado
+# al momento de leerlo) e Histograma de cubetas fijas. Las cubetas se crean
+# al declarar la métrica; observar() solo anota el valor en una deque (sin
+# lock: append y popleft son seguros entre hilos) y la cubeta se busca
+# (bisect) al leer /metrics o cada PENDIENTES_HISTOGRAMA valores, fuera del
+# camino caliente de quien observa.
+#
+# Las métricas se declaran una vez, a nivel de módulo, en el código que las
+# usa. El servicio levanta el endpoint HTTP local con iniciar_servidor().
+#
+# Uso: curl http://127.0.0.1:9108/metrics
+
+import bisect
+import collections
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PUERTO = 9108
+
+# Cubetas por defecto, en segundos
+CUBETAS_FICHA = (0.05, 0.1, 0.15, 0.2, 0.3, 0.5, 1.0, 2.0, 5.0)
+CUBETAS_MICRO = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 1e-3)
+CUBETAS_DISCO = (1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.025, 0.05, 0.1, 0.5)
+PENDIENTES_HISTOGRAMA = 512  # Valores sin contar antes de pasarlos a las cubetas
+
+
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.valor = 0
+        self._lock = threading.Lock()
+
+    def inc(self, cantidad=1):
+        with self._lock:
+            self.valor += cantidad
+
+    def exponer(self):
+        return [f"{self.nombre} {self.valor}"]
+
+
+class Medidor:
+    tipo = "gauge"
+
+    def __init__(self, nombre, ayuda, funcion=None):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.valor = 0
+        self.funcion = funcion  # Si está, el valor se calcula al leer /metrics
+
+    def set(self, valor):
+        self.valor = valor
+
+    def exponer(self):
+        valor = self.funcion() if self.funcion else self.valor
+        return [f"{self.nombre} {valor}"]
+
+
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, cubetas):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.limites = tuple(sorted(cubetas))
+        self.cuentas = [0] * (len(self.limites) + 1)  # La última es +Inf
+        self.suma = 0.0
+        self._sin_contar = collections.deque()
+        self._lock = threading.Lock()  # Un solo hilo a la vez pasa valores a las cubetas
+
+    def observar(self, valor):
+        self._sin_contar.append(valor)
+        if len(self._sin_contar) >= PENDIENTES_HISTOGRAMA:
+            self.contar()
+
+    def contar(self):
+        # Pasa los valores anotados a sus cubetas
+        with self._lock:
+            sin_contar = self._sin_contar
+            while sin_contar:
+                valor = sin_contar.popleft()
+                self.cuentas[bisect.bisect_left(self.limites, valor)] += 1
+                self.suma += valor
+
+    def exponer(self):
+        self.contar()
+        with self._lock:
+            cuentas = list(self.cuentas)
+            suma = self.suma
+        lineas = []
+        acumulado = 0
+        for limite, cuenta in zip(self.limites + ("+Inf",), cuentas):
+            acumulado += cuenta
+            lineas.append(f'{self.nombre}_bucket{{le="{limite}"}} {acumulado}')
+        lineas.append(f"{self.nombre}_sum {suma}")
+        lineas.append(f"{self.nombre}_count {acumulado}")
+        return lineas
+
+
+class Registro:
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _declarar(self, clase, nombre, *args):
+        # Declarar dos veces el mismo nombre devuelve la misma métrica
+        with self._lock:
+            if nombre not in self._metricas:
+                self._metricas[nombre] = clase(nombre, *args)
+            return self._metricas[nombre]
+
+    def contador(self, nombre, ayuda):
+        return self._declarar(Contador, nombre, ayuda)
+
+    def medidor(self, nombre, ayuda, funcion=None):
+        medidor = self._declarar(Medidor, nombre, ayuda, funcion)
+        if funcion:
+            medidor.funcion = funcion  # El último en declararlo lo calcula
+        return medidor
+
+    def histograma(self, nombre, ayuda, cubetas):
+        return self._declarar(Histograma, nombre, ayuda, cubetas)
+
+    def exponer(self):
+        # Texto en formato de exposición de Prometheus
+        with self._lock:
+            metricas = list(self._metricas.values())
+        lineas = []
+        for metrica in metricas:
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            try:
+                lineas.extend(metrica.exponer())
+            except Exception as e:
+                lineas.append(f"# Error al leer {metrica.nombre}: {e}")
+        return "\n".join(lineas) + "\n"
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        cuerpo = self.server.registro.exponer().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *args):
+        pass  # Sin una línea de log por cada lectura
+
+
+def iniciar_servidor(registro=None, host="127.0.0.1", puerto=PUERTO):
+    # Solo escucha en localhost; devuelve el servidor para poder cerrarlo
+    servidor = ThreadingHTTPServer((host, puerto), _Manejador)
+    servidor.daemon_threads = True
+    servidor.registro = registro or obtener_registro()
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+# --- REGISTRO COMPARTIDO ---
+_registro = Registro()
+
+
+def obtener_registro():
+    return _registro
+
+
+if __name__ == "__main__":
+    # Costo de registrar un valor, que es lo que se paga en el camino caliente
+    import time
+
+    histograma = obtener_registro().histograma("prueba_segundos", "Prueba", CUBETAS_MICRO)
+    contador = obtener_registro().contador("prueba_total", "Prueba")
+    for nombre, funcion in [("Histograma.observar", lambda: histograma.observar(3e-6)),
+                            ("Contador.inc", contador.inc)]:
+        n = 500000
+        inicio = time.perf_counter()
+        for _ in range(n):
+            funcion()
+        print(f"{nombre}: {(time.perf_counter() - inicio) / n * 1e9:.0f} ns por llamada")
+    print(obtener_registro().exponer())
@@ -0,0 +1,101 @@
+# planificador.py - Tareas periódicas en un solo hilo
+#
+# Reemplaza los threading.Timer que se re-armaban solos (un hilo nuevo por
+# ejecución). Un único hilo duerme hasta la próxima tarea usando el reloj
+# monotónico. Cada ejecución puede correrse al azar hasta `jitter` segundos
+# para que varias expendedoras no golpeen el servidor al mismo tiempo. Si una
+# tarea se atrasa más de un período (kiosko suspendido, tarea lenta), los
+# disparos perdidos se saltean en lugar de ejecutarse todos juntos.
+
+import heapq
+import itertools
+import random
+import threading
+import time
+
+
+class Planificador:
+    def __init__(self):
+        self._tareas = []  # heap de (momento, orden, tarea)
+        self._orden = itertools.count()
+        self._cond = threading.Condition()
+        self._detener = False
+        self._hilo = None
+
+    def cada(self, intervalo, funcion, jitter=0.0, inmediato=True, nombre=None):
+        ahora = time.monotonic()
+        tarea = {
+            "nombre": nombre or getattr(funcion, "__name__", "tarea"),
+            "funcion": funcion,
+            "intervalo": intervalo,
+            "jitter": jitter,
+            "base": ahora if inmediato else ahora + intervalo,
+            "salteadas": 0,
+            "cancelada": False
+        }
+        with self._cond:
+            heapq.heappush(self._tareas, (tarea["base"], next(self._orden), tarea))
+            self._cond.notify()
+        return tarea
+
+    def cancelar(self, tarea):
+        # La tarea sale del heap la próxima vez que le toque y no se re-arma
+        tarea["cancelada"] = True
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self._bucle, daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        with self._cond:
+            self._detener = True
+            self._cond.notify()
+        if self._hilo:
+            self._hilo.join()
+
+    def _bucle(self):
+        while True:
+            with self._cond:
+                while not self._detener:
+                    if self._tareas:
+                        espera = self._tareas[0][0] - time.monotonic()
+                        if espera <= 0:
+                            break
+                        self._cond.wait(espera)
+                    else:
+                        self._cond.wait()
+                if self._detener:
+                    return
+                _, _, tarea = heapq.heappop(self._tareas)
+
+            if tarea["cancelada"]:
+                continue
+            try:
+                tarea["funcion"]()
+            except Exception as e:
+                print(f"Error en tarea periódica {tarea['nombre']}: {e}")
+
+            # Próximo disparo alineado a la base; si ya pasó, saltear los perdidos
+            ahora = time.monotonic()
+            tarea["base"] += tarea["intervalo"]
+            if tarea["base"] < ahora:
+                perdidos = int((ahora - tarea["base"]) // tarea["intervalo"]) + 1
+                tarea["base"] += perdidos * tarea["intervalo"]
+                tarea["salteadas"] += perdidos
+            momento = tarea["base"] + random.uniform(0, tarea["jitter"])
+            with self._cond:
+                heapq.heappush(self._tareas, (momento, next(self._orden), tarea))
+
+
+# --- PLANIFICADOR COMPARTIDO ---
+_planificador = None
+_planificador_lock = threading.Lock()
+
+
+def obtener_planificador():
+    global _planificador
+    with _planificador_lock:
+        if _planificador is None:
+            _planificador = Planificador()
+            _planificador.iniciar()
+        return _planificador
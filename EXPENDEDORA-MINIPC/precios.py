@@ -0,0 +1,131 @@
+# precios.py - Motor de precios: conversión de crédito a fichas
+#
+# Los escalones de la base (VALOR1..N / FICHAS1..N) y, si se piden, las
+# promociones de config.json y el valor de la ficha suelta se compilan una sola
+# vez en una tabla ordenada de (precio, fichas). Con solo los escalones la
+# conversión es la misma que hacía convertir_fichas. Convertir un crédito es una sola pasada
+# por la tabla, O(escalones): en cada escalón se toman todas las veces que
+# entra y se sigue con el resto, así que el sobrante final siempre es menor
+# que el precio más barato.
+#
+# Políticas (orden de la tabla):
+#   - "escalones": primero el escalón más caro que alcance, como hacía
+#     convertir_fichas pero sin tener que llamarla una vez por escalón.
+#   - "mejor_valor": primero el escalón con más fichas por peso. Es la
+#     aproximación golosa al máximo de fichas; no prueba combinaciones.
+
+POLITICA_ESCALONES = "escalones"
+POLITICA_MEJOR_VALOR = "mejor_valor"
+POLITICAS = (POLITICA_ESCALONES, POLITICA_MEJOR_VALOR)
+
+
+class TablaPrecios:
+    __slots__ = ("politica", "escalones", "_tabla", "_minimo")
+
+    def __init__(self, escalones, politica=POLITICA_ESCALONES):
+        # escalones: iterable de (nombre, precio, fichas); se ignoran los que
+        # tengan precio o fichas en cero (promos sin configurar)
+        if politica not in POLITICAS:
+            raise ValueError(f"Política de precios desconocida: {politica}")
+        validos = [(nombre, precio, fichas) for nombre, precio, fichas in escalones
+                   if precio > 0 and fichas > 0]
+        if politica == POLITICA_ESCALONES:
+            # Más caro primero; a igual precio, el que da más fichas
+            validos.sort(key=lambda e: (-e[1], -e[2]))
+        else:
+            # Más fichas por peso primero; a igual proporción, el más caro
+            validos.sort(key=lambda e: (-e[2] / e[1], -e[1]))
+
+        self.politica = politica
+        self.escalones = tuple(validos)
+        self._tabla = tuple((precio, fichas) for _, precio, fichas in validos)
+        self._minimo = min(self._tabla)[0] if validos else 0
+
+    def convertir(self, credito):
+        # Devuelve (fichas, resto) en una sola pasada por la tabla
+        total = 0
+        if credito < self._minimo or not self._tabla:
+            return total, credito
+        for precio, fichas in self._tabla:
+            if credito >= precio:
+                veces = int(credito // precio)
+                total += veces * fichas
+                credito -= veces * precio
+                if credito < self._minimo:
+                    break
+        return total, credito
+
+    def desglose(self, credito):
+        # Igual que convertir() pero con cuántas veces se usó cada escalón
+        usados = []
+        for nombre, precio, fichas in self.escalones:
+            if credito >= precio:
+                veces = int(credito // precio)
+                usados.append((nombre, veces, veces * fichas))
+                credito -= veces * precio
+        return usados, credito
+
+
+def compilar(tarifas, promociones=None, valor_ficha=None, politica=POLITICA_ESCALONES):
+    # tarifas: [(valor, fichas)] de ConfigDB.obtener_tarifas()
+    # promociones: {"Promo 1": {"precio": ..., "fichas": ...}} de config.json
+    escalones = [(f"Escalón {i}", valor, fichas) for i, (valor, fichas) in enumerate(tarifas, 1)]
+    for nombre, promo in (promociones or {}).items():
+        escalones.append((nombre, promo.get("precio", 0), promo.get("fichas", 0)))
+    if valor_ficha:
+        escalones.append(("Ficha suelta", valor_ficha, 1))
+    return TablaPrecios(escalones, politica)
+
+
+if __name__ == "__main__":
+    # Propiedades sobre montos al azar y velocidad de conversión
+    import random
+    import time
+
+    azar = random.Random(13)
+
+    def convertir_anterior(credito, tarifas):
+        # convertir_fichas original, llamada hasta que no entre ningún escalón
+        (valor1, fichas1), (valor2, fichas2), (valor3, fichas3) = tarifas
+        total = 0
+        while credito >= valor1:
+            if credito < valor2:
+                total, credito = total + fichas1, credito - valor1
+            elif credito < valor3:
+                total, credito = total + fichas2, credito - valor2
+            else:
+                total, credito = total + fichas3, credito - valor3
+        return total, credito
+
+    for _ in range(2000):
+        tarifas = sorted((azar.randint(1, 200) * 50, azar.randint(1, 40)) for _ in range(3))
+        if len({valor for valor, _ in tarifas}) < 3:
+            continue
+        promociones = {f"Promo {i}": {"precio": azar.randint(0, 300) * 50, "fichas": azar.randint(0, 60)}
+                       for i in range(1, 4)}
+        solo_tarifas = compilar(tarifas)
+        completas = {politica: compilar(tarifas, promociones, azar.choice([0, 600]), politica)
+                     for politica in POLITICAS}
+        for _ in range(50):
+            credito = azar.randint(0, 100000)
+            # Con solo los tres escalones, "escalones" reproduce la conversión anterior
+            assert solo_tarifas.convertir(credito) == convertir_anterior(credito, tarifas)
+            for tabla in completas.values():
+                fichas, resto = tabla.convertir(credito)
+                usados, resto_desglose = tabla.desglose(credito)
+                # No se pierde ni se inventa crédito, y el resto no alcanza para nada
+                precios = dict((nombre, precio) for nombre, precio, _ in tabla.escalones)
+                assert resto == resto_desglose and 0 <= resto
+                assert sum(precios[n] * veces for n, veces, _ in usados) + resto == credito
+                assert fichas == sum(f for _, _, f in usados)
+                assert all(resto < precio for _, precio, _ in tabla.escalones)
+    print("Propiedades OK")
+
+    tabla = compilar([(1000, 1), (5000, 2), (10000, 5)],
+                     {"Promo 3": {"precio": 10000, "fichas": 35}}, 600, POLITICA_MEJOR_VALOR)
+    montos = [azar.randint(0, 200) * 500 for _ in range(1000000)]
+    inicio = time.perf_counter()
+    for monto in montos:
+        tabla.convertir(monto)
+    segundos = time.perf_counter() - inicio
+    print(f"{len(montos)} conversiones en {segundos:.2f} s ({segundos / len(montos) * 1e6:.2f} µs c/u)")
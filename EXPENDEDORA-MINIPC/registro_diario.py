@@ -0,0 +1,104 @@
+# registro_diario.py - Registro de apertura/cierre (registro.json) en memoria
+#
+# RegistroDiario es el único dueño del registro: lo lee una vez al crearse y
+# después se trabaja sobre la copia en memoria.
+#
+# El archivo se escribe con EscritorDiferido: los cambios solo lo marcan
+# como sucio y una tarea del planificador lo escribe (temporal + fsync +
+# rename) como mucho una vez cada `intervalo` segundos. La apertura y el
+# cierre se escriben en el momento.
+
+import copy
+import json
+import os
+import threading
+from datetime import datetime
+
+from bitacora import escribir_atomico
+from planificador import obtener_planificador
+
+PROMOCIONES = ("Promo 1", "Promo 2", "Promo 3")
+
+
+class EscritorDiferido:
+    def __init__(self, ruta, generar, intervalo=1.0):
+        self.ruta = ruta
+        self.generar = generar  # Devuelve el contenido a escribir
+        self.intervalo = intervalo
+        self.escrituras = 0
+        self._sucio = False
+        self._lock = threading.Lock()  # Una escritura a la vez
+        self._tarea_lock = threading.Lock()
+        self._tarea = None
+
+    def marcar(self):
+        self._sucio = True
+        if self._tarea is None:
+            # La tarea se crea con el primer cambio, no al importar
+            with self._tarea_lock:
+                if self._tarea is None:
+                    self._tarea = obtener_planificador().cada(self.intervalo, self.volcar, inmediato=False,
+                                                              nombre=f"escribir {self.ruta}")
+
+    def volcar(self):
+        # Escribe si hubo cambios desde la última escritura
+        with self._lock:
+            if not self._sucio:
+                return False
+            self._sucio = False
+            escribir_atomico(self.ruta, self.generar())
+            self.escrituras += 1
+            return True
+
+    def cerrar(self):
+        if self._tarea:
+            obtener_planificador().cancelar(self._tarea)
+            self._tarea = None
+        self.volcar()
+
+
+class RegistroDiario:
+    def __init__(self, ruta, intervalo_escritura=1.0):
+        self._lock = threading.Lock()
+        self._escritor = EscritorDiferido(ruta, self._serializar, intervalo_escritura)
+        self._registro = None
+        if os.path.exists(ruta):
+            with open(ruta, 'r') as f:
+                self._registro = json.load(f)
+        else:
+            self.iniciar_apertura()
+
+    def _serializar(self):
+        with self._lock:
+            return json.dumps(self._registro, indent=4)
+
+    def a_dict(self):
+        with self._lock:
+            return copy.deepcopy(self._registro)
+
+    def iniciar_apertura(self):
+        with self._lock:
+            self._registro = {
+                "apertura": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                "fichas_expendidas": 0,
+                "dinero_ingresado": 0,
+                "promociones_usadas": {promo: 0 for promo in PROMOCIONES}
+            }
+        self._escritor.marcar()
+        self._escritor.volcar()
+        return self.a_dict()
+
+    def realizar_cierre(self):
+        with self._lock:
+            self._registro["cierre"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self._escritor.marcar()
+        self._escritor.volcar()
+        return self.a_dict()
+
+    def reemplazar(self, registro):
+        with self._lock:
+            self._registro = copy.deepcopy(registro)
+        self._escritor.marcar()
+
+    def cerrar(self):
+        self._escritor.cerrar()
@@ -0,0 +1,56 @@
+# reloj.py - Fuente de tiempo del control de hardware
+#
+# El sensor y el hopper no llaman directamente a time.monotonic/time.sleep sino
+# a un reloj. Con el hardware real se usa RelojReal; gpio_sim.GPIO trae un
+# reloj virtual que adelanta el tiempo al próximo evento programado, así los
+# escenarios simulados corren sin pausas reales.
+#
+# paralelo() corre varias funciones en hilos (un hopper por hilo). Con el
+# reloj real son hilos comunes; el virtual además coordina a los hilos para
+# que el tiempo no avance mientras alguno todavía está corriendo.
+
+import threading
+import time
+
+
+def correr_en_hilos(funciones, envolver=lambda funcion: funcion):
+    # Un hilo por función salvo la última, que corre en el hilo que llama;
+    # devuelve los resultados en orden. Si alguna falla se espera igual a
+    # todas y después se relanza la primera excepción.
+    resultados = [None] * len(funciones)
+    errores = []
+
+    def correr(i):
+        try:
+            resultados[i] = envolver(funciones[i])()
+        except BaseException as e:
+            errores.append(e)
+
+    hilos = [threading.Thread(target=correr, args=(i,), daemon=True) for i in range(len(funciones) - 1)]
+    for hilo in hilos:
+        hilo.start()
+    correr(len(funciones) - 1)
+    for hilo in hilos:
+        hilo.join()
+    if errores:
+        raise errores[0]
+    return resultados
+
+
+class RelojReal:
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, segundos):
+        time.sleep(segundos)
+
+    def esperar(self, cond, predicado, timeout):
+        # Bloquea en la condición hasta que predicado() sea verdadero o se cumpla el timeout
+        with cond:
+            return cond.wait_for(predicado, timeout)
+
+    def paralelo(self, funciones):
+        return correr_en_hilos(funciones)
+
+
+RELOJ_REAL = RelojReal()
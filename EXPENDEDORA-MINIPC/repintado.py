@@ -0,0 +1,40 @@
+# repintado.py - Repintado agrupado de etiquetas de la GUI
+#
+# Los eventos solo marcan como "sucias" las etiquetas afectadas. Una vez por
+# cuadro (root.after) se recalcula el texto de las sucias y se llama a
+# config() únicamente si el texto cambió. Así el costo de la interfaz no
+# depende de cuántos eventos lleguen por segundo.
+#
+# marcar() debe llamarse desde el hilo de Tk.
+
+
+class Repintado:
+    def __init__(self, root, intervalo_ms=33):
+        self.root = root
+        self.intervalo_ms = intervalo_ms  # ~30 cuadros por segundo
+        self._etiquetas = {}  # clave -> (label, función que arma el texto)
+        self._textos = {}  # clave -> último texto mostrado
+        self._sucias = set()
+        self._programado = False
+
+    def registrar(self, clave, label, texto):
+        self._etiquetas[clave] = (label, texto)
+        self._textos[clave] = label.cget("text")
+
+    def marcar(self, *claves):
+        self._sucias.update(claves or self._etiquetas)
+        if not self._programado:
+            self._programado = True
+            self.root.after(self.intervalo_ms, self.aplicar)
+
+    def aplicar(self):
+        self._programado = False
+        sucias, self._sucias = self._sucias, set()
+        for clave in sucias:
+            if clave not in self._etiquetas:
+                continue
+            label, texto = self._etiquetas[clave]
+            nuevo = texto()
+            if nuevo != self._textos[clave]:
+                label.config(text=nuevo)
+                self._textos[clave] = nuevo
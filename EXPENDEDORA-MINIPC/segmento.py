@@ -0,0 +1,134 @@
+# segmento.py - Contadores en vivo en un archivo mapeado en memoria
+#
+# El servicio publica el libro de contadores en un archivo de formato fijo
+# (por defecto en /dev/shm, o sea en RAM) después de cada evento. Cualquier
+# otro proceso lo mapea y lee una copia consistente sin abrir ni parsear
+# archivos y sin llamadas al sistema por lectura.
+#
+# Formato (little endian):
+#   0   8s   "EXPCONT1"
+#   8   u32  cantidad de claves (len(CLAVES))
+#   12  u32  reservado
+#   16  u64  secuencia (seqlock: impar = escritura en curso)
+#   24  f64  time.time() de la última publicación
+#   32  f64  totales[CLAVES], base apertura[CLAVES], base parcial[CLAVES]
+#
+# El escritor incrementa la secuencia (queda impar), escribe los valores y la
+# vuelve a incrementar (par). El lector toma la secuencia, copia los valores
+# y vuelve a leerla: si cambió o era impar, reintenta.
+#
+# Uso: python3 segmento.py [--ruta RUTA] [--intervalo 0.1] [--una-vez]
+
+import mmap
+import os
+import struct
+import time
+
+from contadores import APERTURA, CLAVES, PARCIAL, PERIODOS, TOTAL
+
+MAGIA = b"EXPCONT1"
+RUTA_POR_DEFECTO = ("/dev/shm/expendedora_contadores" if os.path.isdir("/dev/shm")
+                    else "contadores.shm")
+
+_CABECERA = struct.Struct("<8sII")
+_SECUENCIA = struct.Struct("<Q")
+_DATOS = struct.Struct("<d" + "d" * (len(CLAVES) * 3))
+OFFSET_SECUENCIA = _CABECERA.size
+OFFSET_DATOS = OFFSET_SECUENCIA + _SECUENCIA.size
+TAMANIO = OFFSET_DATOS + _DATOS.size
+
+
+class EscritorSegmento:
+    def __init__(self, ruta=RUTA_POR_DEFECTO):
+        self.ruta = ruta
+        self._seq = 0
+        # Archivo nuevo + rename: un lector que tenga mapeado el anterior no
+        # lo ve truncarse (eso le daría SIGBUS), solo deja de recibir cambios
+        tmp = ruta + ".tmp"
+        with open(tmp, 'wb') as f:
+            f.write(_CABECERA.pack(MAGIA, len(CLAVES), 0))
+            f.write(b"\0" * (TAMANIO - _CABECERA.size))
+        os.replace(tmp, ruta)
+        self._archivo = open(ruta, 'r+b')
+        self._mm = mmap.mmap(self._archivo.fileno(), TAMANIO)
+
+    def publicar(self, libro):
+        # Un solo escritor (el servicio); llamarlo con el libro ya actualizado
+        mm = self._mm
+        self._seq += 1
+        _SECUENCIA.pack_into(mm, OFFSET_SECUENCIA, self._seq)
+        _DATOS.pack_into(mm, OFFSET_DATOS, time.time(), *libro.totales,
+                         *libro.bases[APERTURA], *libro.bases[PARCIAL])
+        self._seq += 1
+        _SECUENCIA.pack_into(mm, OFFSET_SECUENCIA, self._seq)
+
+    def cerrar(self):
+        self._mm.close()
+        self._archivo.close()
+
+
+class LectorSegmento:
+    def __init__(self, ruta=RUTA_POR_DEFECTO):
+        with open(ruta, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), TAMANIO, access=mmap.ACCESS_READ)
+        magia, claves, _ = _CABECERA.unpack_from(self._mm, 0)
+        if magia != MAGIA or claves != len(CLAVES):
+            self._mm.close()
+            raise ValueError(f"{ruta} no es un segmento de contadores compatible")
+        self.reintentos = 0
+
+    def leer_crudo(self):
+        # Devuelve (secuencia, ts, valores) de una misma publicación
+        mm = self._mm
+        while True:
+            antes = _SECUENCIA.unpack_from(mm, OFFSET_SECUENCIA)[0]
+            if not antes & 1:
+                datos = _DATOS.unpack_from(mm, OFFSET_DATOS)
+                if _SECUENCIA.unpack_from(mm, OFFSET_SECUENCIA)[0] == antes:
+                    return antes, datos[0], datos[1:]
+            self.reintentos += 1
+
+    def leer(self):
+        # {"seq", "ts", "contadores", "contadores_apertura", "contadores_parciales"}
+        seq, ts, valores = self.leer_crudo()
+        n = len(CLAVES)
+        totales = valores[:n]
+        lectura = {"seq": seq, "ts": ts, TOTAL: dict(zip(CLAVES, totales))}
+        for i, periodo in enumerate((APERTURA, PARCIAL), 1):
+            base = valores[i * n:(i + 1) * n]
+            lectura[periodo] = {clave: total - b for clave, total, b in zip(CLAVES, totales, base)}
+        return lectura
+
+    def cerrar(self):
+        self._mm.close()
+
+
+if __name__ == "__main__":
+    # Lector de consola: muestra los contadores cada vez que cambian
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Contadores en vivo de la expendedora")
+    parser.add_argument("--ruta", default=RUTA_POR_DEFECTO)
+    parser.add_argument("--intervalo", type=float, default=0.1, help="Segundos entre lecturas")
+    parser.add_argument("--una-vez", action="store_true", help="Mostrar una lectura y salir")
+    args = parser.parse_args()
+
+    lector = LectorSegmento(args.ruta)
+    ultima = None
+    try:
+        while True:
+            lectura = lector.leer()
+            if lectura["seq"] != ultima:
+                ultima = lectura["seq"]
+                momento = time.strftime("%H:%M:%S", time.localtime(lectura["ts"]))
+                print(f"[{momento}] seq {lectura['seq']}")
+                for periodo in PERIODOS:
+                    valores = ", ".join(f"{clave}={valor:g}" for clave, valor in lectura[periodo].items())
+                    print(f"  {periodo}: {valores}")
+            if args.una_vez:
+                break
+            time.sleep(args.intervalo)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        lector.cerrar()
@@ -0,0 +1,62 @@
+# segundo_plano.py - Llamadas al servicio fuera del hilo de Tk
+#
+# Un pedido al servicio puede tardar hasta el timeout del socket, y más si
+# hay que reconectar. Para que la interfaz no se congele mientras tanto, las
+# llamadas se encolan a un único hilo trabajador que las hace en orden. El
+# resultado (o la excepción) vuelve por otra cola que el hilo de Tk revisa
+# con root.after, así los callbacks tocan widgets solo desde ese hilo.
+#
+# llamar() y detener() deben llamarse desde el hilo de Tk; los callbacks
+# corren también en él.
+
+import queue
+import threading
+
+
+class LlamadasEnSegundoPlano:
+    def __init__(self, root, intervalo_ms=20):
+        self.root = root
+        self.intervalo_ms = intervalo_ms  # Cada cuánto se revisan resultados con llamadas en vuelo
+        self._pedidos = queue.Queue()
+        self._resultados = queue.Queue()
+        self._en_vuelo = 0
+        self._hilo = threading.Thread(target=self._bucle, daemon=True, name="llamadas al servicio")
+        self._hilo.start()
+
+    def llamar(self, funcion, al_terminar=None, al_fallar=None):
+        # al_terminar(resultado) o al_fallar(excepción), en el hilo de Tk
+        self._pedidos.put((funcion, al_terminar, al_fallar))
+        self._en_vuelo += 1
+        if self._en_vuelo == 1:
+            self.root.after(self.intervalo_ms, self._entregar)
+
+    def detener(self):
+        # Las llamadas ya encoladas se hacen igual; sus callbacks se descartan
+        self._pedidos.put(None)
+
+    def _bucle(self):
+        while True:
+            pedido = self._pedidos.get()
+            if pedido is None:
+                return
+            funcion, al_terminar, al_fallar = pedido
+            try:
+                self._resultados.put((al_terminar, funcion()))
+            except Exception as e:
+                self._resultados.put((al_fallar, e))
+
+    def _entregar(self):
+        while True:
+            try:
+                callback, valor = self._resultados.get_nowait()
+            except queue.Empty:
+                break
+            self._en_vuelo -= 1
+            if callback:
+                try:
+                    callback(valor)
+                except Exception as e:
+                    # Un callback con error no debe dejar sin entregar a los demás
+                    print(f"Error en la respuesta del servicio: {e}")
+        if self._en_vuelo:
+            self.root.after(self.intervalo_ms, self._entregar)
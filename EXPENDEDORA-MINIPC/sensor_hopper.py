@@ -0,0 +1,64 @@
+# sensor_hopper.py - Conteo de fichas por flancos del sensor del hopper
+#
+# En lugar de leer GPIO.input(ENTHOPER) en un bucle sin pausa, se registra un
+# callback de flanco descendente (add_event_detect) y quien espera una ficha se
+# bloquea en una condición hasta que llegue el pulso o se cumpla el tiempo
+# límite. Funciona igual con RPi.GPIO y con gpio_sim.GPIO.
+
+import threading
+import time
+
+from reloj import RELOJ_REAL
+
+
+class SensorHopper:
+    def __init__(self, gpio, pin, debounce=0.005, reloj=RELOJ_REAL):
+        self.gpio = gpio
+        self.pin = pin
+        self.reloj = reloj
+        self.debounce = debounce  # Segundos mínimos entre dos pulsos válidos
+        self.pulsos = 0  # Total de fichas detectadas desde el inicio
+        self.ultimo_pulso = None  # Momento (reloj) del último pulso válido
+        self._cond = threading.Condition()
+
+        # bouncetime (ms) lo usa RPi.GPIO; el antirrebote por software de
+        # _on_flanco cubre también al simulador
+        gpio.add_event_detect(pin, gpio.FALLING, callback=self._on_flanco,
+                              bouncetime=max(1, int(debounce * 1000)))
+
+    def _on_flanco(self, canal):
+        ahora = self.reloj.monotonic()
+        with self._cond:
+            if self.ultimo_pulso is not None and ahora - self.ultimo_pulso < self.debounce:
+                return  # Rebote del sensor
+            self.ultimo_pulso = ahora
+            self.pulsos += 1
+            self._cond.notify_all()
+
+    def esperar_pulso(self, desde, timeout):
+        # Bloquea hasta que el total de pulsos supere `desde`. Devuelve el total
+        # actual o None si se cumplió el tiempo límite.
+        if self.reloj.esperar(self._cond, lambda: self.pulsos > desde, timeout):
+            return self.pulsos
+        return None
+
+    def detener(self):
+        self.gpio.remove_event_detect(self.pin)
+
+
+if __name__ == "__main__":
+    # Prueba rápida: esperar un pulso que nunca llega no debe consumir CPU
+    from gpio_sim import GPIO
+
+    GPIO.setup(23, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+    GPIO.simular_entrada(23, GPIO.HIGH)
+    sensor = SensorHopper(GPIO, 23)
+
+    cpu_inicio = time.process_time()
+    resultado = sensor.esperar_pulso(sensor.pulsos, timeout=1.0)
+    cpu_usada = time.process_time() - cpu_inicio
+    print(f"Timeout: {resultado is None}, CPU usada esperando 1 s: {cpu_usada * 1000:.1f} ms")
+    assert resultado is None and cpu_usada < 0.05
+
+    threading.Timer(0.1, GPIO.simular_entrada, (23, GPIO.LOW)).start()
+    print(f"Pulso recibido, total: {sensor.esperar_pulso(0, timeout=1.0)}")
@@ -0,0 +1,398 @@
+# servicio.py - Servicio de control de la expendedora, sin interfaz gráfica
+#
+# Corre en su propio proceso y es dueño del hardware (GPIO, hopper), del libro
+# de contadores con su bitácora y de la cola de telemetría. La GUI es un
+# cliente liviano (cliente_servicio.py) que habla con este proceso por un
+# socket Unix local, así que si la interfaz se cuelga o se cierra las fichas
+# se siguen contando y una entrega en curso termina igual.
+#
+# Protocolo: una línea JSON por pedido y una por respuesta.
+#   {"cmd": "estado"}
+#   {"cmd": "evento", "tipo": "apertura", "deltas": {...}, "reiniciar": [...], "reporte": {...}}
+#   {"cmd": "cierre", "tipo": "cierre_parcial"}   -> {"cerrado": {...}} lo que se cerró
+#   {"cmd": "enviar", "url": "...", "datos": {...}, "descripcion": "...", "informa": "cierre"}
+#   {"cmd": "comprar", "tipo": "promo", "fichas": 35, "deltas": {...}}
+#   {"cmd": "comprar", "tipo": "billete", "monto": 5000}
+#   {"cmd": "dispensar", "cantidad": 35}
+#   {"cmd": "historial", "consulta": "por_dia", "dias": 90}
+#   {"cmd": "trazas", "traza": "1a2b-7", "ultimos": 200}
+#   {"cmd": "perfil", "activar": true}
+#
+# Las compras se encolan en el despachador (despachador.py) y se entregan de
+# a una en su hilo; "estado" devuelve la compra en curso y las que esperan.
+# Cualquier pedido puede traer "usuario" (el empleado con sesión en la GUI):
+# los eventos de ese pedido, incluidas las fichas que entregue el despachador
+# para esa compra, quedan a su nombre en el historial. Los billetes que entran
+# por el billetero no vienen de ningún pedido y quedan sin usuario.
+# Cualquier pedido puede traer "id": un pedido con un id ya atendido no se
+# vuelve a ejecutar y recibe la misma respuesta (reintentos del cliente).
+# Respuesta: {"ok": true, "libro": {...}, ...} o {"ok": false, "error": "..."}
+#
+# Uso: python3 servicio.py
+#   kill -USR1 <pid>   prende/apaga el perfilador (al apagar guarda perfil_*.folded)
+#   kill -USR2 <pid>   vuelca las trazas en memoria a trazas_*.jsonl
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import threading
+from collections import OrderedDict
+
+import telemetria
+from bitacora import Bitacora
+from cliente_servicio import SOCKET_FILE
+from contadores import APERTURA, PARCIAL
+from despachador import Despachador
+from historial import Historial
+from metricas import PUERTO, iniciar_servidor, obtener_registro
+from planificador import obtener_planificador
+from segmento import RUTA_POR_DEFECTO, EscritorSegmento
+from trazas import obtener_trazador
+
+PERSISTENCIA_POR_DEFECTO = {"intervalo_commit": 1.0, "eventos_por_snapshot": 1000}
+HISTORIAL_POR_DEFECTO = {"retencion_dias": 90, "intervalo_volcado": 1.0}
+INTERVALO_PODA = 3600  # Segundos entre podas de eventos viejos del historial
+CONSULTAS_HISTORIAL = ("por_hora", "por_dia", "promos_por_semana")
+PEDIDOS_RECORDADOS = 256  # Ids de pedidos recientes para descartar repetidos
+ESPERA_DESPACHADOR = 5  # Segundos para que termine la entrega en curso al detener
+# Tipo de cierre -> (período que se informa, períodos que vuelven a cero)
+CIERRES = {
+    "cierre": (APERTURA, (APERTURA, PARCIAL)),
+    "cierre_parcial": (PARCIAL, (PARCIAL,))
+}
+PREFIJO_INFORME = "informe_"  # Tipo en el historial de lo enviado por cada cierre
+
+
+class _Manejador(socketserver.StreamRequestHandler):
+    def handle(self):
+        for linea in self.rfile:
+            try:
+                respuesta = self.server.servicio.atender(json.loads(linea))
+            except Exception as e:
+                respuesta = {"ok": False, "error": str(e)}
+            try:
+                self.wfile.write((json.dumps(respuesta) + "\n").encode("utf-8"))
+            except OSError:
+                return  # El cliente se fue (por ejemplo se le venció el tiempo)
+
+
+class _Servidor(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class ServicioExpendedora:
+    def __init__(self, core, ruta_socket=SOCKET_FILE):
+        self.core = core
+        self.ruta_socket = ruta_socket
+
+        # Contadores: snapshot + bitácora (la primera vez, semilla de config.json)
+        config = core.cargar_configuracion()
+        persistencia = dict(PERSISTENCIA_POR_DEFECTO)
+        persistencia.update(config.get("persistencia", {}))
+        self.bitacora = Bitacora(**persistencia)
+        self.libro = self.bitacora.recuperar(semilla=config)
+        self.puerto_metricas = config.get("metricas", {}).get("puerto", PUERTO)  # 0 = sin endpoint
+        opciones_trazas = config.get("trazas", {})
+        obtener_trazador().configurar(opciones_trazas.get("capacidad"), opciones_trazas.get("activas"),
+                                      opciones_trazas.get("muestreo"))
+
+        # Cada evento también va al historial local con resúmenes por hora/día
+        opciones_historial = dict(HISTORIAL_POR_DEFECTO)
+        opciones_historial.update(config.get("historial", {}))
+        self.historial = Historial(core.DB_FILE, **opciones_historial)
+        self._tareas = []
+        self._pedidos = OrderedDict()  # id -> {"listo": Event, "respuesta": ...}
+        self._pedidos_lock = threading.Lock()
+
+        # Contadores en vivo para otros procesos (segmento.py); ruta "" = sin segmento
+        ruta_segmento = config.get("segmento", {}).get("ruta", RUTA_POR_DEFECTO)
+        self.segmento = EscritorSegmento(ruta_segmento) if ruta_segmento else None
+        self._registro_lock = threading.Lock()
+        if self.segmento:
+            self.segmento.publicar(self.libro)
+
+        self.despachador = Despachador(core.hopper, al_entregar=self._ficha_entregada,
+                                       al_terminar=self._compra_terminada)
+        core.billetero.al_billete = self._vender_billete  # Billetes reales por ECOIN
+        self._servidor = None
+        self._servidor_metricas = None
+
+        registro = obtener_registro()
+        registro.medidor("expendedora_compras_en_cola", "Compras esperando al hopper",
+                         lambda: len(self.despachador.estado()["en_cola"]))
+        registro.medidor("expendedora_fichas_restantes", "Fichas cobradas todavía sin entregar",
+                         lambda: self.libro.valor("fichas_restantes"))
+
+        self.comandos = {
+            "estado": self.cmd_estado,
+            "evento": self.cmd_evento,
+            "cierre": self.cmd_cierre,
+            "enviar": self.cmd_enviar,
+            "comprar": self.cmd_comprar,
+            "dispensar": self.cmd_dispensar,
+            "historial": self.cmd_historial,
+            "trazas": self.cmd_trazas,
+            "perfil": self.cmd_perfil,
+        }
+
+    def registrar(self, tipo, deltas=None, reiniciar=(), reporte=None, usuario=None):
+        # Libro + bitácora (contadores), segmento en vivo e historial (reportes).
+        # El lock deja un solo escritor del segmento aunque lleguen eventos
+        # del socket, del despachador y del billetero a la vez.
+        with obtener_trazador().tramo("persistencia", tipo=tipo), self._registro_lock:
+            self._aplicar(tipo, deltas, reiniciar)
+        self.historial.registrar(tipo, deltas, usuario=usuario, reporte=reporte)
+
+    def _aplicar(self, tipo, deltas=None, reiniciar=()):
+        # Llamar con _registro_lock tomado
+        self.bitacora.registrar(tipo, deltas, reiniciar)
+        if self.segmento:
+            self.segmento.publicar(self.libro)
+
+    # --- COMANDOS ---
+    def atender(self, pedido):
+        id_pedido = pedido.get("id")
+        if id_pedido is None:
+            return self._ejecutar(pedido)
+        with self._pedidos_lock:
+            previo = self._pedidos.get(id_pedido)
+            if previo is None:
+                self._pedidos[id_pedido] = actual = {"listo": threading.Event(), "respuesta": None}
+                while len(self._pedidos) > PEDIDOS_RECORDADOS:
+                    self._pedidos.popitem(last=False)
+        if previo is not None:
+            # Reintento de un pedido ya recibido: se contesta sin aplicarlo otra vez
+            previo["listo"].wait()
+            return previo["respuesta"]
+        try:
+            actual["respuesta"] = self._ejecutar(pedido)
+        except Exception as e:
+            actual["respuesta"] = {"ok": False, "error": str(e)}
+        finally:
+            actual["listo"].set()
+        return actual["respuesta"]
+
+    def _ejecutar(self, pedido):
+        obtener_trazador().usar(None)  # Los hilos del servidor se reutilizan entre pedidos
+        comando = self.comandos.get(pedido.get("cmd"))
+        if comando is None:
+            return {"ok": False, "error": f"Comando desconocido: {pedido.get('cmd')}"}
+        respuesta = comando(pedido)
+        respuesta.setdefault("ok", True)
+        return respuesta
+
+    def cmd_estado(self, pedido):
+        return {
+            "libro": self.libro.a_dict(),
+            "despacho": self.despachador.estado(),
+            "ultima_entrega": self.core.hopper.ultima_entrega,
+            "hoppers": self.core.hopper.estados(),
+            "hoppers_fuera_de_uso": self.core.hopper.fuera_de_uso() if hasattr(self.core.hopper, "fuera_de_uso") else []
+        }
+
+    def cmd_evento(self, pedido):
+        # Un evento que saca fichas (el botón de entrega manual de la GUI) se
+        # controla acá, con el mismo lock con que se aplica: la copia del libro
+        # que tiene la GUI puede estar atrasada respecto del despachador
+        tipo, deltas = pedido["tipo"], pedido.get("deltas")
+        salen = -(deltas or {}).get("fichas_restantes", 0)
+        with obtener_trazador().tramo("persistencia", tipo=tipo), self._registro_lock:
+            if salen > 0:
+                disponibles = self._fichas_disponibles()
+                if salen > disponibles:
+                    return {"ok": False, "error": f"Solo hay {max(0, disponibles)} ficha(s) cobradas sin entregar"}
+            self._aplicar(tipo, deltas, pedido.get("reiniciar", ()))
+        self.historial.registrar(tipo, deltas, usuario=pedido.get("usuario"), reporte=pedido.get("reporte"))
+        return {"libro": self.libro.a_dict()}
+
+    def _fichas_disponibles(self):
+        # Cobradas y que ninguna compra del despachador tiene ya en camino.
+        # Llamar con _registro_lock tomado
+        return self.libro.valor("fichas_restantes") - self.despachador.fichas_por_entregar()
+
+    def cmd_cierre(self, pedido):
+        # Lee el período y lo reinicia en un solo paso bajo el lock: una ficha
+        # que sale mientras tanto cuenta en el período siguiente, nunca en
+        # ninguno o en los dos. Se devuelve exactamente lo que se cerró.
+        tipo = pedido["tipo"]
+        if tipo not in CIERRES:
+            return {"ok": False, "error": f"Cierre desconocido: {tipo}"}
+        periodo, reiniciar = CIERRES[tipo]
+        with obtener_trazador().tramo("persistencia", tipo=tipo), self._registro_lock:
+            cerrado = self.libro.vista(periodo)
+            self._aplicar(tipo, reiniciar=reiniciar)
+        self.historial.registrar(tipo, usuario=pedido.get("usuario"))
+        return {"cerrado": cerrado, "libro": self.libro.a_dict()}
+
+    def cmd_enviar(self, pedido):
+        # "informa": el cierre cuyo reporte es este envío. Lo que se manda al
+        # servidor queda en el historial como evento informe_<cierre> para
+        # que auditoria.py lo compare con el período recalculado.
+        informa = pedido.get("informa")
+        if informa is not None and informa not in CIERRES:
+            return {"ok": False, "error": f"Cierre desconocido: {informa}"}
+        telemetria.enviar(pedido["url"], pedido["datos"], pedido.get("descripcion", "Datos"),
+                          pedido.get("persistente", True))
+        if informa:
+            self.historial.registrar(PREFIJO_INFORME + informa, usuario=pedido.get("usuario"),
+                                     reporte=pedido["datos"])
+        return {}
+
+    def cmd_comprar(self, pedido):
+        # Registra la venta y encola la entrega: el pedido vuelve enseguida
+        obtener_trazador().nueva_traza()
+        tipo = pedido["tipo"]
+        usuario = pedido.get("usuario")
+        if tipo == "billete":
+            compra = self._vender_billete(pedido["monto"], usuario)
+        else:
+            fichas = int(pedido["fichas"])
+            self.registrar(tipo, pedido.get("deltas") or {"fichas_restantes": fichas}, usuario=usuario)
+            compra = self.despachador.encolar(tipo, fichas, usuario=usuario) if fichas > 0 else None
+        return {"compra": compra, "libro": self.libro.a_dict()}
+
+    def _vender_billete(self, monto, usuario=None):
+        # Lo llama el billetero (o "comprar" con tipo billete): acredita el
+        # monto, registra la venta y encola las fichas que correspondan
+        fichas = self.core.acreditar_billete(monto)
+        self.registrar("billete", {"dinero_ingresado": monto, "fichas_restantes": fichas}, usuario=usuario)
+        return self.despachador.encolar("billete", fichas, usuario=usuario) if fichas > 0 else None
+
+    def cmd_dispensar(self, pedido):
+        # Entrega fichas ya cobradas (fichas_restantes), sin registrar venta.
+        # Solo las que no estén ya en camino por otra compra de la cola.
+        cantidad = int(pedido["cantidad"])
+        with self._registro_lock:
+            disponibles = self._fichas_disponibles()
+            if cantidad > disponibles:
+                return {"ok": False, "error": f"Solo hay {max(0, disponibles)} ficha(s) cobradas sin entregar"}
+            compra = self.despachador.encolar("manual", cantidad, usuario=pedido.get("usuario"))
+        return {"compra": compra}
+
+    def cmd_historial(self, pedido):
+        # Reportes desde los resúmenes: por_hora/por_dia (dias) o promos_por_semana (semanas)
+        consulta = pedido.get("consulta", "por_dia")
+        if consulta not in CONSULTAS_HISTORIAL:
+            return {"ok": False, "error": f"Consulta desconocida: {consulta}"}
+        parametros = {clave: int(pedido[clave]) for clave in ("dias", "semanas") if clave in pedido}
+        return {"filas": getattr(self.historial, consulta)(**parametros)}
+
+    def cmd_trazas(self, pedido):
+        # Tramos del buffer en memoria, de una traza o los últimos N
+        ultimos = int(pedido["ultimos"]) if "ultimos" in pedido else None
+        return {"tramos": obtener_trazador().volcar(pedido.get("traza"), ultimos)}
+
+    def cmd_perfil(self, pedido):
+        # activar: true/false, o sin dato para alternar; al apagar devuelve el archivo
+        trazador = obtener_trazador()
+        archivo = trazador.alternar_perfil(pedido.get("activar"))
+        return {"activo": trazador.perfilador.activo, "archivo": archivo}
+
+    # --- ENTREGA (hilo del despachador) ---
+    def _ficha_entregada(self, compra):
+        self.registrar("ficha", {"fichas_expendidas": 1, "fichas_restantes": -1}, usuario=compra.get("usuario"))
+        if compra["tipo"] == "billete":
+            self.core.descontar_ficha()
+
+    def _compra_terminada(self, compra, resultado):
+        if resultado["entregadas"] < compra["fichas"]:
+            print(f"Compra {compra['id']}: faltaron {compra['fichas'] - resultado['entregadas']} "
+                  f"ficha(s), quedan en fichas restantes")
+
+    # --- SOCKET ---
+    def iniciar(self):
+        if os.path.exists(self.ruta_socket):
+            # Socket viejo de un servicio que murió sin limpiar
+            prueba = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                prueba.connect(self.ruta_socket)
+                prueba.close()
+                raise RuntimeError(f"Ya hay un servicio escuchando en {self.ruta_socket}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.remove(self.ruta_socket)
+        self._servidor = _Servidor(self.ruta_socket, _Manejador)
+        self._servidor.servicio = self
+        threading.Thread(target=self._servidor.serve_forever, daemon=True).start()
+        self.despachador.iniciar()
+        self.core.billetero.iniciar()
+        planificador = obtener_planificador()
+        self._tareas = [
+            planificador.cada(self.historial.intervalo_volcado, self.historial.volcar, inmediato=False),
+            planificador.cada(INTERVALO_PODA, self.historial.podar)
+        ]
+        if self.puerto_metricas:
+            try:
+                self._servidor_metricas = iniciar_servidor(puerto=self.puerto_metricas)
+            except OSError as e:
+                print(f"No se pudo abrir el endpoint de métricas en el puerto {self.puerto_metricas}: {e}")
+
+    def detener(self):
+        if self._servidor_metricas:
+            self._servidor_metricas.shutdown()
+            self._servidor_metricas.server_close()
+        if self._servidor:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            if os.path.exists(self.ruta_socket):
+                os.remove(self.ruta_socket)
+        self.core.billetero.detener()
+        for tarea in self._tareas:
+            obtener_planificador().cancelar(tarea)
+        if not self._detener_despachador():
+            # El hilo de entrega todavía puede registrar fichas: la bitácora,
+            # el historial y el segmento quedan abiertos hasta que el proceso
+            # termine, con lo registrado hasta ahora ya en disco
+            print("La entrega sigue en curso: los contadores quedan abiertos")
+            self.bitacora.flush()
+            self.historial.volcar()
+            return
+        self.bitacora.cerrar()
+        self.historial.cerrar()
+        self.core.cerrar_registro()
+        if self.segmento:
+            self.segmento.cerrar()
+
+    def _detener_despachador(self):
+        # True si el hilo de entrega terminó. Si una entrega no termina a
+        # tiempo se descarta lo que falta empezar y se corta el motor y el
+        # GPIO antes de esperarlo de nuevo, así no sigue girando.
+        if self.despachador.detener(timeout=ESPERA_DESPACHADOR):
+            return True
+        fichas = self.despachador.descartar_pendientes()
+        print(f"La entrega no terminó en {ESPERA_DESPACHADOR} s: se apaga el motor "
+              f"({fichas} ficha(s) en cola quedan en fichas restantes)")
+        self.core.hopper.detener_motor()
+        self.core.GPIO.cleanup()
+        return self.despachador.detener(timeout=ESPERA_DESPACHADOR)
+
+
+def main():
+    import expendedora_core as core
+
+    core.init_db()
+    core.iniciar_heartbeat()
+
+    servicio = ServicioExpendedora(core)
+    servicio.iniciar()
+    print(f"Servicio de la expendedora escuchando en {servicio.ruta_socket}")
+
+    terminar = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: terminar.set())
+    signal.signal(signal.SIGINT, lambda *args: terminar.set())
+
+    trazador = obtener_trazador()
+
+    def alternar_perfil(*args):
+        archivo = trazador.alternar_perfil()
+        print(f"Perfil guardado en {archivo}" if archivo else "Perfilador activo")
+
+    signal.signal(signal.SIGUSR1, alternar_perfil)
+    signal.signal(signal.SIGUSR2, lambda *args: print(f"Trazas volcadas en {trazador.volcar_archivo()}"))
+    terminar.wait()
+    servicio.detener()
+
+
+if __name__ == "__main__":
+    main()
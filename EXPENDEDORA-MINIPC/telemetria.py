@@ -0,0 +1,197 @@
+# telemetria.py - Cola de envíos al servidor (store-and-forward)
+#
+# Todos los POST al servidor pasan por una única cola atendida por un hilo de
+# fondo. encolar() solo hace un queue.put, así que los callbacks de Tk vuelven
+# de inmediato aunque el servidor esté lento o caído. El hilo usa una sola
+# requests.Session (keep-alive), timeouts y reintentos con backoff exponencial.
+# Los envíos persistentes (cierres, reportes) se guardan en SQLite hasta que el
+# servidor los acepta, así sobreviven a un reinicio del kiosko.
+#
+# Los envíos no persistentes (heartbeats) no entran a la cola de reintentos:
+# se intenta una sola vez el más reciente de cada URL, sin esperar detrás de
+# un envío persistente que está fallando ni sumar al backoff.
+#
+# Un error de SQLite (disco lleno, base bloqueada) no detiene el hilo: el
+# envío queda en la cola en memoria, en su lugar, y se vuelve a intentar
+# guardarlo después de cada intento de envío fallido.
+
+import json
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import requests
+
+from metricas import obtener_registro
+from trazas import obtener_trazador
+
+DB_FILE = "expendedora.db"
+
+TIMEOUT = (3.05, 10)  # Segundos (conexión, lectura)
+BACKOFF_INICIAL = 1  # Segundos antes del primer reintento
+BACKOFF_MAXIMO = 300  # Tope del backoff exponencial
+
+
+class ColaTelemetria:
+    def __init__(self, db_file=DB_FILE, timeout=TIMEOUT,
+                 backoff_inicial=BACKOFF_INICIAL, backoff_maximo=BACKOFF_MAXIMO):
+        self.db_file = db_file
+        self.timeout = timeout
+        self.backoff_inicial = backoff_inicial
+        self.backoff_maximo = backoff_maximo
+        self.sesion = requests.Session()
+
+        self.pendientes = deque()  # Envíos persistentes ya tomados por el hilo, en orden
+        self._efimeros = {}  # URL -> último envío no persistente sin mandar
+        self._entrada = queue.Queue()
+        self._backoff = 0
+        self._proximo_intento = 0
+        self._hilo = None
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self._bucle, daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._entrada.put(None)
+        if self._hilo:
+            self._hilo.join()
+
+    def encolar(self, url, datos, descripcion="Datos", persistente=True):
+        # No bloquea: solo deja el envío para el hilo de fondo
+        comienzo = time.perf_counter()
+        self._entrada.put({
+            "url": url,
+            "datos": datos,
+            "descripcion": descripcion,
+            "persistente": persistente
+        })
+        duracion = time.perf_counter() - comienzo
+        obtener_trazador().registrar("telemetria", time.time() - duracion, duracion, descripcion=descripcion)
+
+    def profundidad(self):
+        return self._entrada.qsize() + len(self.pendientes) + len(self._efimeros)
+
+    # --- HILO DE ENVÍO ---
+    def _bucle(self):
+        conn = sqlite3.connect(self.db_file)
+        conn.execute('''CREATE TABLE IF NOT EXISTS telemetria_pendiente (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            url TEXT NOT NULL,
+                            datos TEXT NOT NULL,
+                            descripcion TEXT,
+                            creado REAL)''')
+        conn.commit()
+
+        # Envíos que quedaron sin confirmar antes del último apagado
+        for id_, url, datos, descripcion in conn.execute(
+                "SELECT id, url, datos, descripcion FROM telemetria_pendiente ORDER BY id"):
+            self.pendientes.append({"id": id_, "url": url, "datos": json.loads(datos),
+                                    "descripcion": descripcion, "persistente": True})
+
+        while True:
+            espera = None
+            if self.pendientes:
+                espera = max(0, self._proximo_intento - time.monotonic())
+            try:
+                item = self._entrada.get(timeout=espera)
+                while item is not None:
+                    self._guardar(conn, item)
+                    item = self._entrada.get_nowait()
+                break  # Se recibió la señal de detener
+            except queue.Empty:
+                pass
+
+            while self._efimeros:
+                _, item = self._efimeros.popitem()
+                self._enviar(item)  # Un solo intento: el próximo ya lo reemplaza
+
+            while self.pendientes and time.monotonic() >= self._proximo_intento:
+                item = self.pendientes[0]
+                if self._enviar(item):
+                    self.pendientes.popleft()
+                    if item.get("id") is not None:
+                        self._borrar(conn, item)
+                    self._backoff = 0
+                else:
+                    self._backoff = min(self.backoff_maximo, max(self.backoff_inicial, self._backoff * 2))
+                    self._proximo_intento = time.monotonic() + self._backoff
+                    for pendiente in self.pendientes:
+                        if pendiente.get("id") is None and not self._persistir(conn, pendiente):
+                            break
+                    break
+
+        conn.close()
+
+    def _guardar(self, conn, item):
+        if not item["persistente"]:
+            # Un heartbeat sin mandar se reemplaza por el más nuevo
+            self._efimeros[item["url"]] = item
+            return
+        item.setdefault("creado", time.time())
+        self._persistir(conn, item)
+        self.pendientes.append(item)  # Aunque no se haya podido guardar: se manda igual
+
+    def _persistir(self, conn, item):
+        # Guarda el envío en SQLite; si falla queda sin id, solo en memoria
+        try:
+            cursor = conn.execute(
+                "INSERT INTO telemetria_pendiente (url, datos, descripcion, creado) VALUES (?, ?, ?, ?)",
+                (item["url"], json.dumps(item["datos"]), item["descripcion"], item["creado"]))
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"No se pudo guardar {item['descripcion']} en la cola de telemetría: {e}")
+            return False
+        item["id"] = cursor.lastrowid
+        return True
+
+    def _borrar(self, conn, item):
+        # Un error acá solo deja una fila de más: se volvería a mandar tras un reinicio
+        try:
+            conn.execute("DELETE FROM telemetria_pendiente WHERE id=?", (item["id"],))
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"No se pudo borrar {item['descripcion']} de la cola de telemetría: {e}")
+
+    def _enviar(self, item):
+        # True si el envío terminó (aceptado o rechazado por el servidor),
+        # False si hay que reintentar
+        try:
+            response = self.sesion.post(item["url"], json=item["datos"], timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            print(f"Error al conectar con el servidor ({item['descripcion']}): {e}")
+            return False
+
+        if response.status_code == 200:
+            print(f"{item['descripcion']} enviado con éxito")
+            return True
+        if response.status_code >= 500:
+            print(f"Error del servidor al enviar {item['descripcion']}: {response.status_code}")
+            return False
+        print(f"Error al enviar {item['descripcion']}: {response.status_code}")
+        return True
+
+
+# --- COLA COMPARTIDA ---
+_cola = None
+_cola_lock = threading.Lock()
+
+obtener_registro().medidor("expendedora_telemetria_cola", "Envíos pendientes en la cola de telemetría",
+                           lambda: _cola.profundidad() if _cola else 0)
+
+
+def obtener_cola():
+    global _cola
+    with _cola_lock:
+        if _cola is None:
+            _cola = ColaTelemetria()
+            _cola.iniciar()
+        return _cola
+
+
+def enviar(url, datos, descripcion="Datos", persistente=True):
+    obtener_cola().encolar(url, datos, descripcion, persistente)
@@ -0,0 +1,7 @@
+# conftest.py - Los módulos de la expendedora se importan por nombre
+# (from contadores import ...), igual que cuando se corre main.py desde la carpeta.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
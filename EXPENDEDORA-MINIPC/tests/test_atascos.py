@@ -0,0 +1,73 @@
+# test_atascos.py - Detección de atascos del hopper: atasco, reintentos y
+# "vacio_o_atascado", en tiempo virtual
+
+import pytest
+
+from gpio_sim import GPIO, HopperSimulado
+from hopper import (ESTADO_ENTREGANDO, ESTADO_LISTO, ESTADO_RECUPERANDO, ESTADO_VACIO_O_ATASCADO,
+                    Hopper)
+from sensor_hopper import SensorHopper
+
+SALIDA, ENTHOPER = 24, 23
+
+
+@pytest.fixture
+def simulado(capsys):
+    GPIO.reiniciar()
+    GPIO.setup(ENTHOPER, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+    GPIO.setup(SALIDA, GPIO.OUT)
+    return GPIO.conectar(HopperSimulado(SALIDA, ENTHOPER))
+
+
+@pytest.fixture
+def hopper(simulado):
+    hopper = Hopper(GPIO, SALIDA, SensorHopper(GPIO, ENTHOPER, reloj=GPIO.reloj), reloj=GPIO.reloj,
+                    modo="continuo", reintentos=2)
+    hopper.cambios = []
+    hopper.al_cambiar_estado = lambda h, anterior, estado: h.cambios.append(estado)
+    return hopper
+
+
+def test_atasco_reintentos_y_falla(hopper, simulado):
+    simulado.atasco_en = 3  # Nunca se destraba
+    resultado = hopper.dispensar(10)
+
+    assert resultado["entregadas"] == 3
+    assert simulado.intentos_destrabe == hopper.reintentos  # Un rearranque por reintento
+    assert hopper.estado == ESTADO_VACIO_O_ATASCADO
+    assert hopper.cambios == [ESTADO_ENTREGANDO, ESTADO_RECUPERANDO, ESTADO_VACIO_O_ATASCADO]
+    assert GPIO.input(SALIDA) == GPIO.LOW
+
+
+def test_atasco_que_se_destraba_en_un_reintento(hopper, simulado):
+    simulado.atasco_en = 3
+    simulado.destraba_tras = 1
+    resultado = hopper.dispensar(10)
+
+    assert resultado["entregadas"] == 10
+    assert hopper.estado == ESTADO_LISTO
+    assert hopper.cambios == [ESTADO_ENTREGANDO, ESTADO_RECUPERANDO, ESTADO_ENTREGANDO, ESTADO_LISTO]
+
+
+def test_espera_aprendida_detecta_el_atasco_antes_del_tope(hopper, simulado):
+    hopper.dispensar(20)  # Aprende ~0.1 s entre fichas
+    assert hopper.espera_ficha() < hopper.tiempo_espera_ficha
+
+    simulado.atasco_en = simulado.entregadas + 2
+    resultado = hopper.dispensar(10)
+    # Con el tope fijo serían 5 s por espera (la inicial y cada reintento)
+    assert resultado["segundos"] < hopper.tiempo_espera_ficha
+    assert hopper.estado == ESTADO_VACIO_O_ATASCADO
+
+
+def test_vacio_o_atascado_sigue_hasta_que_sale_una_ficha(hopper, simulado):
+    simulado.atasco_en = 0
+    assert hopper.dispensar(5)["entregadas"] == 0
+    assert hopper.estado == ESTADO_VACIO_O_ATASCADO
+
+    assert hopper.dispensar(5)["entregadas"] == 0  # Sigue trabado: no vuelve a "listo"
+    assert hopper.estado == ESTADO_VACIO_O_ATASCADO
+
+    simulado.desatascar()
+    assert hopper.dispensar(5)["entregadas"] == 5
+    assert hopper.estado == ESTADO_LISTO
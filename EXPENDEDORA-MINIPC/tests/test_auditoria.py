@@ -0,0 +1,37 @@
+# test_auditoria.py - La auditoría encuentra los envíos que no coinciden con el historial
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import auditoria  # noqa: E402
+
+
+def test_simulacion_detecta_cada_envio_alterado(tmp_path):
+    db_file = str(tmp_path / "auditoria.db")
+    alterados = auditoria.simular(db_file, 60000, semilla=3)
+    resultado = auditoria.auditar(auditoria.cargar(db_file))
+
+    assert alterados > 0
+    assert resultado["cierres_revisados"] == 12  # Un envío por cada cierre y cierre parcial
+    assert len(resultado["diferencias"]) == alterados
+    assert {d["clave"] for d in resultado["diferencias"]} == {"dinero_ingresado"}
+    assert all(d["reportado"] == d["recalculado"] - 1000 for d in resultado["diferencias"])
+
+
+def test_claves_del_envio_se_traducen_al_libro(tmp_path):
+    from historial import Historial
+
+    historial = Historial(str(tmp_path / "auditoria.db"))
+    historial.registrar("promo", {"promo2_contador": 1, "dinero_ingresado": 2000, "fichas_restantes": 7})
+    historial.registrar("ficha", {"fichas_expendidas": 7, "fichas_restantes": -7})
+    historial.registrar("cierre_parcial", usuario="ana")
+    historial.registrar("informe_cierre_parcial", usuario="ana", reporte={
+        "device_id": "EXPENDEDORA_1", "partial_fichas": 7, "partial_dinero": 2000,
+        "partial_p1": 0, "partial_p2": 2, "partial_p3": 0, "employee_id": "ana"})
+    historial.cerrar()
+
+    resultado = auditoria.auditar(auditoria.cargar(historial.db_file))
+    assert resultado["cierres_revisados"] == 1
+    assert [(d["tipo"], d["clave"], d["reportado"]) for d in resultado["diferencias"]] == \
+        [("cierre_parcial", "promo2_contador", 2)]
@@ -0,0 +1,84 @@
+# test_billetero.py - Decodificación de trenes de pulsos sintéticos en ECOIN,
+# en tiempo virtual
+
+import pytest
+
+from billetero import DENOMINACIONES_POR_DEFECTO, DecodificadorPulsos
+from gpio_sim import GPIO, programar_pulso, programar_tren_pulsos
+
+ECOIN = 35
+
+
+@pytest.fixture
+def recibidos():
+    return []
+
+
+@pytest.fixture
+def billetero(recibidos, capsys):
+    GPIO.reiniciar()
+    GPIO.setup(ECOIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+    return DecodificadorPulsos(GPIO, ECOIN, al_billete=recibidos.append, reloj=GPIO.reloj).iniciar()
+
+
+def correr():
+    while GPIO.reloj.pendientes():
+        GPIO.reloj.avanzar(1)
+
+
+@pytest.mark.parametrize("pulsos,monto", sorted(DENOMINACIONES_POR_DEFECTO.items()))
+def test_cada_denominacion(billetero, recibidos, pulsos, monto):
+    programar_tren_pulsos(ECOIN, pulsos)
+    correr()
+    assert recibidos == [monto]
+    assert (billetero.billetes, billetero.rechazados) == (1, 0)
+
+
+@pytest.mark.parametrize("pulsos", [3, 7, 19])
+def test_tren_cortado_se_rechaza(billetero, recibidos, pulsos):
+    # Un billete de 5/10/20 pulsos cortado: la cantidad no es una denominación
+    programar_tren_pulsos(ECOIN, pulsos)
+    correr()
+    assert recibidos == []
+    assert (billetero.billetes, billetero.rechazados) == (0, 1)
+
+
+def test_rebotes_dentro_del_antirrebote_no_suman(billetero, recibidos):
+    programar_tren_pulsos(ECOIN, 5, ancho=0.03, separacion=0.05)
+    for i in range(5):
+        # Rebote al bajar: sube y vuelve a bajar 2 ms después del flanco real
+        flanco = i * 0.08
+        GPIO.reloj.programar(flanco + 0.001, lambda: GPIO.simular_entrada(ECOIN, GPIO.HIGH))
+        GPIO.reloj.programar(flanco + 0.002, lambda: GPIO.simular_entrada(ECOIN, GPIO.LOW))
+    correr()
+    assert recibidos == [5000]
+
+
+def test_ruido_aislado_se_rechaza_y_no_contamina_al_billete_siguiente(billetero, recibidos):
+    # Ráfaga de ruido de 3 pulsos, silencio y después un billete de 2 pulsos
+    for inicio in (0.0, 0.01, 0.02):
+        programar_pulso(ECOIN, inicio, 0.002)
+    programar_tren_pulsos(ECOIN, 2, inicio=0.5)
+    correr()
+    assert recibidos == [2000]
+    assert billetero.rechazados == 1
+
+
+def test_billetes_seguidos(billetero, recibidos):
+    # Separados apenas más que pausa_fin: cada tren es un billete, en orden
+    secuencia = [10, 1, 20, 2, 5, 5]
+    momento = 0.0
+    for pulsos in secuencia:
+        programar_tren_pulsos(ECOIN, pulsos, inicio=momento, ancho=0.02, separacion=0.03)
+        momento += pulsos * 0.05 + billetero.pausa_fin + 0.01
+    correr()
+    assert recibidos == [DENOMINACIONES_POR_DEFECTO[p] for p in secuencia]
+    assert billetero.perdidos == 0
+
+
+def test_pausa_menor_a_pausa_fin_une_los_trenes(billetero, recibidos):
+    # Dos trenes de 1 pulso sin el silencio de fin: se leen como un billete de 2
+    programar_tren_pulsos(ECOIN, 1)
+    programar_tren_pulsos(ECOIN, 1, inicio=billetero.pausa_fin / 2)
+    correr()
+    assert recibidos == [2000]
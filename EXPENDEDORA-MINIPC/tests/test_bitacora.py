@@ -0,0 +1,106 @@
+# test_bitacora.py - Recuperación de los contadores desde snapshot + diario
+
+import json
+
+import pytest
+
+from bitacora import Bitacora
+from contadores import APERTURA, PARCIAL, PERIODOS
+
+
+@pytest.fixture
+def rutas(tmp_path):
+    return str(tmp_path / "contadores.journal"), str(tmp_path / "contadores_snapshot.json")
+
+
+def abrir(rutas, semilla=None, **opciones):
+    bitacora = Bitacora(*rutas, **opciones)
+    bitacora.recuperar(semilla)
+    return bitacora
+
+
+def registrar_eventos(bitacora):
+    bitacora.registrar("venta", {"fichas_expendidas": 5, "dinero_ingresado": 5000, "fichas_restantes": -5})
+    bitacora.registrar("cierre_parcial", reiniciar=[PARCIAL])
+    bitacora.registrar("promo", {"promo1_contador": 1, "fichas_expendidas": 3})
+    bitacora.registrar("cierre", reiniciar=[APERTURA, PARCIAL])
+    bitacora.registrar("ficha", {"fichas_expendidas": 1})
+
+
+@pytest.mark.parametrize("intervalo_commit", [0, 0.05])
+def test_recupera_diario_sin_snapshot(rutas, intervalo_commit):
+    bitacora = abrir(rutas, intervalo_commit=intervalo_commit)
+    registrar_eventos(bitacora)
+    bitacora.flush()
+    esperado = bitacora.libro.a_dict()
+
+    # Sin cerrar (corte de luz): solo queda el diario
+    recuperada = abrir(rutas, intervalo_commit=0)
+    assert recuperada.libro.a_dict() == esperado
+    assert recuperada.seq == 5
+
+
+def test_recupera_snapshot_mas_cola_del_diario(rutas):
+    bitacora = abrir(rutas, intervalo_commit=0, eventos_por_snapshot=3)
+    registrar_eventos(bitacora)
+    esperado = {periodo: bitacora.libro.vista(periodo) for periodo in PERIODOS}
+
+    recuperada = abrir(rutas, intervalo_commit=0)
+    assert {periodo: recuperada.libro.vista(periodo) for periodo in PERIODOS} == esperado
+    assert recuperada.seq == bitacora.seq
+
+
+def test_descarta_linea_cortada(rutas):
+    bitacora = abrir(rutas, intervalo_commit=0)
+    registrar_eventos(bitacora)
+    with open(rutas[0], 'a') as f:
+        f.write('{"q":6,"e":"venta","d":{"fichas_exp')
+    recuperada = abrir(rutas, intervalo_commit=0)
+    assert recuperada.seq == 5
+    assert recuperada.libro.a_dict() == bitacora.libro.a_dict()
+
+
+def test_salta_eventos_ya_incluidos_en_el_snapshot(rutas):
+    # Corte de luz entre escribir el snapshot y truncar el diario
+    bitacora = abrir(rutas, intervalo_commit=0)
+    registrar_eventos(bitacora)
+    snapshot = {"seq": bitacora.seq}
+    snapshot.update(bitacora.libro.a_dict())
+    with open(rutas[1], 'w') as f:
+        json.dump(snapshot, f)
+
+    recuperada = abrir(rutas, intervalo_commit=0)
+    assert recuperada.libro.a_dict() == bitacora.libro.a_dict()
+
+
+def test_cerrar_compacta_y_es_idempotente(rutas):
+    bitacora = abrir(rutas, intervalo_commit=0.05)
+    registrar_eventos(bitacora)
+    bitacora.cerrar()
+    bitacora.cerrar()
+    with open(rutas[0]) as f:
+        assert f.read() == ""
+
+    recuperada = abrir(rutas, intervalo_commit=0)
+    assert recuperada.libro.a_dict() == bitacora.libro.a_dict()
+    recuperada.cerrar()
+
+
+def test_semilla_sobrevive_a_guardar_config_y_corte(rutas):
+    # Primer arranque con los contadores viejos de config.json como semilla
+    config = {"promociones": {}, "valor_ficha": 600.0,
+              "contadores": {"fichas_expendidas": 120, "dinero_ingresado": 70000, "fichas_restantes": 2},
+              "contadores_apertura": {"fichas_expendidas": 20, "dinero_ingresado": 9000},
+              "contadores_parciales": {"fichas_expendidas": 4}}
+    bitacora = abrir(rutas, intervalo_commit=1.0, semilla=config)
+    esperado = bitacora.libro.a_dict()
+
+    # La GUI guarda la configuración (ya sin contadores) y se corta la luz
+    # antes de cualquier compactación: no se llama a cerrar()
+    for clave in ("contadores", "contadores_apertura", "contadores_parciales"):
+        config.pop(clave)
+
+    recuperada = abrir(rutas, intervalo_commit=0, semilla=config)
+    assert recuperada.libro.a_dict() == esperado
+    assert recuperada.libro.valor("fichas_expendidas", APERTURA) == 20
+    recuperada.cerrar()
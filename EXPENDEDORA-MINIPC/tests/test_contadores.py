@@ -0,0 +1,83 @@
+# test_contadores.py - Invariante del libro: vista(período) = totales - base del período
+
+import random
+
+import pytest
+
+from contadores import APERTURA, CLAVES, PARCIAL, PERIODOS, TOTAL, LibroContadores
+
+
+def deltas_al_azar(azar):
+    return {clave: azar.randint(0, 50) for clave in azar.sample(CLAVES, azar.randint(1, len(CLAVES)))}
+
+
+def test_libro_nuevo_en_cero():
+    libro = LibroContadores()
+    for periodo in PERIODOS:
+        assert libro.vista(periodo) == dict.fromkeys(CLAVES, 0)
+
+
+def test_vista_es_total_menos_base():
+    azar = random.Random(7)
+    libro = LibroContadores()
+    # Se suma a mano cada período como hacía el código anterior y se compara
+    esperado = {periodo: dict.fromkeys(CLAVES, 0) for periodo in PERIODOS}
+    for _ in range(500):
+        if azar.random() < 0.1:
+            periodo = azar.choice((APERTURA, PARCIAL))
+            libro.reiniciar(periodo)
+            esperado[periodo] = dict.fromkeys(CLAVES, 0)
+        else:
+            deltas = deltas_al_azar(azar)
+            libro.aplicar(deltas)
+            for vista in esperado.values():
+                for clave, delta in deltas.items():
+                    vista[clave] += delta
+        for periodo in PERIODOS:
+            assert libro.vista(periodo) == esperado[periodo]
+            for clave in CLAVES:
+                assert libro.valor(clave, periodo) == esperado[periodo][clave]
+
+
+def test_reiniciar_no_toca_totales_ni_otros_periodos():
+    libro = LibroContadores()
+    libro.aplicar({"fichas_expendidas": 10, "dinero_ingresado": 5000})
+    libro.reiniciar(PARCIAL)
+    libro.aplicar({"fichas_expendidas": 3})
+    libro.reiniciar(APERTURA)
+
+    assert libro.valor("fichas_expendidas") == 13
+    assert libro.valor("fichas_expendidas", APERTURA) == 0
+    assert libro.valor("fichas_expendidas", PARCIAL) == 3
+    assert libro.valor("dinero_ingresado", PARCIAL) == 0
+
+
+@pytest.mark.parametrize("semilla", range(5))
+def test_a_dict_y_cargar_ida_y_vuelta(semilla):
+    azar = random.Random(semilla)
+    libro = LibroContadores()
+    for _ in range(50):
+        libro.aplicar(deltas_al_azar(azar))
+        if azar.random() < 0.2:
+            libro.reiniciar(azar.choice((APERTURA, PARCIAL)))
+
+    copia = LibroContadores()
+    copia.cargar(libro.a_dict())
+    assert copia.totales == libro.totales
+    assert copia.bases == libro.bases
+    for periodo in PERIODOS:
+        assert copia.vista(periodo) == libro.vista(periodo)
+
+
+def test_cargar_formato_viejo_de_config():
+    # config.json guardaba un diccionario completo por período
+    viejo = {
+        TOTAL: {"fichas_expendidas": 100, "dinero_ingresado": 9000},
+        APERTURA: {"fichas_expendidas": 40, "dinero_ingresado": 2000},
+        PARCIAL: {"fichas_expendidas": 5},
+    }
+    libro = LibroContadores()
+    libro.cargar(viejo)
+    assert libro.vista(TOTAL)["fichas_expendidas"] == 100
+    assert libro.vista(APERTURA)["dinero_ingresado"] == 2000
+    assert libro.vista(PARCIAL) == dict(dict.fromkeys(CLAVES, 0), fichas_expendidas=5)
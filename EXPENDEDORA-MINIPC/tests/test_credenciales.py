@@ -0,0 +1,145 @@
+# test_credenciales.py - Login con caché local sin reescribir MySQL, y conexiones reutilizadas
+
+import threading
+
+import pytest
+
+from User_management import credenciales, database
+
+
+class EmpleadosFalsos:
+    # La tabla employees en memoria, en lugar de MySQL
+    def __init__(self, filas):
+        self.filas = dict(filas)
+        self.actualizados = []
+
+    def get_users(self):
+        return list(self.filas.items())
+
+    def get_hash(self, nombre):
+        return self.filas.get(nombre)
+
+    def update_hash(self, nombre, hash_contrasena):
+        self.actualizados.append(nombre)
+        self.filas[nombre] = hash_contrasena
+
+
+@pytest.fixture
+def empleados(tmp_path, monkeypatch):
+    monkeypatch.setattr(credenciales, "ITERACIONES", 1000)
+    monkeypatch.setattr(credenciales, "_cache", credenciales.CacheCredenciales(str(tmp_path / "cache.db")))
+    falsos = EmpleadosFalsos({"ana": credenciales.generar_hash("clave-ana", 1000), "beto": "clave-vieja"})
+    for nombre in ("get_users", "get_hash", "update_hash"):
+        monkeypatch.setattr(database, nombre, getattr(falsos, nombre))
+    return falsos
+
+
+def test_sincronizar_no_reescribe_mysql(empleados):
+    assert credenciales.sincronizar() == 2
+    assert empleados.actualizados == []
+    assert empleados.filas["beto"] == "clave-vieja"
+
+    en_cache = credenciales.obtener_cache().obtener("beto")
+    assert credenciales.es_hash(en_cache)  # La caché nunca guarda texto plano
+    assert credenciales.verificar_hash("clave-vieja", en_cache)
+
+
+def test_login_con_fila_en_texto_plano_no_la_migra(empleados):
+    assert credenciales.autenticar("beto", "clave-vieja")
+    assert not credenciales.autenticar("beto", "otra")
+    assert empleados.actualizados == []
+    assert credenciales.es_hash(credenciales.obtener_cache().obtener("beto"))
+
+
+def test_migrar_es_explicito(empleados):
+    assert credenciales.migrar_texto_plano() == ["beto"]
+    assert credenciales.es_hash(empleados.filas["beto"])
+    assert credenciales.autenticar("beto", "clave-vieja")
+    assert credenciales.migrar_texto_plano() == []
+
+
+class ConexionFalsa:
+    def __init__(self):
+        self.conectada = True
+        self.rollbacks = 0
+
+    def is_connected(self):
+        return self.conectada
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.conectada = False
+
+
+@pytest.fixture
+def conexiones(monkeypatch):
+    creadas = []
+    monkeypatch.setattr(database, "_libres", database.queue.LifoQueue(database.POOL_SIZE))
+
+    class Conector:
+        @staticmethod
+        def connect(**opciones):
+            assert opciones["connection_timeout"] == database.TIMEOUT_CONEXION
+            creadas.append(ConexionFalsa())
+            return creadas[-1]
+
+    monkeypatch.setattr(database, "_mysql", lambda: Conector)
+    return creadas
+
+
+def test_conexiones_se_reutilizan_hasta_pool_size(conexiones):
+    with database.conexion() as primera:
+        pass
+    with database.conexion() as segunda:
+        assert segunda is primera  # Reutilizada
+    assert primera.rollbacks == 2  # Cada uso termina su transacción
+
+    with database.conexion(), database.conexion(), database.conexion():
+        pass
+    assert len(conexiones) == 3
+    assert [conn.conectada for conn in conexiones].count(True) == database.POOL_SIZE
+
+
+def test_conexion_con_error_o_caida_no_vuelve_al_pool(conexiones):
+    with pytest.raises(RuntimeError):
+        with database.conexion():
+            raise RuntimeError("consulta fallida")
+    assert not conexiones[0].conectada
+
+    with database.conexion() as conn:
+        pass
+    conn.conectada = False  # El servidor la cerró mientras estaba libre
+    with database.conexion() as nueva:
+        assert nueva is not conn
+    assert len(conexiones) == 3
+
+
+def test_conectar_no_frena_a_quien_tiene_una_conexion_libre(conexiones, monkeypatch):
+    with database.conexion() as libre:
+        pass
+    conectando = threading.Event()
+    liberar = threading.Event()
+    conector = database._mysql()
+    conectar = conector.connect
+
+    def connect_lento(**opciones):
+        conectando.set()
+        liberar.wait(5)
+        return conectar(**opciones)
+
+    def consulta_lenta():
+        with database.conexion():
+            pass
+
+    monkeypatch.setattr(conector, "connect", staticmethod(connect_lento))
+    with database.conexion():  # Ocupa la única libre: el hilo tiene que conectar
+        hilo = threading.Thread(target=consulta_lenta)
+        hilo.start()
+        assert conectando.wait(5)
+    with database.conexion() as conn:  # Mientras el otro sigue conectando
+        assert conn is libre
+    liberar.set()
+    hilo.join(5)
+    assert len(conexiones) == 2
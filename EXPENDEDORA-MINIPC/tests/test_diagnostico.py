@@ -0,0 +1,78 @@
+# test_diagnostico.py - Buffer circular de la captura de diagnóstico y sus
+# volcados, en tiempo virtual
+
+import pytest
+
+from diagnostico import CapturaDiagnostico, leer
+from gpio_sim import GPIO, HopperSimulado, programar_pulso
+from hopper import Hopper
+from sensor_hopper import SensorHopper
+
+SALIDA, ENTHOPER, BARRERA = 24, 23, 34
+FRECUENCIA = 200
+
+
+@pytest.fixture
+def captura(tmp_path, capsys):
+    GPIO.reiniciar()
+    for pin in (ENTHOPER, BARRERA):
+        GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+    GPIO.setup(SALIDA, GPIO.OUT)
+    # 0.5 s de historia: 100 muestras
+    return CapturaDiagnostico(GPIO, ENTHOPER, BARRERA, SALIDA, reloj=GPIO.reloj, frecuencia=FRECUENCIA,
+                              segundos=0.5, posterior=0.1, carpeta=str(tmp_path))
+
+
+def capturar(captura, segundos):
+    captura.iniciar(0)
+    GPIO.reloj.avanzar(segundos)
+    captura.terminar(0)
+    GPIO.reloj.avanzar(1)  # Ventana posterior
+
+
+def test_buffer_sin_llenar(captura):
+    capturar(captura, 0.2)
+    tiempos, niveles = captura.muestras()
+    assert len(tiempos) == len(niveles) < captura.capacidad
+    assert tiempos == sorted(tiempos)
+
+
+def test_buffer_da_la_vuelta_y_guarda_lo_ultimo(captura):
+    programar_pulso(ENTHOPER, 2.3, 0.02)  # Dentro de los últimos 0.5 s
+    capturar(captura, 2.5)
+    tiempos, niveles = captura.muestras()
+
+    assert len(tiempos) == captura.capacidad == 100
+    paso = 1 / FRECUENCIA
+    assert all(b - a == pytest.approx(paso) for a, b in zip(tiempos, tiempos[1:]))  # Cronológico tras la vuelta
+    assert tiempos[-1] == pytest.approx(2.5 + captura.posterior, abs=paso)
+    assert tiempos[0] == pytest.approx(tiempos[-1] - (captura.capacidad - 1) * paso)
+    bajos = [t for t, n in zip(tiempos, niveles) if not n & 1]
+    assert len(bajos) == 4  # Pulso de 20 ms a 200 Hz
+    assert bajos[0] == pytest.approx(2.3, abs=paso)
+
+
+def test_volcado_tras_la_vuelta_se_lee_igual(captura):
+    capturar(captura, 1.3)
+    tiempos, niveles = captura.muestras()
+    ruta = captura.volcar()
+    captura.esperar_volcados()
+
+    encabezado, segundos, leidos = leer(ruta)
+    assert encabezado["motivo"] == "manual"
+    assert list(leidos) == niveles
+    assert segundos == pytest.approx([t - tiempos[0] for t in tiempos], abs=1e-6)
+
+
+def test_timeout_del_hopper_vuelca_la_captura(captura):
+    simulado = GPIO.conectar(HopperSimulado(SALIDA, ENTHOPER, atasco_en=3))
+    hopper = Hopper(GPIO, SALIDA, SensorHopper(GPIO, ENTHOPER, reloj=GPIO.reloj), reloj=GPIO.reloj,
+                    tiempo_espera_ficha=0.5, reintentos=0)
+    hopper.diagnostico = captura
+    hopper.dispensar(10)
+    GPIO.reloj.avanzar(1)
+    captura.esperar_volcados()
+
+    assert simulado.entregadas == 3
+    assert len(captura.volcados) == 1 and captura.volcados[0].endswith("_timeout.bin")
+    assert leer(captura.volcados[0])[0]["motivo"] == "timeout"
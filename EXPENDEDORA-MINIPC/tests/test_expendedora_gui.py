@@ -0,0 +1,52 @@
+# test_expendedora_gui.py - guardar_configuracion escribe config.json de forma atómica
+
+import json
+import types
+
+import pytest
+
+from expendedora_gui import ExpendedoraGUI
+
+PROMOCIONES = {"Promo 1": {"precio": 2000.0, "fichas": 5}}
+
+
+def gui(ruta, promociones=PROMOCIONES):
+    # Solo lo que usa guardar_configuracion (sin ventana de Tk)
+    return types.SimpleNamespace(config_file=str(ruta), promociones=promociones, valor_ficha=600.0,
+                                 persistencia={"intervalo_commit": 1.0})
+
+
+def test_conserva_secciones_y_fin_de_linea(tmp_path):
+    ruta = tmp_path / "config.json"
+    original = {"hopper": {"modo": "continuo"}, "contadores": {"fichas_restantes": 3}, "valor_ficha": 500.0}
+    ruta.write_bytes(json.dumps(original, indent=4).replace("\n", "\r\n").encode())
+
+    ExpendedoraGUI.guardar_configuracion(gui(ruta))
+
+    crudo = ruta.read_bytes()
+    assert b"\r\n" in crudo and b"\n" not in crudo.replace(b"\r\n", b"")
+    config = json.loads(crudo)
+    assert config["hopper"] == {"modo": "continuo"}
+    assert "contadores" not in config
+    assert config["valor_ficha"] == 600.0 and config["promociones"] == PROMOCIONES
+    assert [p.name for p in tmp_path.iterdir()] == ["config.json"]
+
+
+def test_archivo_nuevo_en_crlf_y_lf_se_mantiene(tmp_path):
+    ruta = tmp_path / "config.json"
+    ExpendedoraGUI.guardar_configuracion(gui(ruta))
+    assert b"\r\n" in ruta.read_bytes()
+
+    ruta.write_text(json.dumps({"hopper": {}}, indent=4))
+    ExpendedoraGUI.guardar_configuracion(gui(ruta))
+    assert b"\r" not in ruta.read_bytes()
+
+
+def test_una_falla_al_armar_el_json_no_pisa_el_archivo(tmp_path):
+    ruta = tmp_path / "config.json"
+    ruta.write_text(json.dumps({"valor_ficha": 500.0}, indent=4))
+    antes = ruta.read_bytes()
+
+    with pytest.raises(TypeError):
+        ExpendedoraGUI.guardar_configuracion(gui(ruta, promociones={"Promo 1": object()}))
+    assert ruta.read_bytes() == antes
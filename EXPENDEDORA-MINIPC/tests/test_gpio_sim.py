@@ -0,0 +1,58 @@
+# test_gpio_sim.py - Un día completo de ventas en tiempo virtual: 12 horas con
+# el hopper principal, un atasco y billetes entrando por ECOIN, en segundos reales
+
+import random
+import time
+
+from gpio_sim import GPIO, HopperSimulado, programar_tren_pulsos
+from hopper import Hopper
+from sensor_hopper import SensorHopper
+
+SALIDA, ENTHOPER, ECOIN = 24, 23, 35
+
+
+def test_dia_completo_en_segundos(capsys):
+    GPIO.reiniciar()
+    for pin in (ENTHOPER, ECOIN):
+        GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+    GPIO.setup(SALIDA, GPIO.OUT)
+
+    simulado = GPIO.conectar(HopperSimulado(SALIDA, ENTHOPER, fichas=100000, inercia=0.12))
+    billetes = []
+    GPIO.add_event_detect(ECOIN, GPIO.FALLING, callback=lambda pin: billetes.append(GPIO.reloj.ahora))
+    sensor = SensorHopper(GPIO, ENTHOPER, reloj=GPIO.reloj)
+    hopper = Hopper(GPIO, SALIDA, sensor, reloj=GPIO.reloj)
+
+    azar = random.Random(1)
+    inicio_real = time.perf_counter()
+    ventas = pulsos_billetero = pedidas = entregadas = por_sensor = faltantes = atascos = 0
+    while GPIO.reloj.ahora < 12 * 3600:
+        GPIO.reloj.avanzar(azar.expovariate(1 / 45))  # Un cliente cada ~45 s
+        tren = azar.choice([1, 2, 5, 10])
+        programar_tren_pulsos(ECOIN, tren)
+        pulsos_billetero += tren
+        if not atascos and GPIO.reloj.ahora > 6 * 3600:
+            simulado.atasco_en = simulado.entregadas + 3  # Atasco al mediodía
+        cantidad = azar.choice([5, 15, 35])
+        resultado = hopper.dispensar(cantidad)
+        if resultado["entregadas"] < cantidad:
+            atascos += 1
+            faltantes += cantidad - resultado["entregadas"]
+            simulado.desatascar()
+        ventas += 1
+        pedidas += cantidad
+        entregadas += resultado["entregadas"]
+        por_sensor += resultado["entregadas"] + resultado["exceso"]
+    segundos_reales = time.perf_counter() - inicio_real
+
+    assert GPIO.reloj.ahora >= 12 * 3600
+    assert segundos_reales < 5  # ~0.2 s en una PC; margen para máquinas lentas
+    assert ventas > 900
+
+    # Un solo atasco, y solo esa compra quedó corta
+    assert atascos == 1
+    assert entregadas == pedidas - faltantes
+    # Cada ficha física pasó por el sensor una vez, incluidas las de inercia
+    assert por_sensor == sensor.pulsos == simulado.entregadas
+    assert len(billetes) == pulsos_billetero
+    assert GPIO.input(SALIDA) == GPIO.LOW
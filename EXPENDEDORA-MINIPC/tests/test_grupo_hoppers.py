@@ -0,0 +1,73 @@
+# test_grupo_hoppers.py - Reparto de una entrega entre hoppers y paso al otro
+# hopper cuando uno se atasca, en tiempo virtual
+
+import pytest
+
+from gpio_sim import GPIO, HopperSimulado
+from hopper import GrupoHoppers, Hopper
+from sensor_hopper import SensorHopper
+
+PINES = [(24, 23), (0, 25)]  # (motor, sensor)
+
+
+@pytest.fixture
+def simulados(capsys):
+    GPIO.reiniciar()
+    simulados = []
+    for motor, sensor in PINES:
+        GPIO.setup(sensor, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        GPIO.setup(motor, GPIO.OUT)
+        simulados.append(GPIO.conectar(HopperSimulado(motor, sensor)))
+    return simulados
+
+
+@pytest.fixture
+def grupo(simulados):
+    hoppers = [Hopper(GPIO, motor, SensorHopper(GPIO, sensor, reloj=GPIO.reloj), nombre=f"hopper{i + 1}",
+                      reloj=GPIO.reloj, modo="continuo", tiempo_espera_ficha=1)
+               for i, (motor, sensor) in enumerate(PINES)]
+    return GrupoHoppers(hoppers, reloj=GPIO.reloj, rehabilitar_tras=600)
+
+
+def partes(resultado):
+    return [(p["hopper"], p["entregadas"], p["solicitadas"]) for p in resultado["partes"]]
+
+
+def test_reparte_entre_los_dos(grupo, simulados):
+    resultado = grupo.dispensar(35)
+    assert resultado["entregadas"] == 35
+    assert partes(resultado) == [("hopper1", 18, 18), ("hopper2", 17, 17)]
+    assert [s.entregadas for s in simulados] == [18, 17]
+
+
+def test_atasco_de_uno_se_completa_con_el_otro(grupo, simulados):
+    simulados[1].atasco_en = 6
+    resultado = grupo.dispensar(35)
+
+    assert resultado["entregadas"] == 35
+    assert partes(resultado) == [("hopper1", 18, 18), ("hopper2", 6, 17), ("hopper1", 11, 11)]
+    assert grupo.fuera_de_uso() == ["hopper2"]
+    assert [GPIO.input(motor) for motor, _ in PINES] == [GPIO.LOW, GPIO.LOW]
+
+    # Mientras está fuera de uso la entrega siguiente va toda al primero
+    resultado = grupo.dispensar(10)
+    assert partes(resultado) == [("hopper1", 10, 10)]
+
+
+def test_vuelve_al_grupo_tras_rehabilitar_tras(grupo, simulados):
+    simulados[1].atasco_en = 0
+    grupo.dispensar(10)
+    assert grupo.fuera_de_uso() == ["hopper2"]
+
+    simulados[1].desatascar()
+    GPIO.reloj.avanzar(grupo.rehabilitar_tras)
+    assert grupo.fuera_de_uso() == []
+    assert {p["hopper"] for p in grupo.dispensar(10)["partes"]} == {"hopper1", "hopper2"}
+
+
+def test_todos_atascados_entrega_lo_que_puede(grupo, simulados):
+    simulados[0].atasco_en = 2
+    simulados[1].atasco_en = 3
+    resultado = grupo.dispensar(20)
+    assert resultado["entregadas"] == 5
+    assert sorted(grupo.fuera_de_uso()) == ["hopper1", "hopper2"]
@@ -0,0 +1,70 @@
+# test_hopper.py - El motor del hopper queda apagado aunque la entrega falle
+
+import pytest
+
+from gpio_sim import GPIO, HopperSimulado
+from hopper import ESTADO_LISTO, GrupoHoppers, Hopper
+from sensor_hopper import SensorHopper
+
+PINES = [(24, 23), (0, 25)]  # (motor, sensor)
+
+
+class FallaEntrega(Exception):
+    pass
+
+
+def armar(cantidad_hoppers=1, **config):
+    GPIO.reiniciar()
+    hoppers = []
+    for i, (motor, sensor) in enumerate(PINES[:cantidad_hoppers]):
+        GPIO.setup(sensor, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        GPIO.setup(motor, GPIO.OUT)
+        GPIO.conectar(HopperSimulado(motor, sensor))
+        hoppers.append(Hopper(GPIO, motor, SensorHopper(GPIO, sensor, reloj=GPIO.reloj),
+                              nombre=f"hopper{i + 1}", reloj=GPIO.reloj, **config))
+    return hoppers
+
+
+def fallar_en(n):
+    entregadas = 0
+
+    def al_entregar():
+        nonlocal entregadas
+        entregadas += 1
+        if entregadas == n:
+            raise FallaEntrega(f"falla en la ficha {n}")
+    return al_entregar
+
+
+@pytest.mark.parametrize("modo", ["ficha", "continuo"])
+def test_motor_apagado_si_al_entregar_falla(modo, capsys):
+    hopper, = armar(modo=modo)
+    with pytest.raises(FallaEntrega):
+        hopper.dispensar(10, fallar_en(3))
+    assert GPIO.input(24) == GPIO.LOW
+    assert hopper.estado == ESTADO_LISTO
+
+    # El hopper sigue usable después de la falla
+    assert hopper.dispensar(2)["entregadas"] == 2
+    assert GPIO.input(24) == GPIO.LOW
+
+
+def test_motor_apagado_si_al_cambiar_estado_falla(capsys):
+    hopper, = armar(modo="continuo")
+
+    def al_cambiar_estado(hopper, anterior, estado):
+        if estado == "entregando":
+            raise FallaEntrega("falla al avisar el estado")
+
+    hopper.al_cambiar_estado = al_cambiar_estado
+    with pytest.raises(FallaEntrega):
+        hopper.dispensar(5)
+    assert GPIO.input(24) == GPIO.LOW
+
+
+def test_grupo_apaga_todos_los_motores_si_al_entregar_falla(capsys):
+    grupo = GrupoHoppers(armar(2, modo="continuo"), reloj=GPIO.reloj)
+    with pytest.raises(FallaEntrega):
+        grupo.dispensar(20, fallar_en(4))
+    assert [GPIO.input(motor) for motor, _ in PINES] == [GPIO.LOW, GPIO.LOW]
+    assert set(grupo.estados().values()) == {ESTADO_LISTO}
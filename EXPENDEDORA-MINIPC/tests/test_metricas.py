@@ -0,0 +1,34 @@
+# test_metricas.py - El histograma cuenta todo lo observado aunque lo pase a las cubetas tarde
+
+import threading
+
+from metricas import PENDIENTES_HISTOGRAMA, Histograma
+
+
+def test_exponer_cuenta_lo_observado():
+    histograma = Histograma("prueba_segundos", "Prueba", (0.1, 1.0))
+    for valor in (0.05, 0.5, 0.5, 3.0):
+        histograma.observar(valor)
+    assert histograma.exponer() == [
+        'prueba_segundos_bucket{le="0.1"} 1',
+        'prueba_segundos_bucket{le="1.0"} 3',
+        'prueba_segundos_bucket{le="+Inf"} 4',
+        "prueba_segundos_sum 4.05",
+        "prueba_segundos_count 4",
+    ]
+
+
+def test_varios_hilos_no_pierden_observaciones():
+    histograma = Histograma("prueba_segundos", "Prueba", (0.1,))
+    por_hilo = PENDIENTES_HISTOGRAMA * 7 + 3
+
+    def observar():
+        for _ in range(por_hilo):
+            histograma.observar(0.01)
+
+    hilos = [threading.Thread(target=observar) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert histograma.exponer()[-1] == f"prueba_segundos_count {4 * por_hilo}"
@@ -0,0 +1,95 @@
+# test_precios.py - Propiedades de la tabla de precios compilada
+
+import random
+
+import pytest
+
+import precios
+
+
+def convertir_anterior(credito, tarifas):
+    # convertir_fichas original, llamada hasta que no entre ningún escalón
+    (valor1, fichas1), (valor2, fichas2), (valor3, fichas3) = tarifas
+    total = 0
+    while credito >= valor1:
+        if credito < valor2:
+            total, credito = total + fichas1, credito - valor1
+        elif credito < valor3:
+            total, credito = total + fichas2, credito - valor2
+        else:
+            total, credito = total + fichas3, credito - valor3
+    return total, credito
+
+
+def tarifas_al_azar(azar):
+    while True:
+        tarifas = sorted((azar.randint(1, 200) * 50, azar.randint(1, 40)) for _ in range(3))
+        if len({valor for valor, _ in tarifas}) == 3:
+            return tarifas
+
+
+def promociones_al_azar(azar):
+    return {f"Promo {i}": {"precio": azar.randint(0, 300) * 50, "fichas": azar.randint(0, 60)}
+            for i in range(1, 4)}
+
+
+@pytest.mark.parametrize("semilla", range(20))
+def test_solo_escalones_reproduce_conversion_anterior(semilla):
+    azar = random.Random(semilla)
+    tarifas = tarifas_al_azar(azar)
+    tabla = precios.compilar(tarifas)
+    for _ in range(200):
+        credito = azar.randint(0, 100000)
+        assert tabla.convertir(credito) == convertir_anterior(credito, tarifas)
+
+
+@pytest.mark.parametrize("politica", precios.POLITICAS)
+@pytest.mark.parametrize("semilla", range(20))
+def test_no_se_pierde_ni_se_inventa_credito(politica, semilla):
+    azar = random.Random(semilla)
+    tabla = precios.compilar(tarifas_al_azar(azar), promociones_al_azar(azar),
+                             azar.choice([0, 600]), politica)
+    precio_de = {nombre: precio for nombre, precio, _ in tabla.escalones}
+    for _ in range(200):
+        credito = azar.randint(0, 100000)
+        fichas, resto = tabla.convertir(credito)
+        usados, resto_desglose = tabla.desglose(credito)
+        assert resto == resto_desglose and resto >= 0
+        assert sum(precio_de[nombre] * veces for nombre, veces, _ in usados) + resto == credito
+        assert fichas == sum(f for _, _, f in usados)
+        # El sobrante no alcanza para ningún escalón
+        assert all(resto < precio for _, precio, _ in tabla.escalones)
+
+
+def test_credito_menor_al_primer_escalon_queda_guardado():
+    tabla = precios.compilar([(1000, 1), (5000, 2), (10000, 5)])
+    assert tabla.convertir(600) == (0, 600)
+    assert tabla.convertir(1600) == (1, 600)
+
+
+def test_promos_y_ficha_suelta_solo_si_se_piden():
+    tarifas = [(1000, 1), (5000, 2), (10000, 5)]
+    promociones = {"Promo 3": {"precio": 10000, "fichas": 35}}
+    con_promos = precios.compilar(tarifas, promociones, 600)
+    assert con_promos.convertir(10600) == (36, 0)
+    assert precios.compilar(tarifas).convertir(10600) == (5, 600)
+
+
+def test_ignora_escalones_sin_configurar():
+    tabla = precios.compilar([(1000, 1)], {"Promo 1": {"precio": 0, "fichas": 5},
+                                           "Promo 2": {"precio": 2000, "fichas": 0}})
+    assert [nombre for nombre, _, _ in tabla.escalones] == ["Escalón 1"]
+
+
+def test_mejor_valor_prefiere_mas_fichas_por_peso():
+    tarifas = [(1000, 1), (5000, 2), (10000, 5)]
+    promociones = {"Promo 2": {"precio": 4000, "fichas": 15}}
+    escalones = precios.compilar(tarifas, promociones, politica=precios.POLITICA_ESCALONES)
+    mejor = precios.compilar(tarifas, promociones, politica=precios.POLITICA_MEJOR_VALOR)
+    assert escalones.convertir(10000) == (5, 0)
+    assert mejor.convertir(10000) == (32, 0)
+
+
+def test_politica_desconocida():
+    with pytest.raises(ValueError):
+        precios.compilar([(1000, 1)], politica="barata")
@@ -0,0 +1,54 @@
+# test_sensor_hopper.py - Esperar una ficha no consume CPU: el hilo duerme en
+# la condición hasta el flanco o el tiempo límite
+
+import threading
+import time
+
+import pytest
+
+from gpio_sim import GPIO
+from sensor_hopper import SensorHopper
+
+ENTHOPER = 23
+
+
+class CondicionContada(threading.Condition):
+    # Cuenta cuántas veces se despierta el hilo que espera
+    def __init__(self):
+        super().__init__()
+        self.esperas = 0
+
+    def wait(self, timeout=None):
+        self.esperas += 1
+        return super().wait(timeout)
+
+
+@pytest.fixture
+def sensor():
+    # Reloj real: se mide la espera de verdad, no el reloj virtual
+    GPIO.reiniciar()
+    GPIO.setup(ENTHOPER, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+    sensor = SensorHopper(GPIO, ENTHOPER)
+    sensor._cond = CondicionContada()
+    yield sensor
+    sensor.detener()
+
+
+def test_espera_sin_pulso_casi_no_usa_cpu(sensor):
+    cpu_inicio, inicio = time.process_time(), time.monotonic()
+    assert sensor.esperar_pulso(sensor.pulsos, timeout=0.5) is None
+    transcurrido = time.monotonic() - inicio
+    cpu = time.process_time() - cpu_inicio
+
+    assert 0.5 <= transcurrido < 1.0
+    assert cpu < 0.02  # Un bucle de sondeo usaría ~0.5 s de CPU
+    assert sensor._cond.esperas <= 2  # Un solo sueño hasta el límite, sin sondeo
+
+
+def test_flanco_despierta_a_quien_espera(sensor):
+    threading.Timer(0.1, GPIO.simular_entrada, (ENTHOPER, GPIO.LOW)).start()
+    cpu_inicio, inicio = time.process_time(), time.monotonic()
+    assert sensor.esperar_pulso(0, timeout=2.0) == 1
+    assert time.monotonic() - inicio < 0.3  # Despierta con el flanco, no al vencer el límite
+    assert time.process_time() - cpu_inicio < 0.02
+    assert sensor._cond.esperas <= 2
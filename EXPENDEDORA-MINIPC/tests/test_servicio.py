@@ -0,0 +1,102 @@
+# test_servicio.py - Comandos del servicio con un core mínimo y un hopper simulado
+
+import types
+
+import pytest
+
+from gpio_sim import GPIO, HopperSimulado
+from hopper import Hopper
+from sensor_hopper import SensorHopper
+from servicio import ServicioExpendedora
+
+SALIDA, ENTHOPER = 24, 23
+
+
+class BilleteroQuieto:
+    al_billete = None
+
+    def iniciar(self):
+        pass
+
+    def detener(self):
+        pass
+
+
+@pytest.fixture
+def servicio(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)  # Bitácora y snapshot con sus rutas por defecto
+    GPIO.reiniciar()
+    GPIO.setup(ENTHOPER, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+    GPIO.setup(SALIDA, GPIO.OUT)
+    GPIO.conectar(HopperSimulado(SALIDA, ENTHOPER))
+    config = {"persistencia": {"intervalo_commit": 0}, "segmento": {"ruta": ""}, "metricas": {"puerto": 0}}
+    core = types.SimpleNamespace(
+        GPIO=GPIO,
+        DB_FILE=str(tmp_path / "expendedora.db"),
+        hopper=Hopper(GPIO, SALIDA, SensorHopper(GPIO, ENTHOPER, reloj=GPIO.reloj), reloj=GPIO.reloj),
+        billetero=BilleteroQuieto(),
+        cargar_configuracion=lambda: config,
+        acreditar_billete=lambda monto: monto // 1000,
+        descontar_ficha=lambda: None,
+        cerrar_registro=lambda: None)
+    servicio = ServicioExpendedora(core, ruta_socket=str(tmp_path / "expendedora.sock"))
+    yield servicio
+    servicio.detener()
+
+
+def ficha_manual(servicio):
+    return servicio.atender({"cmd": "evento", "tipo": "ficha",
+                             "deltas": {"fichas_restantes": -1, "fichas_expendidas": 1}})
+
+
+def test_ficha_manual_solo_con_fichas_cobradas(servicio):
+    assert not ficha_manual(servicio)["ok"]
+
+    servicio.atender({"cmd": "evento", "tipo": "venta", "deltas": {"fichas_restantes": 2}})
+    assert ficha_manual(servicio)["ok"]
+    assert ficha_manual(servicio)["ok"]
+    respuesta = ficha_manual(servicio)
+    assert not respuesta["ok"] and "0 ficha(s)" in respuesta["error"]
+    assert servicio.libro.valor("fichas_restantes") == 0
+    assert servicio.libro.valor("fichas_expendidas") == 2
+
+
+def test_ficha_manual_no_toma_fichas_en_camino(servicio):
+    # Una compra encolada ya tiene sus fichas reservadas para el despachador
+    servicio.atender({"cmd": "comprar", "tipo": "promo", "fichas": 3,
+                      "deltas": {"fichas_restantes": 3, "promo1_contador": 1}})
+    assert not ficha_manual(servicio)["ok"]
+    assert not servicio.atender({"cmd": "dispensar", "cantidad": 1})["ok"]
+
+    servicio.despachador.iniciar()
+    servicio.despachador.esperar()
+    assert not ficha_manual(servicio)["ok"]
+    assert servicio.libro.valor("fichas_restantes") == 0
+    assert servicio.libro.valor("fichas_expendidas") == 3
+
+
+def test_auditoria_compara_lo_enviado_con_el_periodo(servicio, monkeypatch):
+    pytest.importorskip("numpy")  # auditoria.py lo necesita
+    import auditoria
+    import servicio as modulo_servicio
+
+    enviados = []
+    monkeypatch.setattr(modulo_servicio.telemetria, "enviar", lambda *args: enviados.append(args))
+    servicio.atender({"cmd": "evento", "tipo": "venta",
+                      "deltas": {"dinero_ingresado": 3000, "promo1_contador": 1}})
+    cerrado = servicio.atender({"cmd": "cierre", "tipo": "cierre_parcial"})["cerrado"]
+    assert servicio.atender({"cmd": "enviar", "url": "http://servidor/subcierre", "informa": "cierre_parcial",
+                             "datos": {"partial_dinero": cerrado["dinero_ingresado"], "partial_p1": 1}})["ok"]
+    servicio.atender({"cmd": "evento", "tipo": "venta", "deltas": {"dinero_ingresado": 1000}})
+    servicio.atender({"cmd": "cierre", "tipo": "cierre"})
+    # Un envío armado con una copia atrasada del libro
+    servicio.atender({"cmd": "enviar", "url": "http://servidor/cierre", "informa": "cierre",
+                      "datos": {"dinero": 1000, "p1": 1}})
+    assert len(enviados) == 2
+    assert not servicio.atender({"cmd": "enviar", "url": "x", "datos": {}, "informa": "otro"})["ok"]
+
+    servicio.historial.volcar()
+    resultado = auditoria.auditar(auditoria.cargar(servicio.core.DB_FILE))
+    assert resultado["cierres_revisados"] == 2
+    assert [(d["tipo"], d["clave"], d["reportado"], d["recalculado"]) for d in resultado["diferencias"]] == \
+        [("cierre", "dinero_ingresado", 1000, 4000.0)]
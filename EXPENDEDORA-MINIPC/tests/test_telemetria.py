@@ -0,0 +1,87 @@
+# test_telemetria.py - El hilo de la cola sobrevive a errores de SQLite
+
+import sqlite3
+import time
+import types
+
+import pytest
+
+from telemetria import ColaTelemetria
+
+
+class SesionFalsa:
+    # Responde 503 hasta que se la habilita; anota cada envío
+    def __init__(self):
+        self.acepta = False
+        self.enviados = []
+
+    def post(self, url, json=None, timeout=None):
+        self.enviados.append(json)
+        return types.SimpleNamespace(status_code=200 if self.acepta else 503)
+
+
+def esperar(condicion, limite=5.0):
+    fin = time.monotonic() + limite
+    while not condicion():
+        assert time.monotonic() < fin, "la condición no se cumplió a tiempo"
+        time.sleep(0.005)
+
+
+def filas(db_file):
+    conn = sqlite3.connect(db_file)
+    try:
+        return conn.execute("SELECT datos FROM telemetria_pendiente").fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def cola(tmp_path, capsys):
+    cola = ColaTelemetria(str(tmp_path / "expendedora.db"), backoff_inicial=0.01, backoff_maximo=0.02)
+    cola.sesion = SesionFalsa()
+    cola.iniciar()
+    esperar(lambda: cola._hilo.is_alive())
+    yield cola
+    cola.detener()
+
+
+def test_error_al_guardar_no_pierde_el_envio_ni_el_hilo(cola):
+    conn = sqlite3.connect(cola.db_file, timeout=5)
+    esperar(lambda: conn.execute("SELECT name FROM sqlite_master WHERE name='telemetria_pendiente'").fetchone())
+    # Disco lleno: cualquier INSERT falla
+    conn.execute("CREATE TRIGGER lleno BEFORE INSERT ON telemetria_pendiente "
+                 "BEGIN SELECT RAISE(ABORT, 'disco lleno'); END")
+    conn.commit()
+
+    cola.encolar("http://servidor/cierre", {"fichas": 7})
+    esperar(lambda: len(cola.sesion.enviados) >= 2)  # Se manda desde memoria y se reintenta
+    assert cola._hilo.is_alive()
+    assert filas(cola.db_file) == []
+
+    # Se libera espacio: el próximo reintento fallido lo deja guardado
+    conn.execute("DROP TRIGGER lleno")
+    conn.commit()
+    conn.close()
+    esperar(lambda: filas(cola.db_file) == [('{"fichas": 7}',)])
+
+    cola.sesion.acepta = True
+    esperar(lambda: not cola.pendientes)
+    esperar(lambda: filas(cola.db_file) == [])
+    assert cola._hilo.is_alive()
+    assert cola.sesion.enviados[-1] == {"fichas": 7}
+
+
+def test_sigue_atendiendo_envios_despues_del_error(cola):
+    cola.sesion.acepta = True
+    conn = sqlite3.connect(cola.db_file, timeout=5)
+    esperar(lambda: conn.execute("SELECT name FROM sqlite_master WHERE name='telemetria_pendiente'").fetchone())
+    conn.execute("CREATE TRIGGER lleno BEFORE INSERT ON telemetria_pendiente "
+                 "BEGIN SELECT RAISE(ABORT, 'disco lleno'); END")
+    conn.commit()
+    conn.close()
+
+    for n in range(3):
+        cola.encolar("http://servidor/datos", {"n": n})
+    esperar(lambda: len(cola.sesion.enviados) == 3)
+    assert cola.sesion.enviados == [{"n": 0}, {"n": 1}, {"n": 2}]
+    assert cola._hilo.is_alive() and not cola.pendientes
@@ -0,0 +1,38 @@
+# test_trazas.py - Muestreo de trazas por compra
+
+from trazas import SIN_MUESTRA, Trazador
+
+
+def test_solo_se_trazan_las_compras_muestreadas():
+    trazador = Trazador(muestreo=4)
+    trazas = []
+    for _ in range(8):
+        trazas.append(trazador.nueva_traza())
+        trazador.registrar("conversion", 0.0, 0.0)
+        with trazador.tramo("persistencia"):
+            pass
+    muestreadas = [traza for traza in trazas if traza != SIN_MUESTRA]
+    assert len(muestreadas) == 2
+
+    tramos = trazador.volcar()
+    assert len(tramos) == 4
+    assert {tramo["traza"] for tramo in tramos} == set(muestreadas)
+
+
+def test_otro_hilo_hereda_la_decision_del_muestreo():
+    trazador = Trazador(muestreo=2)
+    traza = trazador.nueva_traza()  # La primera queda afuera
+    assert traza == SIN_MUESTRA and not trazador.registrando()
+
+    trazador.usar(None)  # El despachador, con la traza que viaja en la compra
+    trazador.registrar("ficha", 0.0, 0.0, traza)
+    assert trazador.volcar() == []
+
+
+def test_tramos_fuera_de_una_compra_se_registran_siempre():
+    trazador = Trazador(muestreo=1000)
+    trazador.registrar("telemetria", 0.0, 0.0)
+    with trazador.tramo("persistencia", tipo="cierre"):
+        pass
+    assert [(tramo["traza"], tramo["nombre"]) for tramo in trazador.volcar()] == \
+        [(None, "telemetria"), (None, "persistencia")]
@@ -0,0 +1,212 @@
+# trazas.py - Trazas de cada compra y perfilador por muestreo
+#
+# Cada compra recibe un id de traza y cada etapa deja un tramo (nombre,
+# inicio, duración, datos): detección del billete, conversión, espera en la
+# cola, cada ficha entregada, persistencia y encolado de telemetría. Los
+# tramos van a un buffer circular en memoria (los más viejos se pisan) y se
+# vuelcan a pedido por IPC o con SIGUSR2.
+#
+# La traza activa se guarda por hilo: quien arranca una compra llama a
+# nueva_traza() y los tramos registrados después en ese hilo la heredan.
+# Para pasar a otro hilo (el despachador) el id viaja en la compra y el
+# otro hilo llama a usar(traza).
+#
+# Con `muestreo` = N solo se traza una de cada N compras: las demás reciben
+# la traza SIN_MUESTRA y sus tramos se descartan antes de medir nada, así
+# la conversión y cada ficha no pagan el tramo en casi ninguna compra. Los
+# tramos fuera de una compra (cierres, telemetría) se registran siempre.
+#
+# El perfilador muestrea las pilas de todos los hilos cada `intervalo`
+# segundos y guarda las pilas agrupadas en formato "folded" (flamegraph.pl,
+# speedscope). Se prende y apaga con SIGUSR1 o por IPC.
+
+import collections
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+
+class PerfiladorMuestreo:
+    def __init__(self, intervalo=0.005):
+        self.intervalo = intervalo
+        self.muestras = collections.Counter()
+        self._detener = threading.Event()
+        self._hilo = None
+
+    @property
+    def activo(self):
+        return self._hilo is not None
+
+    def iniciar(self):
+        if self._hilo is None:
+            self.muestras.clear()
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._bucle, daemon=True)
+            self._hilo.start()
+
+    def detener(self):
+        if self._hilo:
+            self._detener.set()
+            self._hilo.join()
+            self._hilo = None
+        return self.muestras
+
+    def _bucle(self):
+        propio = threading.get_ident()
+        while not self._detener.wait(self.intervalo):
+            for hilo, frame in sys._current_frames().items():
+                if hilo == propio:
+                    continue
+                pila = []
+                while frame is not None:
+                    codigo = frame.f_code
+                    pila.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}")
+                    frame = frame.f_back
+                self.muestras[";".join(reversed(pila))] += 1
+
+    def guardar(self, ruta):
+        with open(ruta, 'w') as f:
+            for pila, cantidad in self.muestras.most_common():
+                f.write(f"{pila} {cantidad}\n")
+        return ruta
+
+
+class _Tramo:
+    # Context manager de Trazador.tramo(); una clase y no @contextmanager
+    # porque el generador cuesta varias veces más por tramo
+    __slots__ = ("trazador", "nombre", "traza", "datos", "comienzo")
+
+    def __init__(self, trazador, nombre, traza, datos):
+        self.trazador = trazador
+        self.nombre = nombre
+        self.traza = traza
+        self.datos = datos
+
+    def __enter__(self):
+        self.comienzo = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duracion = time.perf_counter() - self.comienzo
+        self.trazador.registrar(self.nombre, time.time() - duracion, duracion, self.traza, **self.datos)
+        return False
+
+
+class _TramoInactivo:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_INACTIVO = _TramoInactivo()
+SIN_MUESTRA = ""  # Traza de una compra que el muestreo dejó afuera
+
+
+class Trazador:
+    def __init__(self, capacidad=4096, activo=True, muestreo=1):
+        self.activo = activo
+        self.muestreo = muestreo  # Se traza una de cada `muestreo` compras
+        self._tramos = collections.deque(maxlen=capacidad)
+        self._ids = itertools.count(1)
+        self._prefijo = f"{os.getpid():x}"
+        self._local = threading.local()
+        self.perfilador = PerfiladorMuestreo()
+
+    def configurar(self, capacidad=None, activo=None, muestreo=None):
+        if capacidad and capacidad != self._tramos.maxlen:
+            self._tramos = collections.deque(self._tramos, maxlen=capacidad)
+        if activo is not None:
+            self.activo = activo
+        if muestreo:
+            self.muestreo = muestreo
+
+    # --- TRAZAS ---
+    def nueva_traza(self):
+        numero = next(self._ids)
+        traza = f"{self._prefijo}-{numero}" if numero % self.muestreo == 0 else SIN_MUESTRA
+        self._local.traza = traza
+        return traza
+
+    def actual(self):
+        return getattr(self._local, "traza", None)
+
+    def usar(self, traza):
+        self._local.traza = traza
+
+    def registrando(self, traza=None):
+        # False si el tramo se descartaría: conviene preguntar antes de medirlo
+        return self.activo and (self.actual() if traza is None else traza) != SIN_MUESTRA
+
+    def registrar(self, nombre, inicio, duracion, traza=None, **datos):
+        # Tramo ya medido; inicio en time.time() y duración en segundos
+        if self.activo:
+            if traza is None:
+                traza = self.actual()
+            if traza != SIN_MUESTRA:
+                self._tramos.append((traza, nombre, inicio, duracion, datos))
+
+    def tramo(self, nombre, traza=None, **datos):
+        # with trazador.tramo("nombre", dato=...): mide el bloque
+        return _Tramo(self, nombre, traza, datos) if self.registrando(traza) else _INACTIVO
+
+    def volcar(self, traza=None, ultimos=None):
+        # Copia del buffer (deque.copy no suelta el GIL: no se mezcla con append)
+        tramos = self._tramos.copy()
+        if traza:
+            tramos = [t for t in tramos if t[0] == traza]
+        tramos = list(tramos)[-ultimos:] if ultimos else list(tramos)
+        return [{"traza": t, "nombre": nombre, "inicio": round(inicio, 6),
+                 "ms": round(duracion * 1000, 3), "datos": datos}
+                for t, nombre, inicio, duracion, datos in tramos]
+
+    def volcar_archivo(self, ruta=None):
+        ruta = ruta or time.strftime("trazas_%Y%m%d_%H%M%S.jsonl")
+        with open(ruta, 'w') as f:
+            for tramo in self.volcar():
+                f.write(json.dumps(tramo) + "\n")
+        return ruta
+
+    # --- PERFILADOR ---
+    def alternar_perfil(self, activar=None, ruta=None):
+        # Prende o apaga el perfilador; al apagarlo guarda las pilas y devuelve la ruta
+        if activar is None:
+            activar = not self.perfilador.activo
+        if activar:
+            self.perfilador.iniciar()
+            return None
+        if not self.perfilador.activo:
+            return None
+        self.perfilador.detener()
+        return self.perfilador.guardar(ruta or time.strftime("perfil_%Y%m%d_%H%M%S.folded"))
+
+
+# --- TRAZADOR COMPARTIDO ---
+_trazador = Trazador()
+
+
+def obtener_trazador():
+    return _trazador
+
+
+if __name__ == "__main__":
+    # Costo de un tramo, que se paga varias veces por compra
+    trazador = obtener_trazador()
+    trazador.nueva_traza()
+    n = 200000
+    inicio = time.perf_counter()
+    for _ in range(n):
+        with trazador.tramo("prueba"):
+            pass
+    print(f"tramo(): {(time.perf_counter() - inicio) / n * 1e6:.2f} µs")
+    inicio = time.perf_counter()
+    for _ in range(n):
+        trazador.registrar("prueba", 0.0, 0.0)
+    print(f"registrar(): {(time.perf_counter() - inicio) / n * 1e6:.2f} µs")
+    print(trazador.volcar(ultimos=2))